@@ -0,0 +1,163 @@
+"""Precomputed answers for the most frequent questions.
+
+The response cache starts empty after every deploy (the prompt version
+changes) and only helps from the second identical question on. The answer
+store is built offline by cache_warming.py from the query logs: the most
+frequent/costly question clusters are answered ahead of time against the
+current prompt and KB and saved to a compact JSON file.
+
+The serving path loads it at startup and checks it right after the fact
+index: a question whose signature (its normalized, stemmed content words,
+order-insensitive) is exactly the signature of a precomputed question is
+answered instantly. Near-duplicates are never served each other's answers:
+"límite ... tarjeta de débito" and "... de crédito" overlap almost
+entirely but need different answers, so each signature is answered on its
+own (see cache_warming).
+The store records the prompt version it was built for and is ignored when
+the prompt or the KB changed since.
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from text_normalization import tokenize
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_ANSWERS_PATH = PROJECT_ROOT / ".cache" / "answers.json"
+# 2: una respuesta por firma exacta (el formato 1 servía las firmas de todo el cluster)
+STORE_FORMAT = 2
+
+
+def query_signature(text: str) -> str:
+    """Order-insensitive key of a question's content words.
+
+    Examples:
+        >>> query_signature("¿Cuál es la comisión de Cuenta Corriente?")
+        'comision corriente cuenta'
+        >>> query_signature("cuenta corriente: comisiones")
+        'comision corriente cuenta'
+    """
+    return " ".join(sorted(set(tokenize(text))))
+
+
+@dataclass
+class PrecomputedAnswer:
+    """An answer served to every phrasing with the same signature as `query`.
+
+    Attributes:
+        query: Question the answer was computed for (its most frequent phrasing).
+        respuesta: Answer in the assistant's format.
+        count: Times a question with this signature was asked in the mined logs.
+        total_cost_usd: Cost those questions incurred in the mined logs.
+    """
+
+    query: str
+    respuesta: dict
+    count: int = 0
+    total_cost_usd: float = 0.0
+
+
+@dataclass
+class AnswerStoreStats:
+    hits: int = 0
+    misses: int = 0
+
+
+class AnswerStore:
+    """Versioned lookup table of precomputed answers.
+
+    Args:
+        version: Prompt version the answers were computed for.
+        answers: Precomputed answers.
+        model: Model that produced them.
+        created_at: ISO timestamp of the build.
+
+    Examples:
+        >>> store = AnswerStore.load(version=prompt_version())
+        >>> store.get("comision de cuenta corriente?")
+        {'respuesta': '...', 'indicador_de_confianza': 0.9, 'acciones_recomendadas': [...]}
+    """
+
+    def __init__(self, version: str, answers: list[PrecomputedAnswer], model: str | None = None,
+                 created_at: str | None = None):
+        self.version = version
+        self.answers = answers
+        self.model = model
+        self.created_at = created_at or datetime.now().isoformat()
+        self.enabled = True
+        self.stats = AnswerStoreStats()
+        self._lock = threading.Lock()
+        self._by_signature: dict[str, dict] = {}
+        for answer in answers:
+            # Solo la firma exacta de la pregunta respondida: las parecidas pueden ser de otro producto
+            self._by_signature.setdefault(query_signature(answer.query), answer.respuesta)
+
+    def __len__(self) -> int:
+        return len(self._by_signature) if self.enabled else 0
+
+    def get(self, user_prompt: str) -> dict | None:
+        """Returns the precomputed answer for a question, or None."""
+        if not self.enabled:
+            return None
+        answer = self._by_signature.get(query_signature(user_prompt))
+        with self._lock:
+            if answer is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        return answer
+
+    def set_version(self, version: str) -> None:
+        """Disables the store when the prompt/KB no longer matches its version."""
+        self.enabled = version == self.version
+        if not self.enabled:
+            logger.info("Precomputed answers are for prompt version %s, now %s: disabled", self.version, version)
+
+    def save(self, path: Path = DEFAULT_ANSWERS_PATH) -> None:
+        """Writes the store atomically (a temporary file renamed into place)."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "format": STORE_FORMAT,
+            "version": self.version,
+            "model": self.model,
+            "created_at": self.created_at,
+            "answers": [
+                {"query": a.query, "respuesta": a.respuesta, "count": a.count, "total_cost_usd": round(a.total_cost_usd, 6)}
+                for a in self.answers
+            ],
+        }
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path = DEFAULT_ANSWERS_PATH, version: str | None = None) -> "AnswerStore | None":
+        """Loads a store, or returns None if the file is missing, unreadable or stale.
+
+        Args:
+            path: Store file written by save().
+            version: Current prompt version; a store built for another one is skipped.
+        """
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("format") != STORE_FORMAT:
+                raise ValueError(f"unsupported format {data.get('format')}")
+            answers = [PrecomputedAnswer(**a) for a in data["answers"]]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Ignoring precomputed answers in %s: %s", path, e)
+            return None
+        if version is not None and data["version"] != version:
+            logger.info("Precomputed answers in %s are for prompt version %s (current %s): skipped, "
+                        "run cache_warming.py again", path, data["version"], version)
+            return None
+        store = cls(data["version"], answers, data.get("model"), data.get("created_at"))
+        logger.info("Loaded %d precomputed answers (%d variants) from %s", len(answers), len(store), path)
+        return store
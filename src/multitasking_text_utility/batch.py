@@ -0,0 +1,364 @@
+"""Asynchronous batch mode for replaying many queries concurrently.
+
+run_query.py answers one query per process and blocks on each 15-25 s call,
+so replaying hundreds of agent queries serially takes hours. This module
+reads a JSONL or CSV file of queries and sends them through an AsyncOpenAI
+client with:
+
+- bounded concurrency (asyncio.Semaphore)
+- a per-request timeout
+- jittered exponential backoff on rate limits (429), 5xx and timeouts,
+  honoring the Retry-After header when the API sends one
+- optional client-side RPM/TPM limits shared with other traffic, at bulk
+  priority (see rate_limiter)
+- single-flight coalescing: duplicated queries in the file that are in
+  flight at the same time share one call (see coalescing)
+- optional live latency/cost histograms on a local Prometheus endpoint
+  (--metrics-port, see live_metrics)
+
+Results are streamed to a JSONL file as they complete, one line per query
+with the same shape main() writes (metrics, consulta, respuesta) plus the
+query id, so a long replay can be inspected while it is still running.
+
+Usage:
+    python src/multitasking_text_utility/batch.py queries.jsonl -o results.jsonl --concurrency 8
+    python src/multitasking_text_utility/batch.py --samples   # las 4 consultas de ejemplo
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Iterable
+
+from bank_kb import BANK_KB
+from budgets import estimate_request_tokens
+from cache import cache_key
+from coalescing import SingleFlight
+from live_metrics import get_live_metrics, serve_metrics
+from logger import get_logger
+from metrics import Metrics
+from rate_limiter import DEFAULT_COMPLETION_ESTIMATE_TOKENS, Priority, RateLimitScheduler
+from resilience import backoff_delay, is_retryable
+from retrieval import load_or_build_index
+from run_query import (
+    APPLICATION_NAME,
+    METRICS_LOG_FOLDER,
+    SAMPLE_QUERIES,
+    OpenAIModels,
+    build_coalesced_metrics,
+    build_messages,
+    build_metrics,
+    build_system_prompt,
+    parse_completion,
+)
+
+logger = get_logger()
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT_SECONDS = 60.0
+DEFAULT_MAX_RETRIES = 4
+
+
+@dataclass
+class BatchQuery:
+    """A query to replay.
+
+    Attributes:
+        id: Identifier used to correlate results with inputs.
+        consulta: Query text sent to the assistant.
+    """
+
+    id: str
+    consulta: str
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a single batch query.
+
+    Attributes:
+        id: Identifier of the originating BatchQuery.
+        consulta: Query text.
+        respuesta: Parsed assistant answer, or None on failure.
+        metrics: Metrics of the successful attempt, or None on failure.
+        attempts: Number of API calls made (retries included).
+        error: Error message when every attempt failed.
+    """
+
+    id: str
+    consulta: str
+    respuesta: dict | None = None
+    metrics: Metrics | None = None
+    attempts: int = 0
+    error: str | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "metrics": asdict(self.metrics) if self.metrics else None,
+            "consulta": self.consulta,
+            "respuesta": self.respuesta,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+
+class BatchQueryError(Exception):
+    """Raised when a batch query fails after all its attempts.
+
+    Attributes:
+        attempts: Number of API calls made before giving up.
+    """
+
+    def __init__(self, message: str, attempts: int):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+def load_queries(path: Path) -> list[BatchQuery]:
+    """Reads queries from a JSONL or CSV file.
+
+    JSONL lines must have a "consulta" (or "query") field. CSV files must have
+    a "consulta" (or "query") column. An optional "id" field/column is used as
+    the query id; otherwise the 1-based line number is used.
+
+    Args:
+        path: Path to a .jsonl or .csv file.
+
+    Returns:
+        List of BatchQuery in file order.
+
+    Raises:
+        ValueError: If the file extension is unsupported or a row has no query.
+    """
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    elif path.suffix.lower() in (".jsonl", ".ndjson"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        raise ValueError(f"Unsupported query file format: {path.suffix} (use .jsonl or .csv)")
+
+    queries = []
+    for i, row in enumerate(rows, start=1):
+        text = row.get("consulta") or row.get("query")
+        if not text:
+            raise ValueError(f"Row {i} of {path} has no 'consulta' or 'query' field")
+        queries.append(BatchQuery(id=str(row.get("id") or i), consulta=text))
+    return queries
+
+
+async def get_completion_async(system_prompt: str, user_prompt: str, model: OpenAIModels, client,
+                               timeout: float = DEFAULT_TIMEOUT_SECONDS,
+                               max_retries: int = DEFAULT_MAX_RETRIES,
+                               context: str | None = APPLICATION_NAME,
+                               scheduler: RateLimitScheduler | None = None,
+                               priority: Priority = Priority.BULK) -> tuple[dict, Metrics, int]:
+    """Async counterpart of run_query.get_completion with timeout and retries.
+
+    Args:
+        system_prompt: Composed system prompt.
+        user_prompt: Agent query.
+        model: Model to use.
+        client: AsyncOpenAI client (or compatible).
+        timeout: Per-attempt timeout in seconds.
+        max_retries: Retries after the first attempt for retryable errors.
+        context: Context label stored in Metrics (and rate limiter tenant).
+        scheduler: Client-side RPM/TPM limiter; every attempt is admitted
+            and settled on its own.
+        priority: Scheduling class of the query.
+
+    Returns:
+        Tuple of (parsed response, metrics, attempts made).
+
+    Raises:
+        BatchQueryError: When the last error is not retryable or retries run out.
+    """
+    messages = build_messages(system_prompt, user_prompt)
+    estimated_tokens = estimate_request_tokens(messages) + DEFAULT_COMPLETION_ESTIMATE_TOKENS
+    queue_wait = 0.0
+    attempt = 0
+    while True:
+        attempt += 1
+        reservation = None
+        try:
+            if scheduler is not None:
+                # Cada intento (reintentos incluidos) es un request: se reserva y se corrige por separado
+                reservation = await scheduler.acquire_async(estimated_tokens, priority, context or "default")
+                queue_wait += reservation.wait_seconds
+            start_time = time.time()
+            response = await asyncio.wait_for(
+                client.chat.completions.create(model=model, messages=messages),
+                timeout=timeout,
+            )
+            latency = time.time() - start_time
+            if reservation is not None:
+                reservation.settle(response.usage.total_tokens)
+            metrics = build_metrics(model, response.usage, latency, context=context)
+            if scheduler is not None:
+                metrics.queue_wait_seconds = round(queue_wait, 4)
+                metrics.priority = priority.name.lower()
+            return parse_completion(response.choices[0].message.content), metrics, attempt
+        except Exception as e:
+            if reservation is not None:
+                # Sin usage (timeout, 429): queda cobrada la estimación
+                reservation.settle(None)
+            if attempt > max_retries or not is_retryable(e):
+                raise BatchQueryError(f"{type(e).__name__}: {e}", attempt) from e
+            delay = backoff_delay(attempt, e)
+            logger.warning("Attempt %d failed (%s), retrying in %.1fs", attempt, type(e).__name__, delay)
+            await asyncio.sleep(delay)
+
+
+async def run_batch(queries: Iterable[BatchQuery], model: OpenAIModels, client,
+                    concurrency: int = DEFAULT_CONCURRENCY,
+                    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+                    max_retries: int = DEFAULT_MAX_RETRIES,
+                    kb_index=None,
+                    coalescer: SingleFlight | None = None,
+                    scheduler: RateLimitScheduler | None = None,
+                    priority: Priority = Priority.BULK) -> AsyncIterator[BatchResult]:
+    """Runs queries concurrently and yields results as they complete.
+
+    Args:
+        queries: Queries to run.
+        model: Model to use for every query.
+        client: AsyncOpenAI client (or compatible).
+        concurrency: Maximum number of in-flight requests.
+        timeout: Per-attempt timeout in seconds.
+        max_retries: Retries per query for retryable errors.
+        kb_index: BM25 index used to build each system prompt.
+        coalescer: When given, identical queries in flight at the same time
+            share one call (the others report attempts=0 and no cost).
+        scheduler: Client-side RPM/TPM limiter (possibly shared with live traffic).
+        priority: Scheduling class of the batch queries.
+
+    Yields:
+        BatchResult for each query, in completion order.
+    """
+    kb_index = kb_index or load_or_build_index(BANK_KB)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(system_prompt: str, consulta: str):
+        async with semaphore:
+            return await get_completion_async(
+                system_prompt, consulta, model, client, timeout, max_retries,
+                context=f"{APPLICATION_NAME}_batch", scheduler=scheduler, priority=priority,
+            )
+
+    async def run_one(query: BatchQuery) -> BatchResult:
+        system_prompt, retrieval = build_system_prompt(query.consulta, kb_index)
+        try:
+            if coalescer is None:
+                respuesta, metrics, attempts = await call(system_prompt, query.consulta)
+            else:
+                # Los que esperan un vuelo ajeno no ocupan un lugar del semáforo
+                start_time = time.time()
+                (respuesta, metrics, attempts), flight = await coalescer.do_async(
+                    cache_key(model.value, system_prompt, query.consulta),
+                    lambda: call(system_prompt, query.consulta))
+                if flight.leader:
+                    metrics.coalesced, metrics.coalesced_requests = False, flight.followers
+                else:
+                    metrics, attempts = build_coalesced_metrics(metrics, time.time() - start_time), 0
+        except BatchQueryError as e:
+            get_live_metrics().observe_error(model, f"{APPLICATION_NAME}_batch")
+            return BatchResult(query.id, query.consulta, attempts=e.attempts, error=str(e))
+        get_live_metrics().observe(metrics)
+        metrics.retrieved_sections = retrieval.section_ids
+        metrics.kb_fallback = retrieval.fallback
+        metrics.kb_tokens_saved = retrieval.tokens_saved
+        return BatchResult(query.id, query.consulta, respuesta, metrics, attempts)
+
+    tasks = [asyncio.create_task(run_one(q)) for q in queries]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def run_batch_to_file(queries: list[BatchQuery], output_path: Path, model: OpenAIModels, client,
+                            concurrency: int = DEFAULT_CONCURRENCY,
+                            timeout: float = DEFAULT_TIMEOUT_SECONDS,
+                            max_retries: int = DEFAULT_MAX_RETRIES,
+                            coalescer: SingleFlight | None = None,
+                            scheduler: RateLimitScheduler | None = None) -> list[BatchResult]:
+    """Runs a batch and appends each result to a JSONL file as soon as it completes.
+
+    Returns:
+        All results, in completion order.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    results = []
+    with open(output_path, "a", encoding="utf-8") as f:
+        async for result in run_batch(queries, model, client, concurrency, timeout, max_retries,
+                                      coalescer=coalescer, scheduler=scheduler):
+            f.write(json.dumps(result.to_dict(), ensure_ascii=False) + "\n")
+            f.flush()
+            results.append(result)
+            status = "error" if result.error else f"{result.metrics.latency_seconds}s"
+            logger.info("[%d/%d] %s: %s", len(results), len(queries), result.id, status)
+    return results
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from openai import AsyncOpenAI
+
+    parser = argparse.ArgumentParser(description="Replay a file of queries concurrently.")
+    parser.add_argument("queries", nargs="?", type=Path, help="Archivo .jsonl o .csv con consultas")
+    parser.add_argument("--samples", action="store_true", help="Usar las consultas de ejemplo 1-4")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="Archivo JSONL de resultados")
+    parser.add_argument("--model", default=OpenAIModels.GPT_5_mini.value,
+                        choices=[m.value for m in OpenAIModels])
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_SECONDS)
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument("--rpm", type=int, default=None, help="Límite de requests por minuto de la cuenta")
+    parser.add_argument("--tpm", type=int, default=None, help="Límite de tokens por minuto de la cuenta")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="Enviar cada consulta repetida por separado (sin compartir llamados en curso)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Exponer latencia y costo del batch en formato Prometheus en este puerto local")
+    args = parser.parse_args()
+
+    if args.samples:
+        queries = [BatchQuery(id=k, consulta=v) for k, v in SAMPLE_QUERIES.items()]
+    elif args.queries:
+        queries = load_queries(args.queries)
+    else:
+        parser.error("Indicar un archivo de consultas o --samples")
+    if (args.rpm is None) != (args.tpm is None):
+        parser.error("--rpm y --tpm se indican juntos")
+
+    output = args.output or METRICS_LOG_FOLDER / f"{APPLICATION_NAME}_batch_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.jsonl"
+
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+    load_dotenv()
+    # Los reintentos los maneja este módulo (con backoff), no el cliente
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+    start = time.time()
+    results = asyncio.run(run_batch_to_file(
+        queries, output, OpenAIModels(args.model), client,
+        args.concurrency, args.timeout, args.max_retries,
+        coalescer=None if args.no_coalesce else SingleFlight(),
+        scheduler=RateLimitScheduler(args.rpm, args.tpm) if args.rpm and args.tpm else None,
+    ))
+    failed = sum(1 for r in results if r.error)
+    logger.info("Batch terminado: %d consultas (%d con error) en %.1fs. Resultados en: %s",
+                len(results), failed, time.time() - start, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+"""Benchmark harness: our own overhead versus model latency.
+
+Runs the query pipeline against FakeOpenAIServer — a local stand-in for the
+chat completions API with a configurable latency and completion token
+distribution — so what is measured is the client side: retrieval, prompt
+assembly, the OpenAI SDK (HTTP, JSON decoding), response parsing, metrics
+and logging.
+
+Two kinds of measurements:
+
+- stages: mean microseconds per call of each local step of a query
+  (retrieval + prompt assembly, message building, parsing, metrics, sink write)
+- runs: each scenario driven at increasing concurrency
+    - get_completion: run_query.get_completion from a thread pool, one shared client
+    - batch: batch.run_batch with an AsyncOpenAI client
+    - server: POST /query against server.AssistantHTTPServer
+  reporting throughput, client-observed latency percentiles, client overhead
+  (mean observed latency minus mean simulated model latency) and peak memory
+  allocated during the run (tracemalloc).
+
+- logging: mean microseconds a request thread spends per log call, with N
+  threads logging at once, for the console handler (synchronous, colored)
+  versus the production pipeline (queue + background JSON writer), plus a
+  suppressed debug call
+
+Results are written as JSON. With --baseline, stage timings and overheads are
+compared against a previous result and the exit code is 1 on regressions, so
+the benchmark can gate a deploy.
+
+Usage:
+    python src/multitasking_text_utility/benchmark.py --concurrency 1 4 16 --requests 64
+    python src/multitasking_text_utility/benchmark.py --latency 0.5 --latency-sigma 0.4 -o bench.json
+    python src/multitasking_text_utility/benchmark.py --baseline .cache/benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from bank_kb import BANK_KB
+from batch import BatchQuery, run_batch
+from fake_openai import FakeOpenAIServer
+from logger import ColorFormatter, build_production_handler
+from metrics_sink import JsonlMetricsSink
+from prompt_builder import build_messages
+from retrieval import load_or_build_index
+from run_query import (APPLICATION_NAME, SAMPLE_QUERIES, OpenAIModels, build_metrics, build_system_prompt,
+                       get_completion, parse_completion)
+from server import AssistantHTTPServer, AssistantService
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_OUTPUT_DIR = PROJECT_ROOT / ".cache" / "benchmarks"
+
+SCENARIOS = ("get_completion", "batch", "server")
+DEFAULT_CONCURRENCY_LEVELS = (1, 4, 16)
+DEFAULT_REQUESTS = 32
+DEFAULT_LATENCY_SECONDS = 0.2
+DEFAULT_LATENCY_SIGMA = 0.3
+DEFAULT_COMPLETION_TOKENS = 1500
+DEFAULT_COMPLETION_TOKENS_SIGMA = 0.25
+DEFAULT_STAGE_ITERATIONS = 200
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_LOG_THREADS = 8
+DEFAULT_LOG_RECORDS = 2000
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class RunResult:
+    """Results of one scenario at one concurrency level.
+
+    Latencies are client-observed seconds per request. overhead_ms is the
+    mean observed latency minus the mean latency the fake server simulated:
+    the time spent in our code, the SDK and the local HTTP round trip.
+    """
+    scenario: str
+    concurrency: int
+    requests: int
+    errors: int
+    wall_seconds: float
+    throughput_rps: float
+    latency_p50: float
+    latency_p90: float
+    latency_p99: float
+    latency_mean: float
+    model_latency_mean: float
+    overhead_ms: float
+    peak_memory_kb: float | None
+
+
+def _queries(n: int) -> list[str]:
+    samples = list(SAMPLE_QUERIES.values())
+    return [samples[i % len(samples)] for i in range(n)]
+
+
+def _time_per_call_us(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return round((time.perf_counter() - start) / iterations * 1e6, 2)
+
+
+def bench_stages(content: str, iterations: int = DEFAULT_STAGE_ITERATIONS) -> dict[str, float]:
+    """Times each local step of a query, without any network call.
+
+    Args:
+        content: Model output used for the parsing stage.
+        iterations: Calls per stage.
+
+    Returns:
+        Mean microseconds per call, keyed by stage name.
+    """
+    kb_index = load_or_build_index(BANK_KB)
+    query = SAMPLE_QUERIES["1"]
+    system_prompt, _ = build_system_prompt(query, kb_index)
+    usage = SimpleNamespace(prompt_tokens=2000, completion_tokens=1500, total_tokens=3500,
+                            prompt_tokens_details=None)
+    metrics = build_metrics(OpenAIModels.GPT_5_mini, usage, 1.0)
+    record = {"metrics": asdict(metrics), "consulta": query, "respuesta": parse_completion(content)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = JsonlMetricsSink(Path(tmp) / "bench.jsonl")
+        stages = {
+            "retrieval_and_prompt": _time_per_call_us(lambda: build_system_prompt(query, kb_index), iterations),
+            "build_messages": _time_per_call_us(lambda: build_messages(system_prompt, query), iterations),
+            "parse_completion": _time_per_call_us(lambda: parse_completion(content), iterations),
+            "build_metrics": _time_per_call_us(
+                lambda: build_metrics(OpenAIModels.GPT_5_mini, usage, 1.0), iterations),
+            "metrics_record": _time_per_call_us(lambda: {"metrics": asdict(metrics)}, iterations),
+            "sink_write": _time_per_call_us(lambda: sink.write(record), iterations),
+        }
+        sink.close()
+    return stages
+
+
+def _time_logging_us(handler: logging.Handler | None, threads: int, records: int, level: int = logging.INFO) -> float:
+    bench_logger = logging.getLogger(f"benchmark.logging.{id(handler)}")
+    bench_logger.handlers[:] = [handler] if handler else []
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.propagate = False
+    usage = {"prompt_tokens": 2000, "completion_tokens": 1500}
+    barrier = threading.Barrier(threads)
+
+    def one(_) -> float:
+        barrier.wait()
+        start = time.perf_counter()
+        for i in range(records):
+            bench_logger.log(level, "Consulta %d respondida. Tokens: %s, Cost: %.6f", i, usage, 0.0042)
+        return (time.perf_counter() - start) / records * 1e6
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        per_thread = list(pool.map(one, range(threads)))
+    bench_logger.handlers.clear()
+    return round(sum(per_thread) / threads, 2)
+
+
+def bench_logging(threads: int = DEFAULT_LOG_THREADS, records: int = DEFAULT_LOG_RECORDS) -> dict[str, float]:
+    """Times the log calls of concurrent request threads for each logging mode.
+
+    Args:
+        threads: Threads logging at the same time.
+        records: Log calls per thread.
+
+    Returns:
+        Mean microseconds per call in the calling thread, keyed by mode.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(Path(tmp) / "console.log", "w", encoding="utf-8") as console_out, \
+                open(Path(tmp) / "json.log", "w", encoding="utf-8") as json_out:
+            console = logging.StreamHandler(console_out)
+            console.setFormatter(ColorFormatter(fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s"))
+            queue_handler, listener = build_production_handler(json_out, queue_size=threads * records)
+            listener.start()
+            try:
+                report = {
+                    "console": _time_logging_us(console, threads, records),
+                    "json_queue": _time_logging_us(queue_handler, threads, records),
+                    "debug_suppressed": _time_logging_us(queue_handler, threads, records, logging.DEBUG),
+                }
+            finally:
+                # stop() espera a que el hilo de escritura vacíe la cola
+                listener.stop()
+    return report
+
+
+def _drive_get_completion(base_url: str, queries: list[str], concurrency: int, log_path: Path) -> list[float | None]:
+    from openai import OpenAI
+
+    client = OpenAI(api_key="bench", base_url=base_url, max_retries=0)
+    kb_index = load_or_build_index(BANK_KB)
+    sink = JsonlMetricsSink(log_path)
+
+    def one(query: str) -> float | None:
+        start = time.perf_counter()
+        system_prompt, _ = build_system_prompt(query, kb_index)
+        result = get_completion(system_prompt, query, OpenAIModels.GPT_5_mini, client,
+                                context=f"{APPLICATION_NAME}_bench")
+        if isinstance(result, str):
+            return None
+        respuesta, metrics = result
+        sink.write({"metrics": asdict(metrics), "consulta": query, "respuesta": respuesta})
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, queries))
+    sink.close()
+    client.close()
+    return latencies
+
+
+def _drive_batch(base_url: str, queries: list[str], concurrency: int, log_path: Path) -> list[float | None]:
+    from openai import AsyncOpenAI
+
+    async def run() -> list[float | None]:
+        client = AsyncOpenAI(api_key="bench", base_url=base_url, max_retries=0)
+        kb_index = load_or_build_index(BANK_KB)
+        sink = JsonlMetricsSink(log_path)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(i: int, query: str) -> float | None:
+            # Metrics.latency_seconds es solo el llamado al modelo (y redondeado): se mide la tarea completa,
+            # desde el armado del prompt hasta el resultado, igual que en los otros drivers
+            async with slots:
+                start = time.perf_counter()
+                [result] = [r async for r in run_batch([BatchQuery(str(i), query)], OpenAIModels.GPT_5_mini,
+                                                       client, 1, max_retries=0, kb_index=kb_index)]
+                latency = time.perf_counter() - start
+            sink.write(result.to_dict())
+            return None if result.error else latency
+
+        latencies = await asyncio.gather(*(one(i, q) for i, q in enumerate(queries)))
+        sink.close()
+        await client.close()
+        return list(latencies)
+
+    return asyncio.run(run())
+
+
+def _drive_server(base_url: str, queries: list[str], concurrency: int, log_path: Path) -> list[float | None]:
+    from openai import OpenAI
+
+    client = OpenAI(api_key="bench", base_url=base_url, max_retries=0)
+    # Se mide el camino con modelo: el índice de hechos respondería parte de las consultas de ejemplo, y
+    # single-flight compartiría un llamado entre las consultas repetidas en curso (los otros drivers no lo hacen)
+    service = AssistantService(client, OpenAIModels.GPT_5_mini, fast_path=False, coalesce=False,
+                               metrics_log=log_path)
+    httpd = AssistantHTTPServer(("127.0.0.1", 0), service, max_concurrency=concurrency)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    local = threading.local()
+
+    def one(query: str) -> float | None:
+        # Una conexión keep-alive por hilo, como un cliente real del servicio
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        body = json.dumps({"consulta": query}).encode("utf-8")
+        start = time.perf_counter()
+        local.conn.request("POST", "/query", body, {"Content-Type": "application/json"})
+        response = local.conn.getresponse()
+        response.read()
+        latency = time.perf_counter() - start
+        return latency if response.status == 200 else None
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(one, queries))
+    finally:
+        httpd.graceful_shutdown()
+        service.metrics_sink.close()
+        client.close()
+    return latencies
+
+
+DRIVERS = {
+    "get_completion": _drive_get_completion,
+    "batch": _drive_batch,
+    "server": _drive_server,
+}
+
+
+def run_scenario(scenario: str, fake: FakeOpenAIServer, requests: int, concurrency: int,
+                 trace_memory: bool = True) -> RunResult:
+    """Drives one scenario against the fake server and summarizes it.
+
+    Args:
+        scenario: One of SCENARIOS.
+        fake: Running FakeOpenAIServer.
+        requests: Queries to send (sample queries, round robin).
+        concurrency: Parallel requests in flight.
+        trace_memory: Track peak allocations with tracemalloc. It slows
+            Python allocations down, which inflates overhead_ms a little.
+
+    Returns:
+        RunResult for the run.
+    """
+    queries = _queries(requests)
+    first_request = len(fake.latencies)
+    if trace_memory:
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        latencies = DRIVERS[scenario](fake.base_url, queries, concurrency, Path(tmp) / "bench.jsonl")
+        wall = time.perf_counter() - start
+    peak_kb = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_kb = round(peak / 1024, 1)
+
+    ok = np.array([latency for latency in latencies if latency is not None], dtype=float)
+    simulated = fake.latencies[first_request:]
+    model_latency = float(np.mean(simulated)) if simulated else 0.0
+    p50, p90, p99 = np.percentile(ok, PERCENTILES) if ok.size else (float("nan"),) * 3
+    mean = float(ok.mean()) if ok.size else float("nan")
+    return RunResult(
+        scenario=scenario,
+        concurrency=concurrency,
+        requests=requests,
+        errors=requests - int(ok.size),
+        wall_seconds=round(wall, 4),
+        throughput_rps=round(ok.size / wall, 2) if wall > 0 else 0.0,
+        latency_p50=round(float(p50), 4),
+        latency_p90=round(float(p90), 4),
+        latency_p99=round(float(p99), 4),
+        latency_mean=round(mean, 4),
+        model_latency_mean=round(model_latency, 4),
+        overhead_ms=round((mean - model_latency) * 1000, 2),
+        peak_memory_kb=peak_kb,
+    )
+
+
+def run_benchmark(scenarios=SCENARIOS, concurrency_levels=DEFAULT_CONCURRENCY_LEVELS,
+                  requests: int = DEFAULT_REQUESTS,
+                  latency_seconds: float = DEFAULT_LATENCY_SECONDS,
+                  latency_sigma: float = DEFAULT_LATENCY_SIGMA,
+                  completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+                  completion_tokens_sigma: float = DEFAULT_COMPLETION_TOKENS_SIGMA,
+                  stage_iterations: int = DEFAULT_STAGE_ITERATIONS,
+                  trace_memory: bool = True, seed: int | None = 0,
+                  log_threads: int = DEFAULT_LOG_THREADS, log_records: int = DEFAULT_LOG_RECORDS) -> dict:
+    """Runs the stage timings and every scenario at every concurrency level.
+
+    Returns:
+        JSON-serializable dict with the environment, the fake server
+        configuration, "stages", "logging" and "runs".
+    """
+    fake_config = {
+        "latency_seconds": latency_seconds,
+        "latency_sigma": latency_sigma,
+        "completion_tokens": completion_tokens,
+        "completion_tokens_sigma": completion_tokens_sigma,
+        "seed": seed,
+    }
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fake_server": fake_config,
+        "requests_per_run": requests,
+    }
+    with FakeOpenAIServer(**fake_config) as fake:
+        report["stages"] = bench_stages(fake.content, stage_iterations)
+        report["logging"] = bench_logging(log_threads, log_records)
+        runs = []
+        for scenario in scenarios:
+            for concurrency in concurrency_levels:
+                result = run_scenario(scenario, fake, requests, concurrency, trace_memory)
+                logger.info("%s x%d: %s req/s, p50 %ss, overhead %s ms", scenario, concurrency,
+                            result.throughput_rps, result.latency_p50, result.overhead_ms)
+                runs.append(asdict(result))
+        report["runs"] = runs
+    return report
+
+
+def compare_reports(baseline: dict, current: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """Lists the regressions of current against baseline.
+
+    A stage regresses when it is more than `tolerance` slower; a run when
+    its overhead_ms or peak memory grow more than `tolerance` (runs are
+    matched by scenario and concurrency).
+
+    Returns:
+        Human-readable regression descriptions (empty when there are none).
+    """
+    regressions = []
+    for stage, before in baseline.get("stages", {}).items():
+        after = current.get("stages", {}).get(stage)
+        if after is not None and before > 0 and after > before * (1 + tolerance):
+            regressions.append(f"stage {stage}: {before} -> {after} us")
+
+    baseline_runs = {(r["scenario"], r["concurrency"]): r for r in baseline.get("runs", [])}
+    for run in current.get("runs", []):
+        before = baseline_runs.get((run["scenario"], run["concurrency"]))
+        if before is None:
+            continue
+        for field, unit in (("overhead_ms", "ms"), ("peak_memory_kb", "KB")):
+            old, new = before.get(field), run.get(field)
+            if old and new and old > 0 and new > old * (1 + tolerance):
+                regressions.append(f"{run['scenario']} x{run['concurrency']} {field}: {old} -> {new} {unit}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de consultas contra una API fake local.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=list(DEFAULT_CONCURRENCY_LEVELS),
+                        help="Niveles de concurrencia a medir")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Consultas por corrida")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY_SECONDS,
+                        help="Latencia mediana simulada del modelo (segundos)")
+    parser.add_argument("--latency-sigma", type=float, default=DEFAULT_LATENCY_SIGMA,
+                        help="Sigma de la distribución log-normal de latencia")
+    parser.add_argument("--completion-tokens", type=int, default=DEFAULT_COMPLETION_TOKENS)
+    parser.add_argument("--completion-tokens-sigma", type=float, default=DEFAULT_COMPLETION_TOKENS_SIGMA)
+    parser.add_argument("--stage-iterations", type=int, default=DEFAULT_STAGE_ITERATIONS)
+    parser.add_argument("--log-threads", type=int, default=DEFAULT_LOG_THREADS,
+                        help="Hilos que loguean a la vez al medir el costo del logging")
+    parser.add_argument("--no-trace-memory", action="store_true", help="No medir memoria con tracemalloc")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", type=Path, default=None, help="Resultado previo contra el cual comparar")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Empeoramiento relativo tolerado antes de marcar una regresión")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+    # Una línea por request HTTP taparía los resultados
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = run_benchmark(args.scenarios, args.concurrency, args.requests, args.latency, args.latency_sigma,
+                           args.completion_tokens, args.completion_tokens_sigma, args.stage_iterations,
+                           trace_memory=not args.no_trace_memory, log_threads=args.log_threads)
+
+    output = args.output or DEFAULT_OUTPUT_DIR / f"benchmark_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    logger.info("Resultados en %s", output)
+
+    if args.baseline:
+        regressions = compare_reports(json.loads(args.baseline.read_text(encoding="utf-8")), report, args.tolerance)
+        for regression in regressions:
+            logger.error("Regresión: %s", regression)
+        if regressions:
+            sys.exit(1)
+        logger.info("Sin regresiones respecto de la línea base")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Per-query output budgets and pre-flight prompt size checks.
+
+gpt-5-mini often spends 2,000-2,500 completion tokens (mostly hidden
+reasoning) on a ~1,000-token prompt, so completion tokens dominate latency
+and cost. A cheap local classification of the query (see query_classifier)
+picks how much the model may think and write:
+
+- direct_lookup: minimal reasoning, short answer
+- listing: low reasoning, room for several items
+- inferential: medium reasoning
+- out_of_domain: minimal reasoning, the answer is "no disponible"
+
+If the output comes back truncated (finish_reason "length") or unparseable,
+get_completion retries once with escalated(): the next reasoning effort and
+twice the tokens.
+
+Before sending, estimate_request_tokens and check_request_size catch
+oversized requests (e.g. a whole document pasted as the query).
+"""
+
+from dataclasses import dataclass, replace
+
+from metrics import estimate_tokens
+from query_classifier import QueryClass
+
+REASONING_EFFORTS = ("minimal", "low", "medium", "high")
+# Solo los modelos de razonamiento aceptan reasoning_effort
+REASONING_MODELS = frozenset({"gpt-5-mini"})
+MAX_COMPLETION_TOKENS_CAP = 8000
+
+# Tokens de contexto por modelo (prompt + completion)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-5-mini": 400_000,
+    "gpt-4o-mini": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4": 8_192,
+    "gpt-3.5-turbo": 16_385,
+}
+# Nuestro system prompt con la KB completa ronda los 1.000 tokens (~1.060 el request completo, según el
+# usage de los logs): un prompt 15 veces más grande es un error
+DEFAULT_MAX_PROMPT_TOKENS = 16_000
+# Tokens de formato que agrega la API por mensaje
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class PromptTooLargeError(ValueError):
+    """The composed request does not fit the prompt budget or the model's context window."""
+
+
+@dataclass(frozen=True)
+class OutputBudget:
+    """How much the model may reason and write for a query.
+
+    Attributes:
+        max_completion_tokens: Cap on completion tokens (reasoning included).
+        reasoning_effort: "minimal" to "high"; ignored for non-reasoning models.
+    """
+
+    max_completion_tokens: int
+    reasoning_effort: str | None = None
+
+    def escalated(self) -> "OutputBudget":
+        """The next budget up: one more reasoning level and twice the tokens."""
+        effort = self.reasoning_effort
+        if effort in REASONING_EFFORTS:
+            effort = REASONING_EFFORTS[min(REASONING_EFFORTS.index(effort) + 1, len(REASONING_EFFORTS) - 1)]
+        return replace(self, max_completion_tokens=min(self.max_completion_tokens * 2, MAX_COMPLETION_TOKENS_CAP),
+                       reasoning_effort=effort)
+
+    def request_params(self, model: str) -> dict:
+        """Parameters for chat.completions.create with this budget."""
+        params = {"max_completion_tokens": self.max_completion_tokens}
+        if self.reasoning_effort and model in REASONING_MODELS:
+            params["reasoning_effort"] = self.reasoning_effort
+        return params
+
+
+DEFAULT_BUDGETS = {
+    QueryClass.DIRECT_LOOKUP: OutputBudget(max_completion_tokens=800, reasoning_effort="minimal"),
+    QueryClass.LISTING: OutputBudget(max_completion_tokens=1500, reasoning_effort="low"),
+    QueryClass.INFERENTIAL: OutputBudget(max_completion_tokens=3000, reasoning_effort="medium"),
+    QueryClass.OUT_OF_DOMAIN: OutputBudget(max_completion_tokens=500, reasoning_effort="minimal"),
+}
+
+
+def budget_for(query_class: QueryClass) -> OutputBudget:
+    """Returns the output budget for a query class."""
+    return DEFAULT_BUDGETS[query_class]
+
+
+def estimate_request_tokens(messages: list[dict]) -> int:
+    """Estimates the prompt tokens of a chat request without a tokenizer.
+
+    Args:
+        messages: Chat messages (see prompt_builder.build_messages).
+
+    Returns:
+        Approximate prompt tokens, per-message overhead included.
+    """
+    return sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def check_request_size(model: str, prompt_tokens: int, max_completion_tokens: int = 0,
+                       max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS) -> None:
+    """Rejects requests that are too large before they are sent.
+
+    Args:
+        model: Model name.
+        prompt_tokens: Estimated prompt tokens (estimate_request_tokens).
+        max_completion_tokens: Completion budget reserved for the answer.
+        max_prompt_tokens: Our own cap on prompt size.
+
+    Raises:
+        PromptTooLargeError: If the prompt exceeds max_prompt_tokens or the
+            request does not fit the model's context window.
+    """
+    if prompt_tokens > max_prompt_tokens:
+        raise PromptTooLargeError(
+            f"Prompt of ~{prompt_tokens} tokens exceeds the {max_prompt_tokens}-token prompt budget")
+    window = MODEL_CONTEXT_WINDOWS.get(model)
+    if window is not None and prompt_tokens + max_completion_tokens > window:
+        raise PromptTooLargeError(
+            f"~{prompt_tokens} prompt + {max_completion_tokens} completion tokens exceed {model}'s "
+            f"{window}-token context window")
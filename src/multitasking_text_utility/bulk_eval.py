@@ -0,0 +1,315 @@
+"""Offline bulk evaluation through the OpenAI Batch API.
+
+Prompt experiments (zero-shot vs ONE_SHOT_EXAMPLE, gpt-4o-mini vs gpt-5-mini,
+see reports/report1.md) used to be run one interactive query at a time, at
+full price and full latency. This module turns a query set times a
+prompt/model grid into one Batch API job:
+
+1. build one /v1/chat/completions request per (query, variant), with the same
+   retrieval-based system prompt run_query.py uses; custom_id is
+   "<variant>::<query id>"
+2. upload the JSONL and create the batch
+3. poll until the job reaches a terminal status
+4. join the output lines back to their queries as BatchResult records with
+   per-query Metrics, priced with calculate_cost(batch=True)
+
+The transport is pluggable (BatchTransport). OpenAIBatchTransport works with
+any OpenAI-compatible client, including one pointed at the local
+FakeOpenAIServer, so the whole flow runs end to end without network access.
+
+Usage:
+    python src/multitasking_text_utility/bulk_eval.py --samples
+    python src/multitasking_text_utility/bulk_eval.py queries.jsonl -o results.jsonl --variants gpt-4o-mini/zero_shot
+"""
+
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Protocol
+
+from openai.types.chat import ChatCompletion
+
+from bank_kb import BANK_KB
+from batch import BatchQuery, BatchResult, load_queries
+from logger import get_logger
+from retrieval import load_or_build_index
+from run_query import (
+    APPLICATION_NAME,
+    METRICS_LOG_FOLDER,
+    SAMPLE_QUERIES,
+    OpenAIModels,
+    build_messages,
+    build_metrics,
+    build_system_prompt,
+    parse_completion_with_repairs,
+)
+
+logger = get_logger()
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+DEFAULT_POLL_INTERVAL_SECONDS = 30.0
+DEFAULT_MAX_WAIT_SECONDS = 24 * 3600.0
+TERMINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+CUSTOM_ID_SEPARATOR = "::"
+
+
+@dataclass(frozen=True)
+class EvalVariant:
+    """One cell of the prompt/model grid.
+
+    Attributes:
+        model: Model that answers the queries.
+        one_shot: Whether the system prompt includes ONE_SHOT_EXAMPLE.
+    """
+
+    model: OpenAIModels
+    one_shot: bool
+
+    @property
+    def name(self) -> str:
+        return f"{self.model.value}/{'one_shot' if self.one_shot else 'zero_shot'}"
+
+
+DEFAULT_GRID = tuple(EvalVariant(model, one_shot)
+                     for model in (OpenAIModels.GPT_4o_mini, OpenAIModels.GPT_5_mini)
+                     for one_shot in (False, True))
+
+
+@dataclass
+class PendingRequest:
+    """A request of the batch file, kept to join its output line back."""
+
+    query: BatchQuery
+    variant: EvalVariant
+    retrieval: object
+
+
+class BatchTransport(Protocol):
+    """Submits a batch of requests and retrieves its results."""
+
+    def submit(self, requests: list[dict]) -> str:
+        """Submits the JSONL requests and returns the job id."""
+
+    def status(self, job_id: str) -> str:
+        """Returns the job status ("validating", "in_progress", "completed", ...)."""
+
+    def results(self, job_id: str) -> list[dict]:
+        """Returns the output (and error) lines of a finished job."""
+
+
+class OpenAIBatchTransport:
+    """BatchTransport over the Files and Batch endpoints of an OpenAI client.
+
+    Args:
+        client: OpenAI client (or one pointed at FakeOpenAIServer.base_url).
+        completion_window: Batch completion window.
+    """
+
+    def __init__(self, client, completion_window: str = "24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, requests: list[dict]) -> str:
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in requests).encode("utf-8")
+        input_file = self.client.files.create(file=("bulk_eval.jsonl", data), purpose="batch")
+        job = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                         completion_window=self.completion_window)
+        return job.id
+
+    def status(self, job_id: str) -> str:
+        return self.client.batches.retrieve(job_id).status
+
+    def results(self, job_id: str) -> list[dict]:
+        job = self.client.batches.retrieve(job_id)
+        lines = []
+        for file_id in (job.output_file_id, job.error_file_id):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                lines.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        return lines
+
+
+def build_batch_requests(queries: Iterable[BatchQuery], grid: Iterable[EvalVariant] = DEFAULT_GRID,
+                         kb_index=None) -> tuple[list[dict], dict[str, PendingRequest]]:
+    """Builds one Batch API request per (query, variant).
+
+    Args:
+        queries: Queries to evaluate.
+        grid: Prompt/model variants.
+        kb_index: BM25 index used to build each system prompt.
+
+    Returns:
+        Tuple of (JSONL request lines, pending requests by custom_id).
+    """
+    kb_index = kb_index or load_or_build_index(BANK_KB)
+    queries, grid = list(queries), list(grid)
+    requests, pending = [], {}
+    for query in queries:
+        for variant in grid:
+            system_prompt, retrieval = build_system_prompt(query.consulta, kb_index, variant.one_shot)
+            custom_id = f"{variant.name}{CUSTOM_ID_SEPARATOR}{query.id}"
+            requests.append({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {"model": variant.model.value, "messages": build_messages(system_prompt, query.consulta)},
+            })
+            pending[custom_id] = PendingRequest(query, variant, retrieval)
+    return requests, pending
+
+
+def wait_for_job(transport: BatchTransport, job_id: str,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+                 max_wait: float = DEFAULT_MAX_WAIT_SECONDS) -> str:
+    """Polls the job until it reaches a terminal status.
+
+    Returns:
+        The terminal status.
+
+    Raises:
+        TimeoutError: If the job is still running after max_wait seconds.
+    """
+    deadline = time.monotonic() + max_wait
+    while True:
+        status = transport.status(job_id)
+        if status in TERMINAL_STATUSES:
+            return status
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Batch {job_id} still {status} after {max_wait:.0f}s")
+        logger.info("Batch %s: %s, consultando de nuevo en %.0fs", job_id, status, poll_interval)
+        time.sleep(poll_interval)
+
+
+def join_results(lines: list[dict], pending: dict[str, PendingRequest], job_id: str,
+                 turnaround_seconds: float) -> list[BatchResult]:
+    """Joins Batch API output lines back to their queries.
+
+    Args:
+        lines: Output/error lines of the job.
+        pending: Pending requests by custom_id (see build_batch_requests).
+        job_id: Batch job id, recorded in each Metrics.
+        turnaround_seconds: Submit-to-completion time of the job.
+
+    Returns:
+        One BatchResult per pending request, in request order; id is the
+        custom_id. Requests missing from the output get an error.
+    """
+    by_id = {line.get("custom_id"): line for line in lines}
+    results = []
+    for custom_id, request in pending.items():
+        line = by_id.get(custom_id)
+        if line is None:
+            results.append(BatchResult(custom_id, request.query.consulta, error="Missing from batch output"))
+            continue
+        response = line.get("response") or {}
+        if response.get("status_code") != 200:
+            error = line.get("error") or response.get("body", {}).get("error")
+            results.append(BatchResult(custom_id, request.query.consulta, attempts=1,
+                                       error=f"status {response.get('status_code')}: {error}"))
+            continue
+
+        completion = ChatCompletion.model_validate(response["body"])
+        metrics = build_metrics(request.variant.model, completion.usage, 0.0,
+                                context=f"{APPLICATION_NAME}_bulk", batch=True)
+        # En batch no hay latencia por consulta: se registra la del job completo
+        metrics.latency_seconds = round(turnaround_seconds, 2)
+        metrics.batch_job_id = job_id
+        metrics.eval_variant = request.variant.name
+        metrics.retrieved_sections = request.retrieval.section_ids
+        metrics.kb_fallback = request.retrieval.fallback
+        metrics.kb_tokens_saved = request.retrieval.tokens_saved
+        try:
+            respuesta, metrics.json_repairs = parse_completion_with_repairs(completion.choices[0].message.content)
+        except (ValueError, KeyError, TypeError) as e:
+            metrics.validation_failures = 1
+            results.append(BatchResult(custom_id, request.query.consulta, metrics=metrics, attempts=1,
+                                       error=f"{type(e).__name__}: {e}"))
+            continue
+        metrics.validation_failures = 0
+        results.append(BatchResult(custom_id, request.query.consulta, respuesta, metrics, attempts=1))
+    return results
+
+
+def run_bulk_eval(queries: Iterable[BatchQuery], transport: BatchTransport,
+                  grid: Iterable[EvalVariant] = DEFAULT_GRID, kb_index=None,
+                  poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+                  max_wait: float = DEFAULT_MAX_WAIT_SECONDS) -> list[BatchResult]:
+    """Evaluates every query with every variant in a single Batch API job.
+
+    Returns:
+        One BatchResult per (query, variant); see join_results.
+    """
+    requests, pending = build_batch_requests(queries, grid, kb_index)
+    start = time.time()
+    job_id = transport.submit(requests)
+    logger.info("Batch %s enviado: %d consultas", job_id, len(requests))
+    status = wait_for_job(transport, job_id, poll_interval, max_wait)
+    if status != "completed":
+        logger.warning("Batch %s terminó con estado %s: se recuperan los resultados parciales", job_id, status)
+    return join_results(transport.results(job_id), pending, job_id, time.time() - start)
+
+
+def summarize_variants(results: list[BatchResult]) -> dict[str, dict]:
+    """Per-variant rollup: answered queries, mean confianza and total cost."""
+    summary: dict[str, dict] = {}
+    for result in results:
+        variant = result.id.split(CUSTOM_ID_SEPARATOR)[0]
+        row = summary.setdefault(variant, {"queries": 0, "errors": 0, "confianza": [], "cost_usd": 0.0})
+        row["queries"] += 1
+        row["errors"] += result.error is not None
+        if result.metrics:
+            row["cost_usd"] += result.metrics.estimated_cost_usd
+        if result.respuesta:
+            row["confianza"].append(result.respuesta["indicador_de_confianza"])
+    for row in summary.values():
+        scores = row.pop("confianza")
+        row["mean_confianza"] = round(sum(scores) / len(scores), 3) if scores else None
+        row["cost_usd"] = round(row["cost_usd"], 4)
+    return summary
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    variants = {v.name: v for v in DEFAULT_GRID}
+    parser = argparse.ArgumentParser(description="Evaluate a query set over a prompt/model grid with the Batch API.")
+    parser.add_argument("queries", nargs="?", type=Path, help="Archivo .jsonl o .csv con consultas")
+    parser.add_argument("--samples", action="store_true", help="Usar las consultas de ejemplo 1-4")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="Archivo JSONL de resultados")
+    parser.add_argument("--variants", nargs="+", choices=list(variants), default=list(variants),
+                        help="Celdas de la grilla modelo/prompt a evaluar (por defecto todas)")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL_SECONDS)
+    parser.add_argument("--base-url", default=None,
+                        help="API compatible con OpenAI (por ejemplo un FakeOpenAIServer local)")
+    args = parser.parse_args()
+
+    if args.samples:
+        queries = [BatchQuery(id=k, consulta=v) for k, v in SAMPLE_QUERIES.items()]
+    elif args.queries:
+        queries = load_queries(args.queries)
+    else:
+        parser.error("Indicar un archivo de consultas o --samples")
+
+    output = args.output or METRICS_LOG_FOLDER / f"{APPLICATION_NAME}_bulk_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.jsonl"
+
+    load_dotenv()
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=args.base_url)
+    results = run_bulk_eval(queries, OpenAIBatchTransport(client), [variants[v] for v in args.variants],
+                            poll_interval=args.poll_interval)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result.to_dict(), ensure_ascii=False) + "\n")
+    for variant, row in summarize_variants(results).items():
+        logger.info("%s: %s", variant, row)
+    logger.info("Resultados en: %s", output)
+
+
+if __name__ == "__main__":
+    main()
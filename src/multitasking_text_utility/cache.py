@@ -0,0 +1,189 @@
+"""Persistent response cache in front of get_completion.
+
+Agents ask the same handful of questions all day, and every repeat costs a
+full model round trip. This module stores parsed answers in a local SQLite
+database keyed on:
+
+- the model name
+- a hash of the composed system prompt actually sent
+- the normalized query (case, accents and punctuation folded)
+
+Entries expire after a TTL and the least recently used ones are evicted
+once the cache exceeds its size limit. The cache also records a prompt
+version (a hash of BANK_ASSISTANT_SYSTEM_PROMPT, ONE_SHOT_EXAMPLE and
+BANK_KB); when any of them changes, the whole cache is invalidated on open.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from bank_kb import BANK_KB
+from prompts import BANK_ASSISTANT_SYSTEM_PROMPT, ONE_SHOT_EXAMPLE
+from text_normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_CACHE_PATH = PROJECT_ROOT / ".cache" / "responses.sqlite3"
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10_000
+
+
+def prompt_version(*parts: str) -> str:
+    """Returns a short hash identifying a prompt/KB combination.
+
+    Args:
+        *parts: Prompt components. Defaults to the system prompt, the one-shot
+            example and the knowledge base.
+
+    Returns:
+        16 hex chars of the SHA-256 of the components.
+    """
+    parts = parts or (BANK_ASSISTANT_SYSTEM_PROMPT, ONE_SHOT_EXAMPLE, BANK_KB)
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+def cache_key(model: str, system_prompt: str, user_prompt: str) -> str:
+    """Builds the cache key for a request.
+
+    Args:
+        model: Model name.
+        system_prompt: Composed system prompt sent with the request.
+        user_prompt: Raw user query; it is normalized before hashing.
+
+    Returns:
+        Hex SHA-256 key.
+    """
+    prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    raw = f"{model}\x00{prompt_hash}\x00{normalize_text(user_prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL and LRU eviction.
+
+    Safe to share between threads: all access goes through a single
+    connection guarded by a lock.
+
+    Examples:
+        >>> cache = ResponseCache(Path("/tmp/responses.sqlite3"))
+        >>> cache.put("gpt-5-mini", system_prompt, "Horario de corte?", {"respuesta": "..."})
+        >>> cache.get("gpt-5-mini", system_prompt, "horario de corte")
+        {'respuesta': '...'}
+    """
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 version: str | None = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version = version or prompt_version()
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                query TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self._invalidate_if_stale()
+
+    def _invalidate_if_stale(self) -> None:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'prompt_version'").fetchone()
+            if row and row[0] != self.version:
+                logger.info("Prompt/KB changed (%s -> %s), clearing response cache", row[0], self.version)
+                self._conn.execute("DELETE FROM responses")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('prompt_version', ?)", (self.version,)
+            )
+
+    def set_version(self, version: str) -> None:
+        """Switches to a new prompt/KB version, clearing the cache if it changed."""
+        self.version = version
+        self._invalidate_if_stale()
+
+    def get(self, model: str, system_prompt: str, user_prompt: str) -> dict | None:
+        """Returns the cached response for a request, if fresh.
+
+        Args:
+            model: Model name.
+            system_prompt: Composed system prompt.
+            user_prompt: User query (normalized internally).
+
+        Returns:
+            The cached response dict, or None on a miss or expired entry.
+        """
+        key = cache_key(model, system_prompt, user_prompt)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, model: str, system_prompt: str, user_prompt: str, response: dict) -> None:
+        """Stores a response and evicts least recently used entries over the limit.
+
+        Args:
+            model: Model name.
+            system_prompt: Composed system prompt.
+            user_prompt: User query (normalized internally).
+            response: Parsed response dict to cache.
+        """
+        key = cache_key(model, system_prompt, user_prompt)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, query, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, normalize_text(user_prompt), json.dumps(response, ensure_ascii=False), now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "  SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self) -> None:
+        """Removes every cached response."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,286 @@
+"""Offline cache warming from the historical query logs.
+
+The logs (logs/*.json, the JSONL metrics log, batch and bulk result files)
+hold every consulta with its Metrics, but none of it was reused. This job:
+
+1. mines the logs for (consulta, estimated_cost_usd) pairs
+2. clusters near-duplicate questions: exact matches on the query signature
+   (normalized, stemmed content words) first, then signatures whose word
+   sets overlap by at least `similarity` (Jaccard)
+3. ranks the clusters by the cost they incurred (default) or by frequency
+4. answers every distinct signature of the top N clusters against the
+   current BANK_KB/prompt version with bounded concurrency, optionally
+   waiting for an off-peak window. Clusters only decide what is worth
+   precomputing: near-duplicates can differ in the one word that matters
+   ("tarjeta de débito" / "de crédito"), so no signature is served the
+   answer computed for another one
+5. writes a versioned AnswerStore (see answer_store) that run_query.py and
+   server.py load at startup
+
+Usage:
+    python src/multitasking_text_utility/cache_warming.py logs/ LOGS/ --top 50 --dry-run
+    python src/multitasking_text_utility/cache_warming.py logs/ LOGS/ --top 50 --concurrency 4 --off-peak 22-6
+"""
+
+import argparse
+import gzip
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from answer_store import DEFAULT_ANSWERS_PATH, AnswerStore, PrecomputedAnswer, query_signature
+from cache import prompt_version
+from logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_TOP_N = 50
+DEFAULT_CONCURRENCY = 4
+DEFAULT_SIMILARITY = 0.75
+RANK_BY = ("cost", "frequency")
+
+
+@dataclass
+class QueryCluster:
+    """Near-duplicate questions found in the logs.
+
+    Attributes:
+        signature: Signature of the cluster's most frequent variant.
+        variants: Raw question text -> times asked.
+        costs: Raw question text -> cost incurred answering it.
+        signatures: Every signature merged into the cluster.
+        count: Times any variant was asked.
+        total_cost_usd: Cost incurred answering them.
+    """
+
+    signature: str
+    variants: Counter = field(default_factory=Counter)
+    costs: Counter = field(default_factory=Counter)
+    signatures: list[str] = field(default_factory=list)
+    count: int = 0
+    total_cost_usd: float = 0.0
+
+    @property
+    def representative(self) -> str:
+        """Most frequent phrasing of the question."""
+        return self.variants.most_common(1)[0][0]
+
+    def questions(self) -> list[PrecomputedAnswer]:
+        """One (still unanswered) question per distinct signature, most asked first.
+
+        Each gets the signature's most frequent phrasing and the count and
+        cost of the variants sharing that exact signature.
+        """
+        by_signature: dict[str, PrecomputedAnswer] = {}
+        for variant, count in self.variants.most_common():
+            question = by_signature.setdefault(query_signature(variant), PrecomputedAnswer(variant, {}))
+            question.count += count
+            question.total_cost_usd += self.costs[variant]
+        return sorted(by_signature.values(), key=lambda q: q.count, reverse=True)
+
+
+def _open_text(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_query_records(paths: Iterable[Path]) -> Iterator[tuple[str, float]]:
+    """Streams (consulta, estimated_cost_usd) from log files and folders.
+
+    Reads *.json (one record per file), *.jsonl and *.jsonl.gz (one record per
+    line). Records without a query or metrics (failed queries) are skipped.
+    """
+    for path in paths:
+        if path.is_dir():
+            files = [f for pattern in ("*.json", "*.jsonl", "*.jsonl.gz") for f in sorted(path.glob(pattern))]
+        else:
+            files = [path]
+        for file in files:
+            try:
+                with _open_text(file) as f:
+                    lines = [f.read()] if file.suffix == ".json" else f
+                    for line in lines:
+                        if not line.strip():
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        consulta, metrics = record.get("consulta"), record.get("metrics")
+                        if isinstance(consulta, str) and consulta.strip() and isinstance(metrics, dict):
+                            yield consulta.strip(), float(metrics.get("estimated_cost_usd") or 0.0)
+            except OSError as e:
+                logger.warning("Skipping %s: %s", file, e)
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def cluster_queries(records: Iterable[tuple[str, float]],
+                    similarity: float = DEFAULT_SIMILARITY) -> list[QueryCluster]:
+    """Groups near-duplicate questions.
+
+    Args:
+        records: (consulta, cost) pairs.
+        similarity: Minimum Jaccard overlap between signatures to merge them.
+
+    Returns:
+        Clusters, most frequent first.
+    """
+    by_signature: dict[str, QueryCluster] = {}
+    for consulta, cost in records:
+        signature = query_signature(consulta)
+        if not signature:
+            continue
+        group = by_signature.setdefault(signature, QueryCluster(signature, signatures=[signature]))
+        group.variants[consulta] += 1
+        group.costs[consulta] += cost
+        group.count += 1
+        group.total_cost_usd += cost
+
+    clusters: list[QueryCluster] = []
+    words_of: list[frozenset] = []
+    # Índice invertido palabra -> clusters, para comparar solo contra candidatos con palabras en común
+    by_word: dict[str, list[int]] = {}
+    for group in sorted(by_signature.values(), key=lambda g: g.count, reverse=True):
+        words = frozenset(group.signature.split())
+        candidates = {i for word in words for i in by_word.get(word, ())}
+        best = max(candidates, key=lambda i: _jaccard(words, words_of[i]), default=None)
+        if best is not None and _jaccard(words, words_of[best]) >= similarity:
+            target = clusters[best]
+            target.variants.update(group.variants)
+            target.costs.update(group.costs)
+            target.signatures.append(group.signature)
+            target.count += group.count
+            target.total_cost_usd += group.total_cost_usd
+            continue
+        clusters.append(group)
+        words_of.append(words)
+        for word in words:
+            by_word.setdefault(word, []).append(len(clusters) - 1)
+    return sorted(clusters, key=lambda c: c.count, reverse=True)
+
+
+def rank_clusters(clusters: list[QueryCluster], top_n: int = DEFAULT_TOP_N, by: str = "cost") -> list[QueryCluster]:
+    """Top clusters by cost incurred (ties broken by frequency) or by frequency."""
+    if by == "cost":
+        key = lambda c: (c.total_cost_usd, c.count)
+    elif by == "frequency":
+        key = lambda c: (c.count, c.total_cost_usd)
+    else:
+        raise ValueError(f"Unknown ranking {by!r}, expected one of {RANK_BY}")
+    return sorted(clusters, key=key, reverse=True)[:top_n]
+
+
+def precompute_answers(clusters: list[QueryCluster], answer: Callable[[str], dict | None],
+                       concurrency: int = DEFAULT_CONCURRENCY) -> list[PrecomputedAnswer]:
+    """Answers every distinct signature of the clusters with bounded concurrency.
+
+    Args:
+        clusters: Clusters to answer, in rank order.
+        answer: Returns the answer for a question, or None if it failed.
+        concurrency: Questions answered at the same time.
+
+    Returns:
+        Answers of the questions that succeeded, in rank order.
+    """
+    questions = [q for cluster in clusters for q in cluster.questions()]
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cache-warming") as pool:
+        results = list(pool.map(lambda q: answer(q.query), questions))
+    precomputed = []
+    for question, respuesta in zip(questions, results):
+        if respuesta is None:
+            logger.warning("Sin respuesta para '%s': no se precalcula", question.query)
+            continue
+        question.respuesta = respuesta
+        precomputed.append(question)
+    return precomputed
+
+
+def parse_window(text: str) -> tuple[int, int]:
+    """Parses an off-peak window "22-6" into (start hour, end hour)."""
+    start, end = (int(part) for part in text.split("-"))
+    if not (0 <= start < 24 and 0 <= end < 24):
+        raise ValueError(f"Invalid off-peak window {text!r}")
+    return start, end
+
+
+def seconds_until_window(window: tuple[int, int], now: datetime) -> float:
+    """Seconds until the off-peak window opens (0 when already inside it)."""
+    start, end = window
+    hour = now.hour
+    inside = start <= hour < end if start < end else hour >= start or hour < end
+    if inside or start == end:
+        return 0.0
+    opens = now.replace(hour=start, minute=0, second=0, microsecond=0)
+    if opens <= now:
+        opens += timedelta(days=1)
+    return (opens - now).total_seconds()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precalcula respuestas para las consultas más frecuentes de los logs.")
+    parser.add_argument("paths", nargs="+", type=Path, help="Archivos o carpetas de logs (.json, .jsonl, .jsonl.gz)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_N, help="Cantidad de clusters a precalcular")
+    parser.add_argument("--rank-by", choices=RANK_BY, default="cost",
+                        help="cost: costo incurrido por el cluster; frequency: cantidad de consultas")
+    parser.add_argument("--similarity", type=float, default=DEFAULT_SIMILARITY,
+                        help="Solapamiento mínimo (Jaccard) para agrupar consultas parecidas")
+    parser.add_argument("--model", default="gpt-5-mini")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--off-peak", type=parse_window, default=None,
+                        help="Esperar a la ventana de baja demanda, en horas (ej. 22-6)")
+    parser.add_argument("-o", "--output", type=Path, default=DEFAULT_ANSWERS_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar el ranking, sin llamar al modelo")
+    args = parser.parse_args()
+
+    clusters = cluster_queries(iter_query_records(args.paths), args.similarity)
+    top = rank_clusters(clusters, args.top, args.rank_by)
+    total = sum(c.count for c in clusters)
+    logger.info("%d consultas en %d clusters; top %d cubre %d consultas ($%.4f)", total, len(clusters), len(top),
+                sum(c.count for c in top), sum(c.total_cost_usd for c in top))
+    for cluster in top:
+        print(f"{cluster.count:6d}  ${cluster.total_cost_usd:9.4f}  {cluster.representative}  "
+              f"({len(cluster.variants)} variantes, {len(cluster.signatures)} a responder)")
+    if args.dry_run or not top:
+        return
+
+    if args.off_peak:
+        wait = seconds_until_window(args.off_peak, datetime.now())
+        if wait:
+            logger.info("Esperando la ventana de baja demanda (%.1f h)", wait / 3600)
+            time.sleep(wait)
+
+    from bank_kb import BANK_KB
+    from retrieval import load_or_build_index
+    from run_query import OpenAIModels, build_system_prompt, create_client, get_completion
+
+    client = create_client()
+    model = OpenAIModels(args.model)
+    kb_index = load_or_build_index(BANK_KB)
+
+    def answer(consulta: str) -> dict | None:
+        system_prompt, _ = build_system_prompt(consulta, kb_index)
+        result = get_completion(system_prompt, consulta, model, client, context="SoporteCliente_warming")
+        if isinstance(result, str):
+            logger.error(result)
+            return None
+        return result[0]
+
+    start = time.time()
+    precomputed = precompute_answers(top, answer, args.concurrency)
+    store = AnswerStore(prompt_version(), precomputed, model.value)
+    store.save(args.output)
+    logger.info("%d respuestas precalculadas (%d variantes) en %.1fs, guardadas en %s (versión %s)",
+                len(precomputed), len(store), time.time() - start, args.output, store.version)
+
+
+if __name__ == "__main__":
+    main()
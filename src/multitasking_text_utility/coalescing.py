@@ -0,0 +1,155 @@
+"""Single-flight coalescing of identical in-flight requests.
+
+During an outage or a campaign many agents ask the same question within
+seconds, and each one used to pay for its own ~20 s completion. SingleFlight
+lets the first caller for a key (the leader) run the call while every
+identical request that arrives before it finishes (a follower) waits for the
+same result, or the same exception:
+
+- keys are cache.cache_key(model, system prompt, query): model, prompt
+  version and normalized query, so "¿Horario de corte?" and
+  "horario de corte" share a call
+- do() serves threaded callers (server, session) and do_async() asyncio
+  callers (batch); both kinds can join the same flight
+- once the leader finishes the key is released, so later requests start a new
+  call (coalescing is not a cache)
+
+Followers receive a deep copy of the result, so callers can mutate their
+answer without affecting each other.
+"""
+
+import asyncio
+import copy
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class SingleFlightStats:
+    """Counters of a SingleFlight.
+
+    Attributes:
+        leaders: Calls actually executed.
+        coalesced: Requests served by another caller's in-flight call
+            (i.e. calls saved).
+    """
+
+    leaders: int = 0
+    coalesced: int = 0
+
+    @property
+    def saved_ratio(self) -> float:
+        total = self.leaders + self.coalesced
+        return self.coalesced / total if total else 0.0
+
+
+@dataclass(frozen=True)
+class Flight:
+    """How a request was served.
+
+    Attributes:
+        leader: True for the caller that executed the call.
+        followers: Requests that shared the leader's call (only known by the
+            leader; 0 for followers).
+    """
+
+    leader: bool
+    followers: int = 0
+
+
+class _Call:
+    __slots__ = ("future", "followers")
+
+    def __init__(self):
+        self.future: Future = Future()
+        self.followers = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its outcome.
+
+    Examples:
+        >>> flights = SingleFlight()
+        >>> result, flight = flights.do(key, lambda: call_model(query))
+        >>> result, flight = await flights.do_async(key, lambda: call_model_async(query))
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.stats = SingleFlightStats()
+
+    def _join(self, key: str) -> tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.stats.coalesced += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.stats.leaders += 1
+            return call, True
+
+    def _finish(self, key: str, call: _Call, result=None, error: BaseException | None = None) -> int:
+        with self._lock:
+            # Se libera la clave antes de publicar el resultado: nadie más se suma a este vuelo
+            del self._calls[key]
+            followers = call.followers
+        if error is not None:
+            call.future.set_exception(error)
+        else:
+            call.future.set_result(result)
+        if followers:
+            logger.debug("Single-flight: %d requests shared one call", followers)
+        return followers
+
+    def in_flight(self) -> int:
+        """Number of keys with a call in progress."""
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key: str, fn: Callable[[], T]) -> tuple[T, Flight]:
+        """Runs fn, or waits for the identical call already in flight.
+
+        Args:
+            key: Request key (see cache.cache_key).
+            fn: The call to run if no identical call is in flight.
+
+        Returns:
+            Tuple of (result, Flight).
+
+        Raises:
+            Exception: Whatever fn raised, for the leader and every follower.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            return copy.deepcopy(call.future.result()), Flight(leader=False)
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        return result, Flight(leader=True, followers=self._finish(key, call, result))
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, Flight]:
+        """Async counterpart of do(): fn returns an awaitable.
+
+        Followers wait without blocking the event loop. If the leader is
+        cancelled, its followers receive the CancelledError too.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            return copy.deepcopy(await asyncio.wrap_future(call.future)), Flight(leader=False)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        return result, Flight(leader=True, followers=self._finish(key, call, result))
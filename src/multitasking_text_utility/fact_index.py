@@ -0,0 +1,207 @@
+"""Deterministic fast path: structured fact index over the knowledge base.
+
+Many agent queries are direct lookups ("monto máximo de transferencia",
+"horario de corte", "comisión de cuenta corriente") whose answer is literally
+one "- Atributo: valor" bullet of BANK_KB. This module parses those bullets
+into a section -> attribute -> value index and answers such queries in
+microseconds, without calling a model, in the same shape get_completion
+returns ({"respuesta", "indicador_de_confianza", "acciones_recomendadas"}).
+
+Matching is conservative, ambiguous queries go to the model:
+
+- queries and facts are normalized the same way (accents, case, plurals) and
+  Spanish synonyms are folded ("tope"/"límite" -> "máximo", "costo" -> "comisión")
+- a fact matches when its section title and attribute account for every
+  content word of the query, and at least one attribute word was mentioned
+- there must be exactly one best fact: "monto máximo" alone matches both
+  Transferencias Nacionales and Préstamos Personales, so it goes to the model,
+  while "monto máximo de transferencia" names the section and is answered
+"""
+
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from bank_kb import BANK_KB
+from retrieval import KBSection, parse_sections
+from text_normalization import tokenize
+
+# Bullets "- Atributo: valor" (": " evita partir horarios como 18:00)
+_FACT_BULLET = re.compile(r"^-\s*([^:]+?):\s+(.+)$")
+
+# Sinónimos frecuentes en las consultas, plegados a la palabra que usa la KB (ya normalizados)
+SYNONYMS = {
+    "tope": "maximo",
+    "limite": "maximo",
+    "max": "maximo",
+    "maxima": "maximo",
+    "min": "minimo",
+    "minima": "minimo",
+    "costo": "comision",
+    "cargo": "comision",
+    "arancel": "comision",
+    "interes": "tasa",
+    "hora": "horario",
+    "transferir": "transferencia",
+    "demora": "tiempo",
+    "tarda": "tiempo",
+    "vigencia": "validez",
+    "duracion": "validez",
+    "dura": "validez",
+    "extraer": "extraccion",
+    "retirar": "extraccion",
+    "retiro": "extraccion",
+}
+
+FAST_PATH_CONFIDENCE = 1.0
+
+
+def fact_tokens(text: str) -> frozenset[str]:
+    """Normalized content words of a text with synonyms folded."""
+    return frozenset(SYNONYMS.get(token, token) for token in tokenize(text))
+
+
+@dataclass(frozen=True)
+class Fact:
+    """One "- Atributo: valor" bullet of the knowledge base.
+
+    Attributes:
+        section_id: KB section number (e.g., "10").
+        section_title: Section title (e.g., "Cuenta Corriente").
+        attribute: Text before the colon (e.g., "Comisión de cuenta corriente").
+        value: Text after the colon (e.g., "$8.000.").
+    """
+
+    section_id: str
+    section_title: str
+    attribute: str
+    value: str
+
+
+@dataclass
+class FactIndexStats:
+    """Lookup counters of a FactIndex."""
+
+    lookups: int = 0
+    hits: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+@dataclass(frozen=True)
+class FactMatch:
+    """A fact that answers a query.
+
+    Attributes:
+        fact: The matching fact.
+        coverage: Fraction of the query's content words explained by the
+            section title and attribute (1.0 for a fast-path answer).
+    """
+
+    fact: Fact
+    coverage: float
+
+
+class FactIndex:
+    """Section -> attribute -> value index with keyword/synonym lookup.
+
+    Args:
+        facts: Facts parsed from the knowledge base.
+
+    Examples:
+        >>> index = FactIndex.from_kb(BANK_KB)
+        >>> index.answer("Horario de corte")["respuesta"]
+        'Horario de corte (Transferencias Nacionales): 18:00.'
+    """
+
+    def __init__(self, facts: list[Fact]):
+        self.facts = facts
+        self.stats = FactIndexStats()
+        self._stats_lock = threading.Lock()
+        self.sections: dict[str, dict[str, str]] = {}
+        for fact in facts:
+            self.sections.setdefault(fact.section_title, {})[fact.attribute] = fact.value
+        self._tokens = [(fact, fact_tokens(fact.section_title), fact_tokens(fact.attribute)) for fact in facts]
+
+    @classmethod
+    def from_kb(cls, kb: str = BANK_KB) -> "FactIndex":
+        """Parses the "- Atributo: valor" bullets of every KB section."""
+        _, sections = parse_sections(kb)
+        return cls.from_sections(sections)
+
+    @classmethod
+    def from_sections(cls, sections: list[KBSection]) -> "FactIndex":
+        """Parses the "- Atributo: valor" bullets of already parsed sections."""
+        facts = []
+        for section in sections:
+            for line in section.text.splitlines():
+                match = _FACT_BULLET.match(line.strip())
+                if match:
+                    facts.append(Fact(section.id, section.title, match.group(1).strip(), match.group(2).strip()))
+        return cls(facts)
+
+    def match(self, query: str) -> FactMatch | None:
+        """Finds the single fact that fully explains the query.
+
+        Args:
+            query: Agent query.
+
+        Returns:
+            FactMatch, or None when no fact explains every content word of
+            the query or several facts do equally well.
+        """
+        query_tokens = fact_tokens(query)
+        if not query_tokens:
+            return None
+
+        scored = []
+        for fact, title_tokens, attribute_tokens in self._tokens:
+            title_hits = query_tokens & title_tokens
+            attribute_hits = (query_tokens - title_hits) & attribute_tokens
+            if not attribute_hits:
+                continue
+            coverage = (len(title_hits) + len(attribute_hits)) / len(query_tokens)
+            scored.append((coverage, len(title_hits), fact))
+        if not scored:
+            return None
+
+        scored.sort(key=lambda s: (s[0], s[1]), reverse=True)
+        best_coverage, best_title_hits, best = scored[0]
+        if best_coverage < 1.0:
+            return None
+        # Otro hecho igual de explicado y sin más pistas de sección: la consulta es ambigua
+        if len(scored) > 1 and scored[1][:2] == (best_coverage, best_title_hits):
+            return None
+        return FactMatch(best, best_coverage)
+
+    def answer(self, query: str) -> dict | None:
+        """Answers a direct lookup in get_completion's response shape.
+
+        Args:
+            query: Agent query.
+
+        Returns:
+            {"respuesta", "indicador_de_confianza", "acciones_recomendadas"},
+            or None when the query must go to the model.
+        """
+        match = self.match(query)
+        with self._stats_lock:
+            self.stats.lookups += 1
+            self.stats.hits += match is not None
+        if match is None:
+            return None
+        fact = match.fact
+        return {
+            "respuesta": f"{fact.attribute} ({fact.section_title}): {fact.value}",
+            "indicador_de_confianza": FAST_PATH_CONFIDENCE,
+            "acciones_recomendadas": [f"Informar al cliente: {fact.attribute.lower()} {fact.value}"],
+        }
+
+    def timed_answer(self, query: str) -> tuple[dict | None, float]:
+        """Like answer(), also returning the lookup time in seconds."""
+        start = time.perf_counter()
+        result = self.answer(query)
+        return result, time.perf_counter() - start
@@ -0,0 +1,251 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Used by tests (and handy for manual runs) to exercise the real OpenAI client
+end to end — HTTP, connection pooling, JSON decoding — without network
+access or cost. Point a client at it with:
+
+    client = OpenAI(api_key="test", base_url=server.base_url)
+
+POST /v1/chat/completions is implemented, plus the minimal Files and Batch
+endpoints used by bulk_eval (upload a JSONL, create a batch, poll it, download
+the output file). The answer content, the latency distribution (log-normal
+around a median) and the completion token distribution are configurable, so
+benchmarks can reproduce the shape of the real API (e.g. gpt-5-mini: ~15 s
+median, 1,000-2,500 completion tokens).
+"""
+
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = json.dumps({
+    "respuesta": "Comisión de cuenta corriente: $8.000.",
+    "confianza": 0.95,
+    "acciones_recomendadas": ["Informar al cliente la comisión mensual."],
+}, ensure_ascii=False)
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server that mimics the chat completions endpoint.
+
+    Attributes:
+        content: Assistant message content returned for every request.
+        latency_seconds: Median artificial delay before each response.
+        latency_sigma: Sigma of the log-normal latency distribution (0 = fixed).
+        completion_tokens: Median completion tokens reported in usage
+            (None = derived from the content length).
+        completion_tokens_sigma: Sigma of the log-normal token distribution.
+        requests: Bodies of the requests received, in arrival order.
+        latencies: Simulated latency applied to each request, in arrival order.
+        files: Uploaded and generated files by id (raw bytes).
+        batches: Batch objects by id. A batch is created "in_progress" and
+            completes (all its requests answered, no artificial latency) the
+            first time it is retrieved.
+
+    Examples:
+        >>> with FakeOpenAIServer(latency_seconds=0.05) as server:
+        ...     client = OpenAI(api_key="test", base_url=server.base_url)
+        ...     client.chat.completions.create(model="gpt-5-mini", messages=[...])
+    """
+
+    def __init__(self, content: str = DEFAULT_CONTENT, latency_seconds: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, latency_sigma: float = 0.0,
+                 completion_tokens: int | None = None, completion_tokens_sigma: float = 0.0,
+                 seed: int | None = None):
+        self.content = content
+        self.latency_seconds = latency_seconds
+        self.latency_sigma = latency_sigma
+        self.completion_tokens = completion_tokens
+        self.completion_tokens_sigma = completion_tokens_sigma
+        self.requests: list[dict] = []
+        self.latencies: list[float] = []
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _sample(self, median: float, sigma: float) -> float:
+        if sigma <= 0 or median <= 0:
+            return median
+        with self._lock:
+            return self._random.lognormvariate(0.0, sigma) * median
+
+    def next_latency(self) -> float:
+        """Draws the simulated latency for a request and records it."""
+        latency = self._sample(self.latency_seconds, self.latency_sigma)
+        with self._lock:
+            self.latencies.append(latency)
+        return latency
+
+    def completion_payload(self, body: dict) -> dict:
+        """Builds the chat.completion response for a request body."""
+        prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+        prompt_tokens = max(1, prompt_chars // 4)
+        if self.completion_tokens is None:
+            completion_tokens = max(1, len(self.content) // 4)
+        else:
+            completion_tokens = max(1, round(self._sample(self.completion_tokens, self.completion_tokens_sigma)))
+        return {
+            "id": f"chatcmpl-fake-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "unknown"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def upload_file(self, filename: str, data: bytes, purpose: str) -> dict:
+        """Stores an uploaded file and returns its file object."""
+        with self._lock:
+            file_id = f"file-fake-{len(self.files) + 1}"
+            self.files[file_id] = data
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def create_batch(self, body: dict) -> dict:
+        """Registers a batch over an uploaded JSONL file."""
+        with self._lock:
+            batch_id = f"batch_fake_{len(self.batches) + 1}"
+            batch = {
+                "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+                "input_file_id": body.get("input_file_id"),
+                "completion_window": body.get("completion_window", "24h"),
+                "status": "in_progress", "created_at": int(time.time()),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            self.batches[batch_id] = batch
+        return batch
+
+    def retrieve_batch(self, batch_id: str) -> dict | None:
+        """Returns a batch, answering all its requests on the first retrieval."""
+        batch = self.batches.get(batch_id)
+        if batch is None or batch["status"] != "in_progress":
+            return batch
+        lines = self.files.get(batch["input_file_id"], b"").decode("utf-8").splitlines()
+        output = []
+        for i, line in enumerate(l for l in lines if l.strip()):
+            request = json.loads(line)
+            with self._lock:
+                self.requests.append(request["body"])
+            output.append({
+                "id": f"batch_req_{i}", "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": f"req_{i}",
+                             "body": self.completion_payload(request["body"])},
+                "error": None,
+            })
+        data = "".join(json.dumps(o, ensure_ascii=False) + "\n" for o in output).encode("utf-8")
+        output_file = self.upload_file(f"{batch_id}_output.jsonl", data, "batch_output")
+        batch.update(status="completed", output_file_id=output_file["id"], completed_at=int(time.time()),
+                     request_counts={"total": len(output), "completed": len(output), "failed": 0})
+        return batch
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length)
+                path = self.path.rstrip("/")
+                if path == "/v1/files":
+                    self._send(200, self._upload(raw))
+                    return
+                body = json.loads(raw or b"{}")
+                if path == "/v1/batches":
+                    self._send(200, server.create_batch(body))
+                    return
+                if path != "/v1/chat/completions":
+                    self._not_found()
+                    return
+                with server._lock:
+                    server.requests.append(body)
+                latency = server.next_latency()
+                if latency:
+                    time.sleep(latency)
+                self._send(200, server.completion_payload(body))
+
+            def do_GET(self):
+                parts = self.path.rstrip("/").split("/")
+                if parts[:3] == ["", "v1", "batches"] and len(parts) == 4:
+                    batch = server.retrieve_batch(parts[3])
+                    if batch is None:
+                        self._not_found()
+                    else:
+                        self._send(200, batch)
+                elif parts[:3] == ["", "v1", "files"] and len(parts) == 5 and parts[4] == "content":
+                    data = server.files.get(parts[3])
+                    if data is None:
+                        self._not_found()
+                    else:
+                        self._send_bytes(200, data, "application/octet-stream")
+                else:
+                    self._not_found()
+
+            def _upload(self, raw: bytes) -> dict:
+                # multipart/form-data con los campos "purpose" y "file"
+                message = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + raw)
+                fields = {part.get_param("name", header="content-disposition"): part
+                          for part in message.iter_parts()}
+                file_part = fields["file"]
+                return server.upload_file(file_part.get_filename() or "upload.jsonl",
+                                          file_part.get_payload(decode=True),
+                                          fields["purpose"].get_payload(decode=True).decode("utf-8"))
+
+            def _not_found(self):
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def _send(self, status: int, payload: dict):
+                self._send_bytes(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+            def _send_bytes(self, status: int, data: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self) -> "FakeOpenAIServer":
+        """Starts serving in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server and releases the port."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
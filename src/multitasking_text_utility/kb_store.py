@@ -0,0 +1,263 @@
+"""File-backed, hot-reloadable knowledge base.
+
+BANK_KB is a Python string: any policy change needs a deploy and a restart,
+and it does not scale past a handful of pages. KBStore reads the knowledge
+base from a directory of Markdown/text documents instead:
+
+- each document is split into sections: the numbered emoji headers BANK_KB
+  uses ("1️⃣ Transferencias Nacionales") or Markdown headings ("## Seguros");
+  a document without headers is a single section
+- every file keeps its (mtime, size) and a content hash; large files are
+  hashed and decoded through a memory map instead of being read into a bytes
+  buffer first
+- refresh() only re-parses the files whose content changed, and only
+  re-tokenizes the sections whose content hash is new; the BM25 index and the
+  fact index are then rebuilt from the cached term frequencies
+- watch() polls the directory in a background thread while the process keeps
+  serving
+
+Each change publishes a new immutable KBSnapshot (version + 1) with a single
+reference swap, so a request reads either the old or the new KB, never a
+mix. Subscribers (prompt composition, response caches) are notified with the
+new snapshot; snapshot.prompt_version is the cache version to switch to.
+"""
+
+import hashlib
+import logging
+import mmap
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from cache import prompt_version
+from fact_index import FactIndex
+from prompts import BANK_ASSISTANT_SYSTEM_PROMPT, ONE_SHOT_EXAMPLE
+from retrieval import BM25Index, KBSection, parse_sections, section_term_freqs
+
+logger = logging.getLogger(__name__)
+
+KB_FILE_SUFFIXES = (".md", ".markdown", ".txt")
+# A partir de este tamaño los archivos se leen con mmap
+MMAP_THRESHOLD_BYTES = 1024 * 1024
+DEFAULT_WATCH_INTERVAL_SECONDS = 2.0
+KB_PREAMBLE = "BASE DE CONOCIMIENTO"
+
+_MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*$")
+
+
+@dataclass(frozen=True)
+class KBSnapshot:
+    """An immutable version of the knowledge base.
+
+    Attributes:
+        version: Increases by one on every change.
+        kb: Composed KB text (preamble and every section, in file order).
+        index: BM25 index over the sections.
+        fact_index: Fact index over the sections.
+        prompt_version: Cache version for this KB (see cache.prompt_version).
+    """
+
+    version: int
+    kb: str
+    index: BM25Index
+    fact_index: FactIndex
+    prompt_version: str
+
+
+@dataclass
+class _FileState:
+    mtime_ns: int
+    size: int
+    digest: str
+    sections: list[KBSection] = field(default_factory=list)
+
+
+def _section_hash(section: KBSection) -> str:
+    return hashlib.sha256(f"{section.id}\x00{section.title}\x00{section.text}".encode("utf-8")).hexdigest()
+
+
+def read_document(path: Path, size: int, mmap_threshold: int = MMAP_THRESHOLD_BYTES) -> tuple[str, str]:
+    """Reads a document, memory-mapping it when it is large.
+
+    Args:
+        path: Document path.
+        size: File size in bytes.
+        mmap_threshold: Size from which the file is memory-mapped.
+
+    Returns:
+        Tuple of (content hash, decoded text).
+    """
+    with open(path, "rb") as f:
+        if size < mmap_threshold or size == 0:
+            data = f.read()
+            return hashlib.sha256(data).hexdigest(), data.decode("utf-8")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # hashlib y str() leen el buffer del mmap directamente, sin una copia intermedia en bytes
+            return hashlib.sha256(mapped).hexdigest(), str(mapped, "utf-8")
+
+
+def split_document(text: str, name: str) -> list[KBSection]:
+    """Splits a document into KB sections.
+
+    Args:
+        text: Document text.
+        name: Document name (file stem), used for the ids of Markdown
+            sections ("seguros-1") and as the title of header-less documents.
+
+    Returns:
+        Sections in document order.
+    """
+    _, sections = parse_sections(text)
+    if sections:
+        return sections
+
+    sections: list[KBSection] = []
+    current: tuple[str, list[str]] | None = None
+    for line in text.strip().splitlines():
+        match = _MARKDOWN_HEADING.match(line.strip())
+        if match:
+            if current:
+                sections.append(KBSection(f"{name}-{len(sections) + 1}", current[0], "\n".join(current[1]).strip()))
+            current = (match.group(1), [line])
+        elif current:
+            current[1].append(line)
+    if current:
+        sections.append(KBSection(f"{name}-{len(sections) + 1}", current[0], "\n".join(current[1]).strip()))
+    if not sections and text.strip():
+        sections.append(KBSection(name, name.replace("_", " "), text.strip()))
+    return sections
+
+
+class KBStore:
+    """Knowledge base loaded from a directory and reloaded when it changes.
+
+    Args:
+        directory: Folder with .md/.markdown/.txt documents (read recursively,
+            in path order).
+        mmap_threshold: Size from which documents are memory-mapped.
+
+    Examples:
+        >>> store = KBStore(Path("kb/"))
+        >>> store.subscribe(lambda snapshot: cache.set_version(snapshot.prompt_version))
+        >>> store.watch()
+        >>> store.snapshot.index.retrieve("horario de corte")
+    """
+
+    def __init__(self, directory: Path, mmap_threshold: int = MMAP_THRESHOLD_BYTES):
+        self.directory = Path(directory)
+        self.mmap_threshold = mmap_threshold
+        self._files: dict[Path, _FileState] = {}
+        self._term_freqs: dict[str, dict[str, int]] = {}
+        self._subscribers: list[Callable[[KBSnapshot], None]] = []
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self._snapshot: KBSnapshot | None = None
+        # Contadores de la última recarga (para logs y tests)
+        self.last_reparsed_files = 0
+        self.last_reindexed_sections = 0
+        self.refresh()
+
+    @property
+    def snapshot(self) -> KBSnapshot:
+        """Current KB version (read it once per request)."""
+        return self._snapshot
+
+    def subscribe(self, callback: Callable[[KBSnapshot], None]) -> None:
+        """Registers a callback invoked with every new snapshot."""
+        self._subscribers.append(callback)
+
+    def _documents(self) -> list[Path]:
+        return sorted(p for p in self.directory.rglob("*") if p.is_file() and p.suffix.lower() in KB_FILE_SUFFIXES)
+
+    def refresh(self) -> bool:
+        """Reloads the documents that changed since the last call.
+
+        Returns:
+            True when the KB changed and a new snapshot was published.
+        """
+        with self._refresh_lock:
+            files: dict[Path, _FileState] = {}
+            reparsed = 0
+            for path in self._documents():
+                stat = path.stat()
+                previous = self._files.get(path)
+                if previous and (previous.mtime_ns, previous.size) == (stat.st_mtime_ns, stat.st_size):
+                    files[path] = previous
+                    continue
+                digest, text = read_document(path, stat.st_size, self.mmap_threshold)
+                if previous and previous.digest == digest:
+                    # Solo cambió el mtime (touch): se conservan las secciones
+                    files[path] = _FileState(stat.st_mtime_ns, stat.st_size, digest, previous.sections)
+                    continue
+                files[path] = _FileState(stat.st_mtime_ns, stat.st_size, digest, split_document(text, path.stem))
+                reparsed += 1
+
+            removed = set(self._files) - set(files)
+            self._files = files
+            if self._snapshot is not None and not reparsed and not removed:
+                return False
+            self._publish(reparsed)
+            snapshot = self._snapshot
+        for callback in self._subscribers:
+            callback(snapshot)
+        return True
+
+    def _publish(self, reparsed: int) -> None:
+        sections, seen_ids = [], set()
+        for path, state in self._files.items():
+            for section in state.sections:
+                # Dos documentos con la misma numeración: el id se califica con el nombre del archivo
+                if section.id in seen_ids:
+                    section = KBSection(f"{path.stem}/{section.id}", section.title, section.text)
+                seen_ids.add(section.id)
+                sections.append(section)
+
+        term_freqs, reindexed = [], 0
+        current_hashes = set()
+        for section in sections:
+            key = _section_hash(section)
+            current_hashes.add(key)
+            if key not in self._term_freqs:
+                self._term_freqs[key] = section_term_freqs(section)
+                reindexed += 1
+            term_freqs.append(self._term_freqs[key])
+        # Se descartan las frecuencias de secciones que ya no existen
+        self._term_freqs = {k: v for k, v in self._term_freqs.items() if k in current_hashes}
+
+        kb = "\n\n".join([KB_PREAMBLE] + [s.text for s in sections])
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        self._snapshot = KBSnapshot(
+            version=version,
+            kb=kb,
+            index=BM25Index.from_sections(kb, KB_PREAMBLE, sections, term_freqs),
+            fact_index=FactIndex.from_sections(sections),
+            prompt_version=prompt_version(BANK_ASSISTANT_SYSTEM_PROMPT, ONE_SHOT_EXAMPLE, kb),
+        )
+        self.last_reparsed_files, self.last_reindexed_sections = reparsed, reindexed
+        logger.info("KB v%d: %d sections from %d files (%d files re-parsed, %d sections re-indexed)",
+                    version, len(sections), len(self._files), reparsed, reindexed)
+
+    def watch(self, interval: float = DEFAULT_WATCH_INTERVAL_SECONDS) -> threading.Thread:
+        """Polls the directory for changes in a background thread."""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except (OSError, UnicodeDecodeError) as e:
+                    # Un archivo a medio escribir no debe cortar el servicio: se reintenta en la próxima vuelta
+                    logger.warning("KB reload failed: %s: %s", type(e).__name__, e)
+
+        self._stop.clear()
+        self._watcher = threading.Thread(target=run, name="kb-watcher", daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def stop(self) -> None:
+        """Stops the watcher thread."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
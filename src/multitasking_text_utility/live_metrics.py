@@ -0,0 +1,375 @@
+"""In-process rolling latency/cost histograms with a Prometheus endpoint.
+
+Metrics records are written to the JSONL log and thrown away, so p99 latency
+or the spend rate are only known after post-processing the logs. LiveMetrics
+keeps them in memory, per (model, context):
+
+- each answered query is reduced to a Sample (a __slots__ record) and
+  recorded into fixed-bucket histograms for latency, time to first token,
+  prompt/completion tokens and cost
+- the buckets are HDR-style: every power of two is split in SUB_BUCKETS
+  linear steps, so quantiles have a bounded relative error (~1/SUB_BUCKETS)
+  and recording is a bisect plus an increment in an array of counters
+- each histogram is kept over rolling 1-minute and 1-hour windows: a ring
+  of per-slot histograms, where a slot is reset when its time comes round
+  again and a window's snapshot merges the slots inside it
+- render_prometheus() writes the text exposition format: per-window
+  summaries (p50/p90/p99, sum, count), the spend rate in USD/hour and
+  lifetime counters, to alert on p99 latency and spend in real time
+
+serve_metrics() exposes it on a local port (server.py also serves it at
+GET /metrics).
+
+Usage:
+    >>> live = get_live_metrics()
+    >>> live.observe(metrics)
+    >>> print(live.render_prometheus())
+"""
+
+import logging
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+SUB_BUCKETS = 8
+QUANTILES = (0.5, 0.9, 0.99)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRIC_PREFIX = "assistant"
+
+
+def log_linear_bounds(lowest: float, highest: float, sub_buckets: int = SUB_BUCKETS) -> tuple[float, ...]:
+    """Upper bounds of HDR-style buckets covering [lowest, highest].
+
+    Examples:
+        >>> log_linear_bounds(1, 8, sub_buckets=2)
+        (1, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0)
+    """
+    bounds = [lowest]
+    base = lowest
+    while bounds[-1] < highest:
+        bounds.extend(base * (1 + k / sub_buckets) for k in range(1, sub_buckets + 1))
+        base *= 2
+    return tuple(bounds)
+
+
+@dataclass(frozen=True)
+class HistogramSpec:
+    """A tracked value: its Sample attribute, Prometheus name and buckets."""
+
+    attribute: str
+    name: str
+    help: str
+    bounds: tuple[float, ...]
+
+
+HISTOGRAMS = (
+    HistogramSpec("latency", "latency_seconds", "Latencia de punta a punta de la consulta",
+                  log_linear_bounds(0.001, 300.0)),
+    HistogramSpec("ttft", "time_to_first_token_seconds", "Tiempo hasta el primer token (streaming)",
+                  log_linear_bounds(0.001, 300.0)),
+    HistogramSpec("prompt_tokens", "prompt_tokens", "Tokens de entrada por consulta",
+                  log_linear_bounds(1, 1_000_000)),
+    HistogramSpec("completion_tokens", "completion_tokens", "Tokens de salida por consulta",
+                  log_linear_bounds(1, 1_000_000)),
+    HistogramSpec("cost", "cost_usd", "Costo estimado por consulta en USD",
+                  log_linear_bounds(1e-6, 10.0)),
+)
+
+# (nombre, segundos de la ventana, cantidad de slots)
+WINDOWS = (("1m", 60, 12), ("1h", 3600, 60))
+
+
+class Sample:
+    """Compact record of one answered query."""
+
+    __slots__ = ("model", "context", "latency", "ttft", "prompt_tokens", "completion_tokens", "cost")
+
+    def __init__(self, model: str, context: str, latency: float, ttft: float | None,
+                 prompt_tokens: int, completion_tokens: int, cost: float):
+        self.model = model
+        self.context = context
+        self.latency = latency
+        self.ttft = ttft
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cost = cost
+
+    @classmethod
+    def from_metrics(cls, metrics: Metrics) -> "Sample":
+        return cls(str(getattr(metrics.model, "value", metrics.model)), metrics.context or "Unknown",
+                   metrics.latency_seconds, metrics.time_to_first_token_seconds,
+                   metrics.prompt_tokens, metrics.completion_tokens, metrics.estimated_cost_usd)
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts[i] holds values <= bounds[i], the last one the overflow."""
+
+    __slots__ = ("bounds", "counts", "total", "max")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = array("Q", bytes(8 * (len(bounds) + 1)))
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def record(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        counts = self.counts
+        for i, n in enumerate(other.counts):
+            if n:
+                counts[i] += n
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (capped at the max seen)."""
+        count = self.count
+        if not count:
+            return 0.0
+        rank = max(1, math.ceil(q * count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+
+class RollingHistogram:
+    """Histogram over the last window_seconds, kept as a ring of slot histograms.
+
+    Args:
+        bounds: Bucket upper bounds.
+        window_seconds: Length of the window.
+        slots: Slots the window is divided in; the window advances one slot at a time.
+    """
+
+    __slots__ = ("bounds", "slot_seconds", "slots", "_ring", "_epochs")
+
+    def __init__(self, bounds: tuple[float, ...], window_seconds: float, slots: int):
+        self.bounds = bounds
+        self.slot_seconds = window_seconds / slots
+        self.slots = slots
+        self._ring: list[Histogram | None] = [None] * slots
+        self._epochs = array("q", [-1] * slots)
+
+    def record(self, value: float, now: float) -> None:
+        epoch = int(now // self.slot_seconds)
+        i = epoch % self.slots
+        if self._epochs[i] != epoch:
+            # El slot quedó fuera de la ventana: se reutiliza para el período actual
+            self._ring[i] = Histogram(self.bounds)
+            self._epochs[i] = epoch
+        self._ring[i].record(value)
+
+    def snapshot(self, now: float) -> Histogram:
+        """Merged histogram of the slots inside the window ending at now."""
+        epoch = int(now // self.slot_seconds)
+        merged = Histogram(self.bounds)
+        for hist, slot_epoch in zip(self._ring, self._epochs):
+            if hist is not None and epoch - self.slots < slot_epoch <= epoch:
+                merged.merge(hist)
+        return merged
+
+
+class _Series:
+    """Rolling histograms and lifetime counters of one (model, context)."""
+
+    __slots__ = ("windows", "requests", "errors", "cost_total", "prompt_tokens_total", "completion_tokens_total")
+
+    def __init__(self):
+        self.windows = {
+            spec.attribute: {name: RollingHistogram(spec.bounds, seconds, slots) for name, seconds, slots in WINDOWS}
+            for spec in HISTOGRAMS
+        }
+        self.requests = 0
+        self.errors = 0
+        self.cost_total = 0.0
+        self.prompt_tokens_total = 0
+        self.completion_tokens_total = 0
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class LiveMetrics:
+    """Thread-safe rolling aggregator of answered queries.
+
+    Args:
+        clock: Time source in seconds (injectable for tests).
+
+    Examples:
+        >>> live = LiveMetrics()
+        >>> live.observe(metrics)
+        >>> live.quantile("latency", 0.99, model="gpt-5-mini", context="SoporteCliente")
+        21.5
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._series: dict[tuple[str, str], _Series] = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, model: str, context: str) -> _Series:
+        series = self._series.get((model, context))
+        if series is None:
+            series = self._series[(model, context)] = _Series()
+        return series
+
+    def observe(self, metrics: Metrics) -> None:
+        """Records the metrics of an answered query."""
+        self.record(Sample.from_metrics(metrics))
+
+    def record(self, sample: Sample) -> None:
+        now = self.clock()
+        with self._lock:
+            series = self._get_series(sample.model, sample.context)
+            series.requests += 1
+            series.cost_total += sample.cost
+            series.prompt_tokens_total += sample.prompt_tokens
+            series.completion_tokens_total += sample.completion_tokens
+            for attribute, windows in series.windows.items():
+                value = getattr(sample, attribute)
+                if value is None:
+                    continue
+                for rolling in windows.values():
+                    rolling.record(value, now)
+
+    def observe_error(self, model, context: str | None) -> None:
+        """Counts a query that could not be answered."""
+        with self._lock:
+            self._get_series(str(getattr(model, "value", model)), context or "Unknown").errors += 1
+
+    def snapshot(self, attribute: str, window: str, model: str, context: str) -> Histogram:
+        """Histogram of a value over a window ("1m" or "1h") for one series."""
+        now = self.clock()
+        with self._lock:
+            series = self._series.get((model, context))
+            if series is None:
+                return Histogram(next(s.bounds for s in HISTOGRAMS if s.attribute == attribute))
+            return series.windows[attribute][window].snapshot(now)
+
+    def quantile(self, attribute: str, q: float, model: str, context: str, window: str = "1m") -> float:
+        return self.snapshot(attribute, window, model, context).quantile(q)
+
+    def spend_rate(self, model: str, context: str, window: str = "1m") -> float:
+        """Spend over the window, extrapolated to USD per hour."""
+        seconds = next(s for name, s, _ in WINDOWS if name == window)
+        return self.snapshot("cost", window, model, context).total * 3600 / seconds
+
+    def render_prometheus(self) -> str:
+        """Current state in the Prometheus text exposition format."""
+        now = self.clock()
+        with self._lock:
+            items = list(self._series.items())
+            snapshots = {
+                key: {(spec.attribute, name): series.windows[spec.attribute][name].snapshot(now)
+                      for spec in HISTOGRAMS for name, _, _ in WINDOWS}
+                for key, series in items
+            }
+            counters = {key: (series.requests, series.errors, series.cost_total,
+                              series.prompt_tokens_total, series.completion_tokens_total)
+                        for key, series in items}
+
+        lines = []
+
+        def header(name: str, kind: str, help_text: str) -> str:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            return f"{METRIC_PREFIX}_{name}"
+
+        for spec in HISTOGRAMS:
+            name = header(spec.name, "summary", f"{spec.help} (ventanas móviles de 1m y 1h)")
+            for (model, context), by_window in snapshots.items():
+                for window, _, _ in WINDOWS:
+                    hist = by_window[(spec.attribute, window)]
+                    for q in QUANTILES:
+                        labels = _labels(model=model, context=context, window=window, quantile=q)
+                        lines.append(f"{name}{labels} {hist.quantile(q):.6g}")
+                    labels = _labels(model=model, context=context, window=window)
+                    lines.append(f"{name}_sum{labels} {hist.total:.6g}")
+                    lines.append(f"{name}_count{labels} {hist.count}")
+
+        name = header("spend_usd_per_hour", "gauge", "Gasto de la ventana extrapolado a USD por hora")
+        for (model, context), by_window in snapshots.items():
+            for window, seconds, _ in WINDOWS:
+                rate = by_window[("cost", window)].total * 3600 / seconds
+                lines.append(f"{name}{_labels(model=model, context=context, window=window)} {rate:.6g}")
+
+        for index, (metric, help_text) in enumerate((
+                ("requests_total", "Consultas respondidas"),
+                ("errors_total", "Consultas sin respuesta"),
+                ("cost_usd_total", "Costo estimado acumulado en USD"),
+                ("prompt_tokens_total", "Tokens de entrada acumulados"),
+                ("completion_tokens_total", "Tokens de salida acumulados"))):
+            name = header(metric, "counter", help_text)
+            for (model, context), values in counters.items():
+                lines.append(f"{name}{_labels(model=model, context=context)} {values[index]:.10g}")
+        return "\n".join(lines) + "\n"
+
+
+_live_metrics = LiveMetrics()
+
+
+def get_live_metrics() -> LiveMetrics:
+    """Process-wide aggregator shared by the serving paths."""
+    return _live_metrics
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    live: LiveMetrics
+
+    def log_message(self, format, *args):
+        logger.debug("%s - " + format, self.address_string(), *args)
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        data = self.live.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1", live: LiveMetrics | None = None) -> ThreadingHTTPServer:
+    """Serves GET /metrics from a background thread.
+
+    Args:
+        port: Local port (0 picks a free one, see server_address).
+        host: Interface to bind; local only by default.
+        live: Aggregator to expose (the process-wide one by default).
+
+    Returns:
+        The running server; call shutdown() to stop it.
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"live": live or get_live_metrics()})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-endpoint", daemon=True).start()
+    logger.info("Metrics endpoint at http://%s:%d/metrics", host, httpd.server_address[1])
+    return httpd
@@ -3,11 +3,44 @@
 This module provides a colored formatter for console logging that makes
 it easier to scan logs during development and debugging. Colors are applied
 based on log level (DEBUG=cyan, INFO=green, WARNING=yellow, ERROR=red, etc.).
+
+For serving there is a production mode (configure_production_logging, or
+LOG_FORMAT=json in the environment) that keeps logging I/O out of the
+request path:
+
+- loggers get a QueueHandler: the calling thread only enqueues the record,
+  with its message template and arguments still unformatted
+- a QueueListener thread formats and writes the records as JSON lines
+  (timestamp, level, logger, message, thread, trace_id, exception)
+- high-volume loggers can be sampled (LOG_SAMPLE="rate_limiter=0.01"):
+  records below WARNING are kept at that rate, per message template
+- if the queue is full the record is dropped and counted instead of
+  blocking the request
+
+The saving is real but modest, because the listener thread still competes
+with the request threads for the GIL. benchmark.py (bench_logging) measured
+the time the calling thread spends per INFO call on this 1-CPU box:
+~78 us in JSON queue mode vs ~105 us with the console handler when 8
+threads log at once (runs vary 65-105 vs 105-160 us), and ~17 vs ~21 us
+from a single thread. A call below the logger level costs under 1 us,
+and with %-style arguments the message is never formatted in that case,
+so log calls pass arguments instead of pre-formatted f-strings.
 """
 
 from __future__ import annotations
 
+import atexit
+import json
 import logging
+import math
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from tracing import child_span, current_trace_id
 
 
 RESET = "\033[0m"
@@ -19,6 +52,14 @@ LEVEL_COLORS = {
     logging.CRITICAL: "\033[35m",
 }
 
+DEFAULT_LOGGER_NAME = "Soporte al Cliente"
+DEFAULT_QUEUE_SIZE = 10_000
+LOG_FORMAT_ENV = "LOG_FORMAT"
+LOG_SAMPLE_ENV = "LOG_SAMPLE"
+
+_listener: QueueListener | None = None
+_configure_lock = threading.Lock()
+
 
 class ColorFormatter(logging.Formatter):
     """Custom formatter that adds ANSI color codes based on log level.
@@ -36,12 +77,192 @@ class ColorFormatter(logging.Formatter):
         Returns:
             Formatted string with ANSI color codes.
         """
-        color = LEVEL_COLORS.get(record.levelno, "")
-        plain = super().format(record)
-        return f"{color}{plain}{RESET}"
+        with child_span("log_format", level=record.levelname):
+            color = LEVEL_COLORS.get(record.levelno, "")
+            plain = super().format(record)
+            return f"{color}{plain}{RESET}"
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line.
+
+    Keys: ts (UTC, ISO 8601), level, logger, message, thread and, when
+    present, trace_id, sample_rate and exc.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        sample_rate = getattr(record, "sample_rate", None)
+        if sample_rate is not None:
+            entry["sample_rate"] = sample_rate
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records of high-volume loggers.
+
+    Sampling is deterministic and counted per (logger, message template), so
+    a chatty message does not crowd out a rare one of the same logger: with
+    rate 0.01 the 1st, 101st, 201st... record of each template are kept.
+
+    Args:
+        rates: Logger name -> fraction of records to keep (0-1).
+        max_level: Records above this level (warnings and errors by
+            default) are always kept.
+    """
+
+    def __init__(self, rates: dict[str, float], max_level: int = logging.INFO):
+        super().__init__()
+        self.rates = rates
+        self.max_level = max_level
+        self.dropped = 0
+        self._counts: dict[tuple[str, object], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name)
+        if rate is None or rate >= 1 or record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            n = self._counts.get(key, 0)
+            self._counts[key] = n + 1
+            keep = math.floor(n * rate) > math.floor((n - 1) * rate)
+            if not keep:
+                self.dropped += 1
+        if keep:
+            record.sample_rate = rate
+        return keep
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread.
+
+    The stock prepare() formats the message in the calling thread; here the
+    record is enqueued as is (only the current trace id is attached), so
+    message arguments are rendered later and should not be mutated after
+    the call. A full queue drops the record instead of blocking.
+
+    Args:
+        log_queue: Queue read by the listener (a SimpleQueue: no lock
+            contention between request threads).
+        maxsize: Records buffered before new ones are dropped.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, maxsize: int = DEFAULT_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.maxsize = maxsize
+        self.dropped = 0
 
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.trace_id = current_trace_id()
+        return record
 
-def get_logger(name: str = "Soporte al Cliente") -> logging.Logger:
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+def parse_sample_rates(text: str | None) -> dict[str, float]:
+    """Parses "logger=rate,logger=rate" into a dict.
+
+    Examples:
+        >>> parse_sample_rates("rate_limiter=0.01, coalescing=0.1")
+        {'rate_limiter': 0.01, 'coalescing': 0.1}
+    """
+    rates = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        name, _, rate = item.rpartition("=")
+        if not name.strip():
+            raise ValueError(f"Invalid log sample {item!r}, expected logger=rate")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def build_production_handler(stream=None, sample_rates: dict[str, float] | None = None,
+                             queue_size: int = DEFAULT_QUEUE_SIZE) -> tuple[DeferredQueueHandler, QueueListener]:
+    """Creates the queue handler and the (not yet started) listener that writes JSON lines.
+
+    Args:
+        stream: Output stream (stderr by default).
+        sample_rates: Per-logger sampling rates (see SamplingFilter).
+        queue_size: Records buffered before new ones are dropped.
+    """
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+    handler = DeferredQueueHandler(queue.SimpleQueue(), queue_size)
+    if sample_rates:
+        # El muestreo se decide en el hilo que loguea: lo descartado ni siquiera entra a la cola
+        handler.addFilter(SamplingFilter(sample_rates))
+    return handler, QueueListener(handler.queue, output, respect_handler_level=True)
+
+
+def configure_production_logging(level: int = logging.INFO, stream=None,
+                                 sample_rates: dict[str, float] | None = None,
+                                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                                 names: tuple[str, ...] = (DEFAULT_LOGGER_NAME,)) -> QueueListener:
+    """Routes the root logger and the named app loggers through a background JSON writer.
+
+    Replaces their handlers (including the colored console one) with a
+    DeferredQueueHandler. Calling it again stops the previous listener
+    after flushing it.
+
+    Args:
+        level: Level of the configured loggers.
+        stream: Output stream (stderr by default).
+        sample_rates: Per-logger sampling rates (see SamplingFilter).
+        queue_size: Records buffered before new ones are dropped.
+        names: Non-propagating app loggers (get_logger's) to reconfigure.
+
+    Returns:
+        The running listener; stop() flushes the queue (also done at exit).
+
+    Examples:
+        >>> configure_production_logging(sample_rates={"rate_limiter": 0.01})
+        >>> get_logger().info("Consulta respondida en %.2fs", 12.3)
+        # {"ts": "...", "level": "INFO", "logger": "Soporte al Cliente", "message": "Consulta respondida en 12.30s", ...}
+    """
+    global _listener
+    handler, listener = build_production_handler(stream, sample_rates, queue_size)
+    with _configure_lock:
+        root = logging.getLogger()
+        root.handlers[:] = [handler]
+        root.setLevel(level)
+        for name in names:
+            app_logger = logging.getLogger(name)
+            app_logger.handlers[:] = [handler]
+            app_logger.setLevel(level)
+            app_logger.propagate = False
+        previous, _listener = _listener, listener
+    if previous is not None:
+        previous.stop()
+    listener.start()
+    if previous is None:
+        atexit.register(_stop_listener)
+    return listener
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def get_logger(name: str = DEFAULT_LOGGER_NAME) -> logging.Logger:
     """Creates or retrieves a logger with colored console output.
 
     Configures a logger with:
@@ -50,10 +271,12 @@ def get_logger(name: str = "Soporte al Cliente") -> logging.Logger:
     - StreamHandler writing to stderr
     - Format: timestamp | level | name | message
 
-    The logger is configured once and reused on subsequent calls.
+    The logger is configured once and reused on subsequent calls. With
+    LOG_FORMAT=json the production mode is used instead (see
+    configure_production_logging), with sampling rates from LOG_SAMPLE.
 
     Args:
-        name: Logger name (default: "brief_builder").
+        name: Logger name (default: "Soporte al Cliente").
 
     Returns:
         Configured Logger instance.
@@ -67,6 +290,15 @@ def get_logger(name: str = "Soporte al Cliente") -> logging.Logger:
     if logger.handlers:
         return logger
 
+    if os.getenv(LOG_FORMAT_ENV, "").lower() == "json":
+        if _listener is None:
+            configure_production_logging(sample_rates=parse_sample_rates(os.getenv(LOG_SAMPLE_ENV)))
+        # Todos los loggers escriben por la misma cola que el root
+        logger.handlers[:] = logging.getLogger().handlers
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        return logger
+
     logger.setLevel(logging.INFO)
     handler = logging.StreamHandler()
     handler.setFormatter(
@@ -16,22 +16,29 @@ This data is essential for:
 - Understanding usage patterns
 """
 
-import json
 import logging
-from dataclasses import asdict, dataclass
+import math
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 
+from metrics_sink import get_sink
+from tracing import traced
+
 logger = logging.getLogger(__name__)
 
 # OpenAI pricing as of January 2025 (USD per 1M tokens)
 # Source: https://openai.com/api/pricing/
+# "cached_prompt" is the discounted rate for prompt tokens served from the
+# provider's prompt cache; models without it are billed at the "prompt" rate.
 MODEL_PRICING = {
     "gpt-4o": {
         "prompt": 2.50,
+        "cached_prompt": 1.25,
         "completion": 10.00,
     },
     "gpt-4o-mini": {
         "prompt": 0.150,
+        "cached_prompt": 0.075,
         "completion": 0.600,
     },
     "gpt-4": {
@@ -44,9 +51,14 @@ MODEL_PRICING = {
     },
     "gpt-5-mini": {
         "prompt": 0.25,
+        "cached_prompt": 0.025,
         "completion": 2.00,
     },
 }
+# La Batch API cobra la mitad del precio (entrega en hasta 24 h)
+BATCH_DISCOUNT = 0.5
+
+METRICS_LOG_FILENAME = "metrics.jsonl"
 
 
 @dataclass
@@ -59,11 +71,80 @@ class Metrics:
         prompt_tokens: Number of tokens in the prompt.
         completion_tokens: Number of tokens in the completion.
         total_tokens: Total tokens (prompt + completion).
+        cached_prompt_tokens: Prompt tokens served from the provider's prompt cache
+            (included in prompt_tokens, billed at the discounted rate).
+        time_to_first_token_seconds: Time until the first output token arrived
+            (streaming only), i.e. the latency perceived by the agent.
+        tokens_per_second: Completion tokens generated per second of latency.
         estimated_cost_usd: Estimated cost in USD based on model pricing.
         latency_seconds: Time taken to generate the brief (seconds).
         timestamp: ISO 8601 timestamp of generation.
         context: Optional context string provided by user.
         output_path: Path where brief was saved.
+        retrieved_sections: IDs of the KB sections injected into the prompt.
+        kb_fallback: True when retrieval confidence was low and the full KB was sent.
+        kb_tokens_saved: Estimated prompt tokens saved by sending only retrieved sections.
+        cache_hit: True when the answer was served from the response cache
+            (tokens and cost are 0), False on a cache miss, None if no cache was used.
+        semantic_similarity: Best cosine similarity found in the semantic cache
+            (the matched entry on a hit, the closest one on a miss).
+        attempts: Every request sent for this query (model, kind, outcome,
+            latency), when the resilience layer was used.
+        retries: Attempts made after the first one (retries and fallbacks).
+        hedged: True when a hedged duplicate request was fired.
+        fallback_model: Model used after falling back from the primary one.
+        query_class: Local classification of the query (direct_lookup, listing, ...).
+        routing_decision: How the router picked the model ("cheap",
+            "escalated:<reason>" or "direct:<query class>").
+        escalated: True when the cheap model's answer was not accepted.
+        route_attempts: Each model call made by the router with its cost,
+            confianza and latency.
+        fact_index_hit: True when the answer came from the KB fact index (no
+            model call), False when the lookup missed, None if it was not used.
+        fact_lookup_us: Time spent in the fact index lookup (microseconds).
+        fact_index_hit_rate: Hit rate of the fact index in this process so far.
+        precomputed_answer: True when the answer came from the precomputed
+            answer store built from the query logs (no model call).
+        estimated_prompt_tokens: Pre-flight prompt estimate checked before sending.
+        max_completion_tokens: Completion token budget of the (last) call.
+        reasoning_effort: Reasoning effort requested (reasoning models only).
+        reasoning_tokens: Hidden reasoning tokens, included in completion_tokens.
+        budget_retry: True when a truncated/unparseable answer was retried
+            once with a higher budget (tokens and cost include both calls).
+        structured_output: True when the response JSON schema was sent as
+            response_format.
+        json_repairs: Local repairs applied to the model's JSON (e.g.
+            "code_fence", "trailing_comma"); empty when it was valid as is.
+        validation_failures: Outputs that could not be repaired or validated
+            while answering this query.
+        batch_job_id: Batch API job that answered the query (bulk evaluation);
+            latency_seconds is then the job's turnaround and the cost is
+            batch-discounted.
+        eval_variant: Prompt/model grid cell of a bulk evaluation
+            (e.g. "gpt-4o-mini/one_shot").
+        coalesced: True when the answer was shared from an identical request
+            already in flight (single-flight): tokens and cost are 0 and
+            latency_seconds is the wait; False for the request that made the call.
+        coalesced_requests: Identical requests that shared this call (on the
+            request that made it), i.e. model calls saved.
+        queue_wait_seconds: Time spent waiting for RPM/TPM capacity in the
+            client-side rate limiter, not included in latency_seconds.
+        priority: Rate limiter class of the query ("live", "interactive", "bulk").
+        micro_batch_size: Questions sent in the same micro-batched completion;
+            tokens and cost are this question's share of it.
+        micro_batch_fallback: True when the micro-batched answer did not cover
+            the question and it was answered by a single call (tokens and cost
+            include both).
+        trace_id: Trace of the query's spans in the trace log, when tracing
+            is enabled (see tracing).
+        usage_estimated: True when the API reported no token usage (e.g. a
+            stream cut before its usage chunk) and tokens and cost were
+            estimated from the text.
+        hedge_overhead_tokens: Estimated tokens of the hedge pair's loser,
+            which still runs to completion and is billed (already included
+            in the token totals).
+        hedge_overhead_cost_usd: Estimated cost of the loser (already
+            included in estimated_cost_usd).
     """
 
     model: str
@@ -76,15 +157,109 @@ class Metrics:
     timestamp: str
     context: str | None = "Unknown"
     output_path: str | None = None
+    cached_prompt_tokens: int = 0
+    time_to_first_token_seconds: float | None = None
+    tokens_per_second: float | None = None
+    retrieved_sections: list[str] | None = None
+    kb_fallback: bool | None = None
+    kb_tokens_saved: int | None = None
+    cache_hit: bool | None = None
+    semantic_similarity: float | None = None
+    attempts: list[dict] | None = None
+    retries: int | None = None
+    hedged: bool | None = None
+    fallback_model: str | None = None
+    query_class: str | None = None
+    routing_decision: str | None = None
+    escalated: bool | None = None
+    route_attempts: list[dict] | None = None
+    fact_index_hit: bool | None = None
+    fact_lookup_us: float | None = None
+    fact_index_hit_rate: float | None = None
+    precomputed_answer: bool | None = None
+    estimated_prompt_tokens: int | None = None
+    max_completion_tokens: int | None = None
+    reasoning_effort: str | None = None
+    reasoning_tokens: int | None = None
+    budget_retry: bool | None = None
+    structured_output: bool | None = None
+    json_repairs: list[str] | None = None
+    validation_failures: int | None = None
+    batch_job_id: str | None = None
+    eval_variant: str | None = None
+    coalesced: bool | None = None
+    coalesced_requests: int | None = None
+    queue_wait_seconds: float | None = None
+    priority: str | None = None
+    micro_batch_size: int | None = None
+    micro_batch_fallback: bool | None = None
+    trace_id: str | None = None
+    usage_estimated: bool | None = None
+    hedge_overhead_tokens: int | None = None
+    hedge_overhead_cost_usd: float | None = None
+
+
+@dataclass
+class SessionStats:
+    """Running latency and cost of the queries answered in one interactive session.
+
+    Attributes:
+        latencies: Latency of each answered query, in seconds.
+        total_cost_usd: Estimated cost of all answered queries.
+        errors: Queries that could not be answered.
+    """
+
+    latencies: list[float] = field(default_factory=list)
+    total_cost_usd: float = 0.0
+    errors: int = 0
+
+    @property
+    def queries(self) -> int:
+        return len(self.latencies)
+
+    def record(self, metrics: Metrics) -> None:
+        self.latencies.append(metrics.latency_seconds)
+        self.total_cost_usd += metrics.estimated_cost_usd
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile of the session latencies (q in 0-100)."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
 
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of tokens in a text without calling a tokenizer.
 
-def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    Uses the common ~4 characters per token approximation, which is close
+    enough for budgeting and for reporting savings before a request is sent.
+
+    Args:
+        text: Text to measure.
+
+    Returns:
+        Approximate token count (0 for empty text).
+
+    Examples:
+        >>> estimate_tokens("Horario de corte: 18:00.")
+        6
+    """
+    return math.ceil(len(text) / 4)
+
+
+def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int,
+                   cached_tokens: int = 0, batch: bool = False) -> float:
     """Calculates estimated cost based on OpenAI pricing.
 
     Args:
         model: OpenAI model name (e.g., "gpt-4o-mini").
-        prompt_tokens: Number of tokens in the prompt.
+        prompt_tokens: Number of tokens in the prompt (cached ones included).
         completion_tokens: Number of tokens in the completion.
+        cached_tokens: Prompt tokens served from the prompt cache, billed at
+            the model's "cached_prompt" rate when it has one.
+        batch: Whether the call went through the Batch API, billed at
+            BATCH_DISCOUNT of the regular price.
 
     Returns:
         Estimated cost in USD. Returns 0.0 if model pricing is unknown.
@@ -94,41 +269,53 @@ def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> fl
         >>> cost
         0.00045
         >>> # (1000 * 0.150 + 500 * 0.600) / 1_000_000
+        >>> calculate_cost("gpt-4o-mini", 1000, 500, cached_tokens=800)
+        0.00039
+        >>> # (200 * 0.150 + 800 * 0.075 + 500 * 0.600) / 1_000_000
+        >>> calculate_cost("gpt-4o-mini", 1000, 500, batch=True)
+        0.000225
     """
     if model not in MODEL_PRICING:
         logger.warning(
-            f"Unknown model '{model}', cannot estimate cost. "
-            f"Known models: {list(MODEL_PRICING.keys())}"
+            "Unknown model '%s', cannot estimate cost. Known models: %s",
+            model, list(MODEL_PRICING.keys()),
         )
         return 0.0
 
     pricing = MODEL_PRICING[model]
-    prompt_cost = (prompt_tokens * pricing["prompt"]) / 1_000_000
+    cached_rate = pricing.get("cached_prompt", pricing["prompt"])
+    uncached_tokens = prompt_tokens - cached_tokens
+    prompt_cost = (uncached_tokens * pricing["prompt"] + cached_tokens * cached_rate) / 1_000_000
     completion_cost = (completion_tokens * pricing["completion"]) / 1_000_000
     total_cost = prompt_cost + completion_cost
+    if batch:
+        total_cost *= BATCH_DISCOUNT
 
+    # Formato diferido: con DEBUG deshabilitado el mensaje nunca se arma
     logger.debug(
-        f"Cost calculation for {model}: "
-        f"prompt={prompt_tokens} tokens (${prompt_cost:.6f}), "
-        f"completion={completion_tokens} tokens (${completion_cost:.6f}), "
-        f"total=${total_cost:.6f}"
+        "Cost calculation for %s: prompt=%d tokens (%d cached, $%.6f), "
+        "completion=%d tokens ($%.6f), total=$%.6f%s",
+        model, prompt_tokens, cached_tokens, prompt_cost,
+        completion_tokens, completion_cost, total_cost, " (batch)" if batch else "",
     )
 
     return total_cost
 
 
+@traced("log_metrics")
 def log_metrics(metrics: Metrics, output_dir: Path) -> None:
-    """Saves metrics to JSON file alongside the generated model response.
+    """Appends metrics to the JSONL metrics log in output_dir.
 
-    Creates a .metrics.json file with the same base name as the query (as per context passed)
-    This allows easy correlation between queries and their generation metrics.
+    Records go to output_dir/metrics.jsonl through the shared buffered sink
+    (see metrics_sink), one line per call, so repeated calls with the same
+    context no longer overwrite each other.
 
     Args:
         metrics: The Metrics object to save.
-        output_dir: Directory where the response was saved.
+        output_dir: Directory where the metrics log lives.
 
     Raises:
-        IOError: If unable to write metrics file.
+        ValueError: If the sink for the file was already closed.
 
     Examples:
         >>> metrics = Metrics(
@@ -142,26 +329,20 @@ def log_metrics(metrics: Metrics, output_dir: Path) -> None:
         ...     timestamp="2025-01-15T10:30:00Z",
         ... )
         >>> log_metrics(metrics, Path("./output"))
-        # Creates ./output/<context>.metrics.json
+        # Appends a line to ./output/metrics.jsonl
     """
-    metrics_path = output_dir / f"{metrics.context}.metrics.json"
-
-    try:
-        with open(metrics_path, "w", encoding="utf-8") as f:
-            json.dump(asdict(metrics), f, indent=2, ensure_ascii=False)
-
-        logger.info(f"Metrics saved to {metrics_path}")
-
-    except IOError as e:
-        logger.error(f"Failed to save metrics to {metrics_path}: {e}")
-        raise
+    metrics_path = output_dir / METRICS_LOG_FILENAME
+    get_sink(metrics_path).write({"metrics": asdict(metrics)})
+    logger.debug("Metrics queued for %s", metrics_path)
 
 
-def print_metrics_summary(metrics: Metrics) -> None:
+@traced("print_metrics_summary")
+def print_metrics_summary(metrics: Metrics, session: SessionStats | None = None) -> None:
     """Prints a human-readable summary of metrics to console.
 
     Args:
         metrics: The BriefMetrics object to summarize.
+        session: Session-level stats to print after the query's metrics.
 
     Examples:
         >>> metrics = Metrics(...)
@@ -176,11 +357,68 @@ def print_metrics_summary(metrics: Metrics) -> None:
     print(f"Prompt tokens:      {metrics.prompt_tokens:,}")
     print(f"Completion tokens:  {metrics.completion_tokens:,}")
     print(f"Total tokens:       {metrics.total_tokens:,}")
+    if metrics.cached_prompt_tokens:
+        print(f"Cached prompt:      {metrics.cached_prompt_tokens:,}")
+    if metrics.reasoning_tokens is not None:
+        print(f"Reasoning tokens:   {metrics.reasoning_tokens:,}")
+    if metrics.max_completion_tokens is not None:
+        retry = ", retried" if metrics.budget_retry else ""
+        print(f"Output budget:      {metrics.completion_tokens:,}/{metrics.max_completion_tokens:,} tokens "
+              f"(effort: {metrics.reasoning_effort}{retry})")
+    if metrics.json_repairs:
+        print(f"JSON repairs:       {', '.join(metrics.json_repairs)}")
+    if metrics.validation_failures:
+        print(f"Validation failures: {metrics.validation_failures}")
     print(f"Estimated cost:     ${metrics.estimated_cost_usd:.6f} USD")
     print(f"Latency:            {metrics.latency_seconds:.2f}s")
+    if metrics.queue_wait_seconds is not None:
+        print(f"Queue wait:         {metrics.queue_wait_seconds:.2f}s ({metrics.priority})")
+    if metrics.time_to_first_token_seconds is not None:
+        print(f"Time to 1st token:  {metrics.time_to_first_token_seconds:.2f}s")
+    if metrics.tokens_per_second is not None:
+        print(f"Tokens/second:      {metrics.tokens_per_second:.1f}")
     print(f"Timestamp:          {metrics.timestamp}")
     if metrics.context:
         print(f"Context:            {metrics.context}")
     if metrics.output_path:
         print(f"Output:             {metrics.output_path}")
+    if metrics.cache_hit is not None:
+        print(f"Cache hit:          {'yes' if metrics.cache_hit else 'no'}")
+    if metrics.precomputed_answer:
+        print("Precomputed answer: yes")
+    if metrics.semantic_similarity is not None:
+        print(f"Semantic similarity: {metrics.semantic_similarity:.3f}")
+    if metrics.retrieved_sections is not None:
+        sections = "full KB (fallback)" if metrics.kb_fallback else ", ".join(metrics.retrieved_sections)
+        print(f"KB sections:        {sections}")
+        print(f"KB tokens saved:    {metrics.kb_tokens_saved:,}")
+    if metrics.attempts is not None:
+        print(f"Attempts:           {len(metrics.attempts)} ({metrics.retries} retries, "
+              f"hedged: {'yes' if metrics.hedged else 'no'})")
+    if metrics.hedge_overhead_cost_usd:
+        print(f"Hedge overhead:     ~{metrics.hedge_overhead_tokens:,} tokens, ~${metrics.hedge_overhead_cost_usd:.4f}")
+    if metrics.fallback_model:
+        print(f"Fallback model:     {metrics.fallback_model}")
+    if metrics.fact_index_hit is not None:
+        print(f"Fact index:         {'hit' if metrics.fact_index_hit else 'miss'} "
+              f"({metrics.fact_lookup_us:.0f} us, hit rate {metrics.fact_index_hit_rate:.0%})")
+    if metrics.routing_decision is not None:
+        print(f"Routing:            {metrics.routing_decision} ({metrics.query_class})")
+    if metrics.coalesced:
+        print("Coalesced:          yes (shared an identical in-flight request)")
+    elif metrics.coalesced_requests:
+        print(f"Coalesced requests: {metrics.coalesced_requests}")
+    if metrics.micro_batch_size is not None:
+        fallback = ", fell back to a single call" if metrics.micro_batch_fallback else ""
+        print(f"Micro-batch:        {metrics.micro_batch_size} questions{fallback}")
+    if metrics.trace_id is not None:
+        print(f"Trace:              {metrics.trace_id}")
+    if metrics.usage_estimated:
+        print("Usage:              estimated (no usage reported by the API)")
+    if session is not None:
+        print("-" * 60)
+        print(f"Session queries:    {session.queries} ({session.errors} errors)")
+        print(f"Session latency:    p50 {session.percentile(50):.2f}s, p95 {session.percentile(95):.2f}s, "
+              f"max {max(session.latencies, default=0.0):.2f}s")
+        print(f"Session cost:       ${session.total_cost_usd:.6f} USD")
     print("=" * 60 + "\n")
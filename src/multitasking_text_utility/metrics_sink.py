@@ -0,0 +1,253 @@
+"""Buffered, append-only JSONL sink for metrics records.
+
+Writing one pretty-printed JSON file per query has two problems: queries in
+the same minute overwrite each other, and analysis means opening thousands
+of tiny files. This sink appends one JSON object per line to a single file:
+
+- writes go to an in-memory buffer and return immediately
+- a background thread flushes the buffer every `flush_interval` seconds (or
+  as soon as it holds `max_buffer` records)
+- each flush is a single os.write() on an O_APPEND descriptor, and
+  flushes of the same sink are serialized, so threads sharing the sink
+  never interleave partial lines and batches land in write order; on a
+  local filesystem other processes appending to the same file do not
+  split those lines either (NFS gives no such guarantee)
+- optional rotation by size and/or day; rotated files are gzip-compressed.
+  Rotation is only safe with a single writing process per file: two
+  processes may both rotate, or one may keep appending to the renamed file
+
+It also includes a one-shot migrator for the legacy logs/*.json files.
+
+Usage:
+    python src/multitasking_text_utility/metrics_sink.py migrate logs/ -o logs/SoporteCliente.jsonl
+"""
+
+import argparse
+import atexit
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL_SECONDS = 1.0
+DEFAULT_MAX_BUFFER = 500
+
+_sinks: dict[Path, "JsonlMetricsSink"] = {}
+_sinks_lock = threading.Lock()
+
+
+class JsonlMetricsSink:
+    """Thread-safe buffered JSONL writer with a background flusher.
+
+    Args:
+        path: JSONL file to append to. Parent folders are created if needed.
+        flush_interval: Seconds between background flushes.
+        max_buffer: Buffered records that trigger an early flush.
+        rotate_bytes: Rotate when the file exceeds this size (None disables).
+        rotate_daily: Rotate when the first write of a new day happens.
+        compress_rotated: Gzip rotated files.
+
+    Examples:
+        >>> sink = JsonlMetricsSink(Path("logs/SoporteCliente.jsonl"))
+        >>> sink.write({"consulta": "Horario de corte?", "metrics": {...}})
+        >>> sink.close()
+    """
+
+    def __init__(self, path: Path,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+                 max_buffer: int = DEFAULT_MAX_BUFFER,
+                 rotate_bytes: int | None = None,
+                 rotate_daily: bool = False,
+                 compress_rotated: bool = True):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compress_rotated = compress_rotated
+
+        self._buffer: list[str] = []
+        self._buffer_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._current_day = datetime.now().date()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name=f"metrics-sink-{path.name}", daemon=True)
+        self._thread.start()
+
+    def write(self, record: dict) -> None:
+        """Buffers a record for writing; returns without touching the disk.
+
+        Args:
+            record: JSON-serializable dict.
+
+        Raises:
+            ValueError: If the sink was closed.
+        """
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._buffer_lock:
+            if self._closed:
+                raise ValueError(f"Metrics sink for {self.path} is closed")
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.max_buffer
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> None:
+        """Writes every buffered record to disk."""
+        # El buffer se toma con el lock del archivo tomado: dos flush concurrentes no invierten el orden
+        with self._file_lock:
+            with self._buffer_lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            data = "".join(lines).encode("utf-8")
+            try:
+                self._rotate_if_needed()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    written = os.write(fd, data)
+                    # Una escritura corta solo ocurre con disco lleno o una señal: se completa el resto
+                    while written < len(data):
+                        written += os.write(fd, data[written:])
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logger.error("Failed to write %d metrics records to %s: %s", len(lines), self.path, e)
+                with self._buffer_lock:
+                    self._buffer[:0] = lines
+                raise
+
+    def close(self) -> None:
+        """Stops the background thread and flushes what is left."""
+        with self._buffer_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                pass  # ya fue logueado; se reintenta en el próximo ciclo
+
+    def _rotate_if_needed(self) -> None:
+        today = datetime.now().date()
+        new_day = self.rotate_daily and today != self._current_day
+        self._current_day = today
+        if not self.path.exists():
+            return
+        too_big = self.rotate_bytes is not None and self.path.stat().st_size >= self.rotate_bytes
+        if not (new_day or too_big):
+            return
+
+        stamp = datetime.now().strftime("%Y-%m-%dT%H-%M-%S-%f")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        self.path.rename(rotated)
+        if self.compress_rotated:
+            with open(rotated, "rb") as src, gzip.open(rotated.with_name(rotated.name + ".gz"), "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            rotated.unlink()
+        logger.info("Rotated metrics log %s -> %s", self.path, rotated.name)
+
+
+def get_sink(path: Path, **kwargs) -> JsonlMetricsSink:
+    """Returns the process-wide sink for a path, creating it on first use.
+
+    Sharing one sink per file keeps a single buffer and flusher thread no
+    matter how many call sites log to it. Sinks are flushed at exit.
+
+    Args:
+        path: JSONL file.
+        **kwargs: JsonlMetricsSink options, used only when the sink is created.
+
+    Returns:
+        The shared JsonlMetricsSink.
+    """
+    key = path.resolve()
+    with _sinks_lock:
+        sink = _sinks.get(key)
+        if sink is None or sink._closed:
+            sink = JsonlMetricsSink(path, **kwargs)
+            _sinks[key] = sink
+        return sink
+
+
+@atexit.register
+def close_all_sinks() -> None:
+    """Flushes and closes every sink created with get_sink()."""
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+        _sinks.clear()
+    for sink in sinks:
+        sink.close()
+
+
+def migrate_legacy_logs(logs_dir: Path, sink: JsonlMetricsSink, delete: bool = False) -> int:
+    """Ingests the legacy one-file-per-query JSON logs into a JSONL sink.
+
+    Handles both main()'s files ({"metrics", "consulta", "respuesta"}) and
+    log_metrics' <context>.metrics.json files (a bare Metrics dict, which is
+    wrapped as {"metrics": ...}). Each record gets a "source_file" field.
+
+    Args:
+        logs_dir: Folder with the legacy *.json files.
+        sink: Destination sink.
+        delete: Remove each legacy file once its record has been written.
+
+    Returns:
+        Number of files migrated. Unreadable files are skipped with a warning.
+    """
+    migrated = []
+    for path in sorted(logs_dir.glob("*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping %s: %s", path, e)
+            continue
+        if "metrics" not in record:
+            record = {"metrics": record}
+        record["source_file"] = path.name
+        sink.write(record)
+        migrated.append(path)
+
+    sink.flush()
+    if delete:
+        for path in migrated:
+            path.unlink()
+    return len(migrated)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Herramientas del log de métricas JSONL.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Migrar logs/*.json al formato JSONL")
+    migrate.add_argument("logs_dir", type=Path)
+    migrate.add_argument("-o", "--output", type=Path, required=True, help="Archivo JSONL destino")
+    migrate.add_argument("--delete", action="store_true", help="Borrar los .json migrados")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+    sink = JsonlMetricsSink(args.output)
+    count = migrate_legacy_logs(args.logs_dir, sink, delete=args.delete)
+    sink.close()
+    logger.info("Migrated %d files from %s into %s", count, args.logs_dir, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""Micro-batching of concurrent questions into a single completion.
+
+Every call resends the same ~1,000-token prefix (system prompt, one-shot
+example and KB) for one short question. MicroBatcher collects the questions
+that arrive within a short window (window_seconds, up to max_batch) and
+sends them together:
+
+- the system message is the full-KB system prompt, the same for every
+  batch, so consecutive batches share a cacheable prefix; the user message
+  carries MICRO_BATCH_INSTRUCTIONS and the questions as a JSON list with
+  ids. Single calls only share that prefix when they also send the full KB
+  (server.py --full-kb): with retrieval they send a smaller per-query
+  prompt, so batches and fallbacks do not hit each other's prompt cache
+- the model answers {"respuestas": [{"id", "respuesta", "confianza",
+  "acciones_recomendadas"}, ...]}; each answer is validated like a single
+  one and fanned back out to its caller in the usual answer format
+- usage is attributed per question: the shared prompt prefix is split
+  evenly, each question's own text and answer are charged to it (see
+  split_tokens), and the cost is computed per question with calculate_cost
+- the batched call goes through the RPM/TPM scheduler when there is one:
+  one reservation sized for the whole batch (shared prompt plus a
+  completion estimate per question), at the most urgent priority in the
+  batch, settled with the batch usage
+- the batch has a deadline (timeout_seconds after its window closes): the
+  API call gets the remaining time as its timeout, and callers stop waiting
+  when it expires
+- a question missing from the batched answer (or a batch that failed or
+  timed out) is reported back without an answer so the caller falls back to
+  a single call; a window that only caught one question is not batched at all
+
+It is opt-in (server.py --micro-batch-ms) and sits inside get_completion,
+after the fact index and the caches.
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+from budgets import estimate_request_tokens
+from metrics import Metrics, calculate_cost, estimate_tokens
+from prompt_builder import compose_system_prompt
+from prompts import MICRO_BATCH_INSTRUCTIONS
+from rate_limiter import DEFAULT_COMPLETION_ESTIMATE_TOKENS, Priority, QueueTimeoutError, RateLimitScheduler
+from resilience import DEFAULT_ATTEMPT_TIMEOUT_SECONDS
+from structured_output import AssistantResponse, repair_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_SECONDS = 0.1
+DEFAULT_MAX_BATCH = 8
+DEFAULT_MAX_WORKERS = 4
+SCHEDULER_TENANT = "micro-batch"
+
+
+@dataclass
+class MicroBatchStats:
+    """Counters of a MicroBatcher (updated under MicroBatcher._stats_lock).
+
+    Attributes:
+        batches: Batched completions sent.
+        questions: Questions answered through a batched completion.
+        missing: Questions the batched answer did not cover (fell back).
+        singles: Windows with a single question, sent as a normal call.
+        timeouts: Questions whose batch missed its deadline (fell back).
+    """
+
+    batches: int = 0
+    questions: int = 0
+    missing: int = 0
+    singles: int = 0
+    timeouts: int = 0
+
+
+class _Item:
+    __slots__ = ("user_prompt", "priority", "future", "submitted", "deadline")
+
+    def __init__(self, user_prompt: str, priority: Priority, window_seconds: float):
+        self.user_prompt = user_prompt
+        self.priority = priority
+        self.future: Future = Future()
+        self.submitted = time.time()
+        self.deadline = time.monotonic() + window_seconds
+
+
+def split_tokens(total: int, weights: list[float]) -> list[int]:
+    """Splits a token count proportionally to weights, summing exactly to total.
+
+    Uses the largest remainder method, so per-question numbers add up to the
+    usage the API reported.
+
+    Examples:
+        >>> split_tokens(10, [1, 1, 1])
+        [4, 3, 3]
+    """
+    if not weights:
+        return []
+    if sum(weights) <= 0:
+        weights = [1.0] * len(weights)
+    scale = total / sum(weights)
+    exact = [w * scale for w in weights]
+    shares = [int(x) for x in exact]
+    by_remainder = sorted(range(len(weights)), key=lambda i: exact[i] - shares[i], reverse=True)
+    for i in by_remainder[:total - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+
+def build_batch_prompt(questions: list[tuple[str, str]]) -> str:
+    """User message of a batched call: instructions plus [{"id", "consulta"}]."""
+    payload = [{"id": qid, "consulta": text} for qid, text in questions]
+    return MICRO_BATCH_INSTRUCTIONS.strip() + "\n" + json.dumps(payload, ensure_ascii=False)
+
+
+def parse_batch_answers(content: str) -> dict[str, dict]:
+    """Extracts the valid per-question answers of a batched completion.
+
+    Args:
+        content: Raw model output.
+
+    Returns:
+        Mapping of question id to answer (respuesta, indicador_de_confianza,
+        acciones_recomendadas). Missing or invalid answers are left out.
+    """
+    try:
+        text, _ = repair_json(content or "")
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    answers = {}
+    entries = data.get("respuestas") if isinstance(data, dict) else None
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict) or "id" not in entry:
+            continue
+        try:
+            parsed = AssistantResponse.model_validate(entry)
+        except ValueError:
+            continue
+        answers[str(entry["id"])] = {
+            "respuesta": parsed.respuesta,
+            "indicador_de_confianza": parsed.confianza,
+            "acciones_recomendadas": parsed.acciones_recomendadas,
+        }
+    return answers
+
+
+class MicroBatcher:
+    """Groups questions arriving within a short window into one completion.
+
+    Args:
+        client: OpenAI client (or compatible).
+        model: Model used for the batched calls.
+        system_prompt: System prompt of the batched calls (full KB by
+            default); may be replaced when the KB changes.
+        window_seconds: How long the first question of a batch waits for others.
+        max_batch: Maximum questions per completion.
+        context: Context label stored in Metrics.
+        max_workers: Batched calls that can be in flight at the same time.
+        scheduler: Client-side RPM/TPM limiter the batched calls are charged to.
+        timeout_seconds: Time a batch has after its window closes, queueing
+            in the scheduler included, before its callers fall back.
+
+    Examples:
+        >>> batcher = MicroBatcher(client, OpenAIModels.GPT_4o_mini, window_seconds=0.1)
+        >>> answer, metrics = batcher.submit("Horario de corte?")
+        >>> if answer is None: ...  # no cubierta por el batch: llamado individual
+    """
+
+    def __init__(self, client, model, system_prompt: str | None = None,
+                 window_seconds: float = DEFAULT_WINDOW_SECONDS, max_batch: int = DEFAULT_MAX_BATCH,
+                 context: str | None = None, max_workers: int = DEFAULT_MAX_WORKERS,
+                 scheduler: RateLimitScheduler | None = None,
+                 timeout_seconds: float = DEFAULT_ATTEMPT_TIMEOUT_SECONDS):
+        self.client = client
+        self.model = model
+        self.system_prompt = system_prompt or compose_system_prompt()
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.context = context
+        self.scheduler = scheduler
+        self.timeout_seconds = timeout_seconds
+        self.stats = MicroBatchStats()
+        # Los contadores se actualizan desde los hilos del pool y desde los callers
+        self._stats_lock = threading.Lock()
+        self._pending: list[_Item] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="micro-batch")
+        self._collector = threading.Thread(target=self._collect, name="micro-batch-collector", daemon=True)
+        self._collector.start()
+
+    def submit(self, user_prompt: str,
+               priority: Priority = Priority.LIVE) -> tuple[dict | None, Metrics | None]:
+        """Queues a question and waits for its share of a batched completion.
+
+        Args:
+            user_prompt: The question.
+            priority: Scheduling class of the question (a batch is scheduled
+                with its most urgent one).
+
+        Returns:
+            (answer, metrics) when the batch answered it. (None, share) when
+            the batch did not cover it: share holds its part of the batch's
+            usage, to be added to the fallback call. (None, None) when the
+            question was not batched (alone in its window, or the batched
+            call failed or missed its deadline).
+        """
+        item = _Item(user_prompt, priority, self.window_seconds)
+        with self._cond:
+            if self._closed:
+                return None, None
+            self._pending.append(item)
+            self._cond.notify_all()
+        try:
+            # Como mucho la ventana más el plazo del batch
+            return item.future.result(timeout=self.window_seconds + self.timeout_seconds)
+        except TimeoutError:
+            with self._stats_lock:
+                self.stats.timeouts += 1
+            logger.warning("Micro-batch missed its %.0fs deadline; falling back to a single call",
+                           self.timeout_seconds)
+            return None, None
+
+    def close(self) -> None:
+        """Flushes the pending questions and stops the collector."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._collector.join()
+        self._pool.shutdown(wait=True)
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # La ventana arranca con la primera consulta del batch
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = self._pending[0].deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self._pool.submit(self._send, batch)
+
+    def _send(self, batch: list[_Item]) -> None:
+        if len(batch) == 1:
+            with self._stats_lock:
+                self.stats.singles += 1
+            batch[0].future.set_result((None, None))
+            return
+        questions = [(f"q{i}", item.user_prompt) for i, item in enumerate(batch, start=1)]
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": build_batch_prompt(questions)},
+        ]
+        deadline = time.monotonic() + self.timeout_seconds
+        priority = min(item.priority for item in batch)
+        reservation = None
+        try:
+            if self.scheduler is not None:
+                # Una sola reserva para el batch: prompt compartido más una respuesta estimada por pregunta
+                estimated_tokens = (estimate_request_tokens(messages)
+                                    + DEFAULT_COMPLETION_ESTIMATE_TOKENS * len(batch))
+                reservation = self.scheduler.acquire(estimated_tokens, priority, SCHEDULER_TENANT,
+                                                     max_wait=self.timeout_seconds)
+            response = self.client.chat.completions.create(
+                model=self.model, messages=messages, response_format={"type": "json_object"},
+                timeout=max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            if reservation is not None:
+                # Sin usage (timeout, 429): queda cobrada la estimación
+                reservation.settle(None)
+            if isinstance(e, QueueTimeoutError):
+                with self._stats_lock:
+                    self.stats.timeouts += len(batch)
+            logger.warning("Micro-batch of %d failed (%s: %s); sending them one by one", len(batch), type(e).__name__, e)
+            for item in batch:
+                item.future.set_result((None, None))
+            return
+        if reservation is not None:
+            reservation.settle(response.usage.total_tokens)
+
+        answers = parse_batch_answers(response.choices[0].message.content)
+        shares = self._attribute(response.usage, questions, answers)
+        with self._stats_lock:
+            self.stats.batches += 1
+            self.stats.questions += len(batch)
+            self.stats.missing += sum(1 for qid, _ in questions if qid not in answers)
+        if len(answers) < len(batch):
+            logger.warning("Micro-batch answered %d of %d questions; the rest fall back to single calls",
+                           len(answers), len(batch))
+        for (qid, _), item, share in zip(questions, batch, shares):
+            share.latency_seconds = round(time.time() - item.submitted, 2)
+            if reservation is not None:
+                share.queue_wait_seconds = round(reservation.wait_seconds, 4)
+                share.priority = priority.name.lower()
+            item.future.set_result((answers.get(qid), share))
+
+    def _attribute(self, usage, questions: list[tuple[str, str]], answers: dict[str, dict]) -> list[Metrics]:
+        own = [estimate_tokens(json.dumps({"id": qid, "consulta": text}, ensure_ascii=False))
+               for qid, text in questions]
+        # El prefijo (system prompt e instrucciones) se reparte en partes iguales; cada pregunta paga su texto
+        shared = max(0, usage.prompt_tokens - sum(own)) / len(questions)
+        prompt_weights = [shared + tokens for tokens in own]
+        completion_weights = [estimate_tokens(json.dumps(answers[qid], ensure_ascii=False)) if qid in answers else 0
+                              for qid, _ in questions]
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None)
+        cached = cached if isinstance(cached, int) else 0
+
+        model_name = getattr(self.model, "value", self.model)
+        shares = []
+        for prompt_tokens, completion_tokens, cached_tokens in zip(
+                split_tokens(usage.prompt_tokens, prompt_weights),
+                split_tokens(usage.completion_tokens, completion_weights),
+                split_tokens(cached, prompt_weights)):
+            cost = calculate_cost(model_name, prompt_tokens, completion_tokens, cached_tokens)
+            shares.append(Metrics(
+                model=self.model,
+                temperature=0.0,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+                cached_prompt_tokens=cached_tokens,
+                estimated_cost_usd=round(cost, 6),
+                latency_seconds=0.0,
+                timestamp=datetime.now().isoformat(),
+                context=self.context,
+                micro_batch_size=len(questions),
+            ))
+        return shares
@@ -25,3 +25,20 @@ Según la información disponible, los productos orientados a ahorro/inversión
 - Caja de Ahorro (producto para ahorro): sin costo de mantenimiento; incluye tarjeta de débito; permite transferencias ilimitadas.
 
 """
+
+# Varias consultas en un mismo llamado (micro_batch.py): va en el mensaje de usuario, el system prompt no cambia
+MICRO_BATCH_INSTRUCTIONS = """
+Vas a recibir VARIAS consultas de distintos agentes, como una lista JSON de objetos {"id": string, "consulta": string}.
+Respondé cada consulta por separado, con las mismas reglas que si fuera la única.
+Responde SIEMPRE con un único objeto JSON válido con la siguiente estructura, con un elemento por consulta y el mismo id:
+
+{
+  "respuestas": [
+    {"id": string, "respuesta": string, "confianza": number entre 0 y 1, "acciones_recomendadas": [string]}
+  ]
+}
+
+No agregues texto fuera del JSON.
+
+CONSULTAS:
+"""
@@ -0,0 +1,96 @@
+"""Cheap local classification of agent queries.
+
+Decides, in microseconds and without calling a model, what kind of question
+an agent is asking:
+
+- direct_lookup: the answer is a fact in one KB section
+  ("Cuál es la comisión de Cuenta Corriente ?")
+- listing: asks for several items or options ("Qué tarjetas tienen ?")
+- inferential: generic or inferential questions whose answer must be
+  assembled from several sections ("Que productos de inversion tiene para
+  ofrecer ?", see reports/report1.md)
+- out_of_domain: nothing in the KB matches ("dosis de ibuprofeno"). This
+  is decided by the BM25 score alone, so a question about a product the
+  bank does not offer but worded with KB terms is not caught: "rentabilidad
+  anual en cuentas de money market" matches "anual" and "cuenta" (sections
+  7, 10 and 18) and is classified direct_lookup; the model then answers
+  that the KB does not cover it
+
+The model router and the output budgets use it to pick a model and a
+token budget per query.
+"""
+
+import re
+from dataclasses import dataclass
+from enum import Enum
+
+from text_normalization import normalize_text
+
+
+class QueryClass(str, Enum):
+    DIRECT_LOOKUP = "direct_lookup"
+    LISTING = "listing"
+    INFERENTIAL = "inferential"
+    OUT_OF_DOMAIN = "out_of_domain"
+
+
+# Patrones sobre el texto normalizado (sin acentos, en minúsculas)
+INFERENTIAL_PATTERNS = [re.compile(p) for p in (
+    r"\binversion", r"\binvert", r"\bconviene", r"\brecomend", r"\bmejor(es)?\b",
+    r"\bdiferencia", r"\bcompar", r"\bventaja", r"\bdeberia", r"\bpor que\b", r"\bque pasa si\b",
+)]
+LISTING_PATTERNS = [re.compile(p) for p in (
+    r"\bque (productos|servicios|tipos|opciones|tarjetas|seguros|cuentas|prestamos)\b",
+    r"\bcuales son\b", r"\blista", r"\btodos los\b", r"\btodas las\b", r"\bofrec",
+)]
+
+
+@dataclass(frozen=True)
+class QueryClassification:
+    """Result of classify_query.
+
+    Attributes:
+        query_class: The QueryClass of the query.
+        top_score: BM25 score of the best matching KB section.
+        reason: Pattern or rule that decided the class.
+    """
+
+    query_class: QueryClass
+    top_score: float
+    reason: str
+
+
+def _first_match(patterns: list[re.Pattern], text: str) -> str | None:
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match.group(0)
+    return None
+
+
+def classify_query(query: str, kb_index) -> QueryClassification:
+    """Classifies a query using keyword patterns and the KB retrieval score.
+
+    Args:
+        query: Agent query.
+        kb_index: BM25Index over the KB (see retrieval.py).
+
+    Returns:
+        QueryClassification for the query.
+
+    Examples:
+        >>> classify_query("Que productos de inversion tiene para ofrecer ?", index).query_class
+        <QueryClass.INFERENTIAL: 'inferential'>
+    """
+    text = normalize_text(query)
+    retrieval = kb_index.retrieve(query)
+
+    matched = _first_match(INFERENTIAL_PATTERNS, text)
+    if matched:
+        return QueryClassification(QueryClass.INFERENTIAL, retrieval.top_score, f"pattern:{matched}")
+    matched = _first_match(LISTING_PATTERNS, text)
+    if matched:
+        return QueryClassification(QueryClass.LISTING, retrieval.top_score, f"pattern:{matched}")
+    if retrieval.fallback:
+        return QueryClassification(QueryClass.OUT_OF_DOMAIN, retrieval.top_score, "low_retrieval_score")
+    return QueryClassification(QueryClass.DIRECT_LOOKUP, retrieval.top_score, "retrieval_match")
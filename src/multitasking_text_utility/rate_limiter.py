@@ -0,0 +1,270 @@
+"""Client-side RPM/TPM rate limiting with priority classes.
+
+Nothing used to know about the account's requests-per-minute and
+tokens-per-minute limits, so a background replay could starve live agent
+queries and trigger 429 storms. RateLimitScheduler sits in front of the
+model call:
+
+- two token buckets, one for requests (RPM) and one for tokens (TPM); a
+  request is admitted only when both can pay for it
+- TPM is charged up front with the pre-flight estimate (prompt tokens plus
+  the completion budget) and corrected with the actual usage once the
+  response arrives (Reservation.settle)
+- priority classes: live agent queries, then interactive experiments, then
+  bulk evaluation; a lower class is only served when no higher one is waiting
+- fair queueing inside a class: tenants (e.g. agents or contexts) are served
+  round-robin, so one tenant's burst does not monopolize its class
+
+The time a request spends queued is reported separately from model latency
+(Metrics.queue_wait_seconds).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Tokens de completion que se reservan cuando el llamado no tiene presupuesto de salida
+DEFAULT_COMPLETION_ESTIMATE_TOKENS = 1000
+
+
+class Priority(IntEnum):
+    """Scheduling classes (lower value is served first)."""
+
+    LIVE = 0
+    INTERACTIVE = 1
+    BULK = 2
+
+
+class QueueTimeoutError(TimeoutError):
+    """A request waited longer than its max_wait for rate-limit capacity."""
+
+
+class TokenBucket:
+    """A bucket of `capacity` units refilled continuously at `per_second`.
+
+    take() may drive the level negative (a request larger than the bucket is
+    admitted once the bucket is full, and usage corrections can exceed the
+    estimate); the debt is paid back by the refill.
+    """
+
+    def __init__(self, capacity: float, per_second: float, now: float):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.level = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` (capped at the capacity) can be taken."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.per_second)
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+    def adjust(self, delta: float, now: float) -> None:
+        """Returns (positive) or charges (negative) units after the fact."""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + delta)
+
+
+@dataclass
+class RateLimiterStats:
+    """Counters of a RateLimitScheduler.
+
+    Attributes:
+        granted: Requests admitted, per priority name.
+        queue_wait_seconds: Total time spent queued, per priority name.
+        timeouts: Requests that gave up waiting.
+        tokens_corrected: Sum of (actual - estimated) tokens reported by settle().
+    """
+
+    granted: dict[str, int] = field(default_factory=dict)
+    queue_wait_seconds: dict[str, float] = field(default_factory=dict)
+    timeouts: int = 0
+    tokens_corrected: int = 0
+
+
+class _Waiter:
+    __slots__ = ("tokens", "priority", "tenant", "enqueued", "granted")
+
+    def __init__(self, tokens: int, priority: Priority, tenant: str, enqueued: float):
+        self.tokens = tokens
+        self.priority = priority
+        self.tenant = tenant
+        self.enqueued = enqueued
+        self.granted: float | None = None
+
+
+class Reservation:
+    """Capacity granted to one request; settle it with the actual usage.
+
+    Attributes:
+        estimated_tokens: Tokens charged to the TPM bucket when admitted.
+        priority: Scheduling class of the request.
+        wait_seconds: Time spent queued before being admitted.
+    """
+
+    def __init__(self, scheduler: "RateLimitScheduler", estimated_tokens: int, priority: Priority,
+                 wait_seconds: float):
+        self._scheduler = scheduler
+        self.estimated_tokens = estimated_tokens
+        self.priority = priority
+        self.wait_seconds = wait_seconds
+        self._settled = False
+
+    def settle(self, actual_tokens: int | None) -> None:
+        """Corrects the TPM charge with the tokens the API reported.
+
+        Args:
+            actual_tokens: usage.total_tokens, or None to keep the estimate
+                (e.g. the request failed without reporting usage).
+        """
+        if self._settled or actual_tokens is None:
+            return
+        self._settled = True
+        self._scheduler._correct(actual_tokens - self.estimated_tokens)
+
+
+class RateLimitScheduler:
+    """Admits requests under RPM/TPM limits, by priority and fairly per tenant.
+
+    Args:
+        rpm: Requests per minute allowed for the account.
+        tpm: Tokens per minute allowed for the account.
+        clock: Monotonic clock (injectable for tests).
+
+    Examples:
+        >>> scheduler = RateLimitScheduler(rpm=500, tpm=200_000)
+        >>> reservation = scheduler.acquire(estimated_tokens=3000, priority=Priority.LIVE, tenant="agente-7")
+        >>> response = client.chat.completions.create(...)
+        >>> reservation.settle(response.usage.total_tokens)
+    """
+
+    def __init__(self, rpm: int, tpm: int, clock: Callable[[], float] = time.monotonic):
+        now = clock()
+        self.rpm = rpm
+        self.tpm = tpm
+        self._clock = clock
+        self._requests = TokenBucket(rpm, rpm / 60, now)
+        self._tokens = TokenBucket(tpm, tpm / 60, now)
+        self._cond = threading.Condition()
+        # Por prioridad: tenant -> cola FIFO; el orden del OrderedDict es el turno del round-robin
+        self._queues: dict[Priority, OrderedDict[str, deque[_Waiter]]] = {p: OrderedDict() for p in Priority}
+        self.stats = RateLimiterStats()
+
+    def queued(self) -> int:
+        """Requests currently waiting for capacity."""
+        with self._cond:
+            return sum(len(q) for tenants in self._queues.values() for q in tenants.values())
+
+    def _head(self) -> _Waiter | None:
+        for priority in Priority:
+            tenants = self._queues[priority]
+            if tenants:
+                return next(iter(tenants.values()))[0]
+        return None
+
+    def _dispatch(self) -> float | None:
+        """Admits waiters in order while capacity lasts (called with the lock held).
+
+        Returns:
+            Seconds until the next waiter can be admitted, or None when the
+            queue is empty.
+        """
+        while True:
+            head = self._head()
+            if head is None:
+                return None
+            now = self._clock()
+            wait = max(self._requests.wait_time(1, now), self._tokens.wait_time(head.tokens, now))
+            if wait > 0:
+                return wait
+            self._requests.take(1, now)
+            self._tokens.take(head.tokens, now)
+            head.granted = now
+            tenants = self._queues[head.priority]
+            queue = tenants[head.tenant]
+            queue.popleft()
+            if queue:
+                # El tenant vuelve al final del turno
+                tenants.move_to_end(head.tenant)
+            else:
+                del tenants[head.tenant]
+            self._cond.notify_all()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        tenants = self._queues[waiter.priority]
+        queue = tenants.get(waiter.tenant)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del tenants[waiter.tenant]
+
+    def acquire(self, estimated_tokens: int, priority: Priority = Priority.LIVE, tenant: str = "default",
+                max_wait: float | None = None) -> Reservation:
+        """Blocks until the request fits in both buckets and it is its turn.
+
+        Args:
+            estimated_tokens: Pre-flight estimate (prompt plus completion budget).
+            priority: Scheduling class.
+            tenant: Fair-queueing key inside the class.
+            max_wait: Give up after this many seconds (None waits forever).
+
+        Returns:
+            The Reservation to settle with the actual usage.
+
+        Raises:
+            QueueTimeoutError: If max_wait expires first.
+        """
+        waiter = _Waiter(estimated_tokens, Priority(priority), tenant, self._clock())
+        deadline = waiter.enqueued + max_wait if max_wait is not None else None
+        with self._cond:
+            self._queues[waiter.priority].setdefault(tenant, deque()).append(waiter)
+            while True:
+                wait = self._dispatch()
+                if waiter.granted is not None:
+                    break
+                if deadline is not None:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        self._remove(waiter)
+                        self.stats.timeouts += 1
+                        # Liberar el turno: puede que el siguiente sí entre
+                        self._dispatch()
+                        raise QueueTimeoutError(f"Rate limit queue wait exceeded {max_wait}s "
+                                                f"({waiter.priority.name.lower()}, {estimated_tokens} tokens)")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+            waited = waiter.granted - waiter.enqueued
+            name = waiter.priority.name.lower()
+            self.stats.granted[name] = self.stats.granted.get(name, 0) + 1
+            self.stats.queue_wait_seconds[name] = self.stats.queue_wait_seconds.get(name, 0.0) + waited
+        if waited > 1:
+            logger.debug("Rate limit: %s request queued %.2fs", name, waited)
+        return Reservation(self, estimated_tokens, waiter.priority, waited)
+
+    async def acquire_async(self, estimated_tokens: int, priority: Priority = Priority.LIVE,
+                            tenant: str = "default", max_wait: float | None = None) -> Reservation:
+        """acquire() for asyncio callers: waits in a worker thread, not on the event loop."""
+        return await asyncio.to_thread(self.acquire, estimated_tokens, priority, tenant, max_wait)
+
+    def _correct(self, delta: int) -> None:
+        with self._cond:
+            self.stats.tokens_corrected += delta
+            self._tokens.adjust(-delta, self._clock())
+            if delta < 0:
+                # Se devolvieron tokens: quizás entra alguien de la cola
+                self._dispatch()
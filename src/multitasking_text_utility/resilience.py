@@ -0,0 +1,292 @@
+"""Tail-latency control around a completion call.
+
+gpt-5-mini answers in ~15 s at the median but 20-25 s in the tail, and a
+single failed call used to leave the agent with nothing. call_with_resilience
+wraps any blocking call with:
+
+- a per-attempt deadline (passed to the call as its timeout) inside an
+  overall deadline for the whole query
+- jittered exponential backoff on 429/5xx/timeouts, honoring Retry-After
+- optional hedging: if the attempt has not answered after the model's
+  observed p95 latency, a duplicate request is fired; the first answer wins
+  and the other one is abandoned ("cancelled"). A request already sent
+  cannot be stopped: it runs to completion in its thread and the API bills
+  it, so callers must account for it (get_completion adds an estimate to
+  Metrics)
+- fallback to a faster model when the deadline is at risk: the primary
+  model timed out, or its p95 no longer fits in the remaining time
+
+Every attempt is returned as an AttemptRecord so callers can store retry,
+hedge and fallback rates in Metrics.
+
+The retry helpers (is_retryable, backoff_delay) are shared with batch.py.
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+DEFAULT_DEADLINE_SECONDS = 40.0
+DEFAULT_ATTEMPT_TIMEOUT_SECONDS = 30.0
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_LATENCY_WINDOW = 200
+DEFAULT_MIN_SAMPLES = 20
+
+# p95 observado en los logs, usado hasta juntar suficientes muestras propias
+DEFAULT_P95_PRIORS = {
+    "gpt-5-mini": 25.0,
+    "gpt-4o-mini": 6.0,
+    "gpt-4o": 10.0,
+}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for rate limits, 5xx, timeouts and connection errors."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # Errores de conexión de openai (APIConnectionError / APITimeoutError) no tienen status_code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _is_timeout(error: BaseException) -> bool:
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError)) or type(error).__name__ == "APITimeoutError"
+
+
+def _retry_after_seconds(error: BaseException) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: BaseException | None = None) -> float:
+    """Returns the delay before the next attempt (full jitter exponential backoff).
+
+    Args:
+        attempt: Number of attempts already made (1 for the first retry).
+        error: The error that triggered the retry, used for Retry-After.
+
+    Returns:
+        Seconds to wait before retrying.
+    """
+    retry_after = _retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX_SECONDS)
+    cap = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per model.
+
+    Args:
+        window: Latencies kept per model.
+        min_samples: Samples needed before the observed percentile replaces the prior.
+        priors: p95 used per model until min_samples is reached.
+    """
+
+    def __init__(self, window: int = DEFAULT_LATENCY_WINDOW, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 priors: dict[str, float] | None = None):
+        self.window = window
+        self.min_samples = min_samples
+        self.priors = DEFAULT_P95_PRIORS if priors is None else priors
+        self._samples: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def p95(self, model: str) -> float | None:
+        """Observed p95 latency for a model, its prior, or None if neither exists."""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return self.priors.get(model)
+        return samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+
+
+@dataclass
+class ResiliencePolicy:
+    """How hard to try before giving up on a query.
+
+    Attributes:
+        deadline_seconds: Budget for the whole query, retries included.
+        attempt_timeout_seconds: Deadline of a single attempt.
+        max_retries: Retries after the first attempt for retryable errors.
+        hedge: Fire a duplicate request when an attempt is slower than hedge_delay.
+        hedge_delay_seconds: Fixed hedge delay; None uses the model's p95.
+        fallback_model: Faster model used when the deadline is at risk (None disables).
+    """
+    deadline_seconds: float = DEFAULT_DEADLINE_SECONDS
+    attempt_timeout_seconds: float = DEFAULT_ATTEMPT_TIMEOUT_SECONDS
+    max_retries: int = DEFAULT_MAX_RETRIES
+    hedge: bool = False
+    hedge_delay_seconds: float | None = None
+    fallback_model: object | None = None
+
+
+@dataclass
+class AttemptRecord:
+    """One request sent to the API.
+
+    kind is "primary", "retry", "hedge" or "fallback"; outcome is "ok",
+    "error", "timeout" or "cancelled" (a hedge pair's loser).
+    """
+    attempt: int
+    model: str
+    kind: str
+    outcome: str
+    latency_seconds: float
+    error: str | None = None
+
+
+class ResilienceError(Exception):
+    """Raised when every attempt failed or the deadline ran out.
+
+    Attributes:
+        attempts: The AttemptRecords of the failed query.
+    """
+
+    def __init__(self, message: str, attempts: list[AttemptRecord]):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+def _model_name(model) -> str:
+    return getattr(model, "value", model)
+
+
+def call_with_resilience(call: Callable[[object, float], T], model, policy: ResiliencePolicy,
+                         tracker: LatencyTracker | None = None) -> tuple[T, list[AttemptRecord]]:
+    """Runs call(model, timeout) with deadlines, retries, hedging and fallback.
+
+    Args:
+        call: Blocking function performing one request; it must honor the
+            timeout it receives (e.g. by passing it to the OpenAI client).
+            It runs in a worker thread with a copy of the caller's context
+            variables, so its tracing spans nest under the caller's.
+        model: Primary model.
+        policy: Deadlines, retries, hedging and fallback settings.
+        tracker: Latency history used for hedge delays and deadline risk.
+
+    Returns:
+        Tuple of (result of the winning call, every attempt made).
+
+    Raises:
+        ResilienceError: When the last error is not retryable, retries run
+            out or the overall deadline expires.
+    """
+    tracker = tracker or LatencyTracker()
+    deadline = time.monotonic() + policy.deadline_seconds
+    attempts: list[AttemptRecord] = []
+    # Un hilo por intento posible: un intento abandonado por timeout no debe demorar al siguiente
+    pool = ThreadPoolExecutor(max_workers=2 * (policy.max_retries + 1), thread_name_prefix="completion")
+    current_model = model
+    kind = "primary"
+    retries = 0
+
+    def launch(attempt_model, attempt_kind: str, timeout: float) -> tuple[Future, tuple[AttemptRecord, float, float]]:
+        record = AttemptRecord(len(attempts) + 1, _model_name(attempt_model), attempt_kind, "pending", 0.0)
+        attempts.append(record)
+        # Cada intento corre con su propia copia del contexto (span actual del tracing): un hedge en
+        # paralelo no puede compartir el mismo Context
+        future = pool.submit(contextvars.copy_context().run, call, attempt_model, timeout)
+        return future, (record, time.monotonic(), timeout)
+
+    def settle(record: AttemptRecord, started: float, outcome: str) -> None:
+        record.outcome = outcome
+        record.latency_seconds = round(time.monotonic() - started, 4)
+
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ResilienceError(f"Deadline of {policy.deadline_seconds}s exceeded", attempts)
+            timeout = min(policy.attempt_timeout_seconds, remaining)
+            in_flight = dict([launch(current_model, kind, timeout)])
+
+            hedge_delay = policy.hedge_delay_seconds or tracker.p95(_model_name(current_model))
+            if policy.hedge and hedge_delay is not None and hedge_delay < timeout:
+                done, _ = wait(in_flight, timeout=hedge_delay)
+                if not done:
+                    logger.info("Attempt slower than %.1fs, sending hedged request", hedge_delay)
+                    hedge_timeout = min(timeout, deadline - time.monotonic())
+                    in_flight.update([launch(current_model, "hedge", hedge_timeout)])
+
+            last_error: BaseException | None = None
+            while in_flight:
+                wait_until = max(started + limit for _, started, limit in in_flight.values())
+                done, _ = wait(in_flight, timeout=max(0.0, wait_until - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    for pending, (record, started, _) in in_flight.items():
+                        pending.cancel()
+                        settle(record, started, "timeout")
+                    last_error = TimeoutError(f"Attempt exceeded {timeout:.1f}s")
+                    break
+                for finished in done:
+                    record, started, _ = in_flight.pop(finished)
+                    error = finished.exception()
+                    if error is None:
+                        settle(record, started, "ok")
+                        tracker.observe(record.model, record.latency_seconds)
+                        # Gana la primera respuesta: la otra se abandona (sigue corriendo y se cobra) y se descarta
+                        for loser, (loser_record, loser_started, _) in in_flight.items():
+                            loser.cancel()
+                            settle(loser_record, loser_started, "cancelled")
+                        return finished.result(), attempts
+                    settle(record, started, "timeout" if _is_timeout(error) else "error")
+                    record.error = f"{type(error).__name__}: {error}"
+                    last_error = error
+
+            if retries >= policy.max_retries or not is_retryable(last_error):
+                raise ResilienceError(f"{type(last_error).__name__}: {last_error}", attempts) from last_error
+            retries += 1
+
+            remaining = deadline - time.monotonic()
+            delay = min(backoff_delay(retries, last_error), max(0.0, remaining))
+            kind = "retry"
+            fallback = policy.fallback_model
+            if fallback is not None and _model_name(current_model) != _model_name(fallback):
+                expected = tracker.p95(_model_name(current_model)) or policy.attempt_timeout_seconds
+                if _is_timeout(last_error) or expected > remaining - delay:
+                    logger.warning("Deadline at risk, falling back from %s to %s",
+                                   _model_name(current_model), _model_name(fallback))
+                    current_model = fallback
+                    kind = "fallback"
+            logger.warning("Attempt failed (%s), retrying in %.1fs", type(last_error).__name__, delay)
+            time.sleep(delay)
+    finally:
+        # No se espera a los intentos abandonados: su resultado se descarta
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def summarize_attempts(attempts: list[AttemptRecord]) -> dict:
+    """Counts retries, hedges and fallbacks for Metrics."""
+    return {
+        "retries": sum(a.kind in ("retry", "fallback") for a in attempts),
+        "hedged": any(a.kind == "hedge" for a in attempts),
+        "fallback_model": next((a.model for a in attempts if a.kind == "fallback"), None),
+    }
@@ -0,0 +1,318 @@
+"""Section-level retrieval over the bank knowledge base.
+
+Instead of appending the whole BANK_KB to every system prompt, the knowledge
+base is split into its numbered sections (1️⃣ Transferencias Nacionales ...
+2️⃣0️⃣ Seguros) and indexed with BM25. For each query only the top-k relevant
+sections are injected into the prompt. When retrieval confidence is low
+(no lexical overlap, or a weak best match) the full KB is used instead, so
+generic questions like "productos de inversión" still see everything.
+
+The index is precomputed once and persisted to disk as JSON. It is keyed by
+a hash of the KB text, so any change to BANK_KB triggers a rebuild.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from metrics import estimate_tokens
+from text_normalization import tokenize
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_INDEX_PATH = PROJECT_ROOT / ".cache" / "kb_bm25_index.json"
+
+DEFAULT_TOP_K = 3
+# Un solo término compartido con una sección rara ronda ~2.5 de score BM25
+DEFAULT_MIN_SCORE = 2.0
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 2
+
+# Encabezados de sección: "1️⃣ Transferencias...", "2️⃣0️⃣ Seguros", "🔟 Cuenta Corriente"
+_SECTION_HEADER = re.compile(r"^((?:\d️?⃣)+|\U0001F51F)\s*(.+)$")
+
+
+@dataclass(frozen=True)
+class KBSection:
+    """A numbered section of the knowledge base.
+
+    Attributes:
+        id: Section number as a string (e.g., "10").
+        title: Section title (e.g., "Cuenta Corriente").
+        text: Original section text, header included, as it appears in the KB.
+    """
+
+    id: str
+    title: str
+    text: str
+
+
+@dataclass
+class RetrievalResult:
+    """Knowledge base fragment selected for a query.
+
+    Attributes:
+        kb_text: Text to append to the system prompt.
+        section_ids: IDs of the sections included (all of them on fallback).
+        fallback: True when the full KB was used because confidence was low.
+        top_score: BM25 score of the best matching section.
+        tokens_saved: Estimated prompt tokens saved versus sending the full KB.
+        top_section_id: ID of the best matching section (None on fallback).
+    """
+
+    kb_text: str
+    section_ids: list[str]
+    fallback: bool
+    top_score: float
+    tokens_saved: int
+    top_section_id: str | None = None
+
+
+def _section_id(marker: str) -> str:
+    if marker == "\U0001F51F":
+        return "10"
+    return "".join(ch for ch in marker if ch.isdigit())
+
+
+def parse_sections(kb: str) -> tuple[str, list[KBSection]]:
+    """Splits the knowledge base into its numbered sections.
+
+    Args:
+        kb: Full knowledge base text (e.g., BANK_KB).
+
+    Returns:
+        Tuple of (preamble, sections). The preamble is the text before the
+        first section header (the "BASE DE CONOCIMIENTO" title).
+    """
+    preamble_lines: list[str] = []
+    sections: list[KBSection] = []
+    current: tuple[str, str, list[str]] | None = None
+
+    for line in kb.strip().splitlines():
+        match = _SECTION_HEADER.match(line.strip())
+        if match:
+            if current:
+                sections.append(KBSection(current[0], current[1], "\n".join(current[2]).strip()))
+            current = (_section_id(match.group(1)), match.group(2).strip(), [line])
+        elif current:
+            current[2].append(line)
+        else:
+            preamble_lines.append(line)
+
+    if current:
+        sections.append(KBSection(current[0], current[1], "\n".join(current[2]).strip()))
+
+    return "\n".join(preamble_lines).strip(), sections
+
+
+def section_term_freqs(section: KBSection) -> dict[str, int]:
+    """Term frequencies of a section for BM25 (title weighted TITLE_WEIGHT times)."""
+    return dict(Counter(tokenize(section.title) * TITLE_WEIGHT + tokenize(section.text)))
+
+
+def kb_hash(kb: str) -> str:
+    """Returns a stable content hash for a knowledge base text."""
+    return hashlib.sha256(kb.encode("utf-8")).hexdigest()
+
+
+class BM25Index:
+    """BM25 index over the knowledge base sections.
+
+    Section titles are weighted TITLE_WEIGHT times so a query mentioning
+    "cuenta corriente" ranks that section above sections that merely
+    reference it in a bullet.
+    """
+
+    def __init__(self, kb: str, preamble: str, sections: list[KBSection],
+                 term_freqs: list[dict[str, int]], doc_freqs: dict[str, int]):
+        self.kb = kb
+        self.kb_hash = kb_hash(kb)
+        self.preamble = preamble
+        self.sections = sections
+        self.term_freqs = term_freqs
+        self.doc_freqs = doc_freqs
+        self.doc_lengths = [sum(tf.values()) for tf in term_freqs]
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        self.full_kb_tokens = estimate_tokens(kb)
+
+    @classmethod
+    def build(cls, kb: str) -> "BM25Index":
+        """Parses and indexes a knowledge base text.
+
+        Args:
+            kb: Full knowledge base text.
+
+        Returns:
+            A ready to query BM25Index.
+        """
+        preamble, sections = parse_sections(kb)
+        return cls.from_sections(kb, preamble, sections)
+
+    @classmethod
+    def from_sections(cls, kb: str, preamble: str, sections: list[KBSection],
+                      term_freqs: list[dict[str, int]] | None = None) -> "BM25Index":
+        """Indexes already parsed sections.
+
+        Args:
+            kb: Full knowledge base text (returned on fallback).
+            preamble: Text prepended to the retrieved sections.
+            sections: Sections in KB order.
+            term_freqs: Precomputed section_term_freqs per section (e.g. kept
+                from a previous build for unchanged sections).
+
+        Returns:
+            A ready to query BM25Index.
+        """
+        if term_freqs is None:
+            term_freqs = [section_term_freqs(section) for section in sections]
+        doc_freqs: Counter[str] = Counter()
+        for tf in term_freqs:
+            doc_freqs.update(tf.keys())
+        return cls(kb, preamble, sections, term_freqs, dict(doc_freqs))
+
+    def save(self, path: Path) -> None:
+        """Persists the index as JSON.
+
+        Args:
+            path: Destination file. Parent folders are created if needed.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "kb_hash": self.kb_hash,
+            "preamble": self.preamble,
+            "sections": [asdict(s) for s in self.sections],
+            "term_freqs": self.term_freqs,
+            "doc_freqs": self.doc_freqs,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: Path, kb: str) -> "BM25Index | None":
+        """Loads a persisted index if it was built from the same KB.
+
+        Args:
+            path: Index file written by save().
+            kb: Current knowledge base text.
+
+        Returns:
+            The loaded index, or None if missing, unreadable or stale.
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if payload.get("kb_hash") != kb_hash(kb):
+            return None
+
+        sections = [KBSection(**s) for s in payload["sections"]]
+        return cls(kb, payload["preamble"], sections, payload["term_freqs"], payload["doc_freqs"])
+
+    def score(self, query: str) -> list[float]:
+        """Computes the BM25 score of every section for a query.
+
+        Args:
+            query: Free-form user query.
+
+        Returns:
+            One score per section, in KB order.
+        """
+        n_docs = len(self.sections)
+        scores = [0.0] * n_docs
+        for term in set(tokenize(query)):
+            df = self.doc_freqs.get(term)
+            if not df:
+                continue
+            idf = math.log((n_docs - df + 0.5) / (df + 0.5) + 1)
+            for i, tf in enumerate(self.term_freqs):
+                freq = tf.get(term)
+                if not freq:
+                    continue
+                norm = 1 - BM25_B + BM25_B * self.doc_lengths[i] / self.avg_doc_length
+                scores[i] += idf * freq * (BM25_K1 + 1) / (freq + BM25_K1 * norm)
+        return scores
+
+    def retrieve(self, query: str, top_k: int = DEFAULT_TOP_K,
+                 min_score: float = DEFAULT_MIN_SCORE, full_kb: bool = False) -> RetrievalResult:
+        """Selects the knowledge base fragment to send for a query.
+
+        Args:
+            query: Free-form user query.
+            top_k: Maximum number of sections to include.
+            min_score: Minimum top score required to trust retrieval. Below
+                it the full KB is returned.
+            full_kb: Always return the full KB (identical prompt for every
+                query, for provider prompt caching); the ranking still sets
+                top_section_id.
+
+        Returns:
+            RetrievalResult with the KB text to inject and bookkeeping data.
+        """
+        scores = self.score(query)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        top_score = scores[ranked[0]] if ranked else 0.0
+
+        if top_score < min_score:
+            logger.info("Low retrieval confidence (score=%.2f), using full KB", top_score)
+            return RetrievalResult(
+                kb_text=self.kb,
+                section_ids=[s.id for s in self.sections],
+                fallback=True,
+                top_score=top_score,
+                tokens_saved=0,
+            )
+        if full_kb:
+            return RetrievalResult(
+                kb_text=self.kb,
+                section_ids=[s.id for s in self.sections],
+                fallback=False,
+                top_score=top_score,
+                tokens_saved=0,
+                top_section_id=self.sections[ranked[0]].id,
+            )
+
+        # Mantener el orden original de la KB para que el prompt sea estable
+        selected = sorted(i for i in ranked[:top_k] if scores[i] > 0)
+        kb_text = "\n\n".join([self.preamble] + [self.sections[i].text for i in selected])
+        return RetrievalResult(
+            kb_text=kb_text,
+            section_ids=[self.sections[i].id for i in selected],
+            fallback=False,
+            top_score=top_score,
+            tokens_saved=self.full_kb_tokens - estimate_tokens(kb_text),
+            top_section_id=self.sections[ranked[0]].id,
+        )
+
+
+def load_or_build_index(kb: str, index_path: Path | None = DEFAULT_INDEX_PATH) -> BM25Index:
+    """Returns the persisted index for a KB, rebuilding it when stale.
+
+    Args:
+        kb: Full knowledge base text.
+        index_path: Where the index is persisted. None disables persistence.
+
+    Returns:
+        BM25Index for the given KB.
+    """
+    if index_path is not None:
+        index = BM25Index.load(index_path, kb)
+        if index is not None:
+            return index
+
+    index = BM25Index.build(kb)
+    if index_path is not None:
+        try:
+            index.save(index_path)
+            logger.info("KB index saved to %s", index_path)
+        except OSError as e:
+            logger.warning("Could not persist KB index to %s: %s", index_path, e)
+    return index
@@ -0,0 +1,147 @@
+"""Cost/latency-aware model routing with confidence-based escalation.
+
+gpt-5-mini spends 2,000+ completion tokens and ~20 s even on trivial lookups
+like the Cuenta Corriente fee. The router answers with the fast, cheap model
+first and escalates to the strong one only when needed:
+
+- the local classifier flags the query as generic/inferential (e.g.
+  "productos de inversión"): the strong model is used directly
+- the cheap model's confianza is below the threshold
+- the cheap model returned invalid JSON (or failed)
+
+Every model call is recorded in Metrics.route_attempts with its cost (from
+calculate_cost) and latency; the query's tokens and estimated_cost_usd add
+up all attempts and latency_seconds is end to end, so the threshold can be
+tuned from the logs.
+"""
+
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+from metrics import Metrics, calculate_cost
+from query_classifier import QueryClass, classify_query
+from run_query import InvalidCompletionError, OpenAIModels, invalid_completion_of
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.7
+ESCALATE_CLASSES = frozenset({QueryClass.INFERENTIAL})
+
+
+@dataclass
+class RouteAttempt:
+    """One model call made while routing a query.
+
+    outcome is "ok", "low_confidence", "invalid_json" or "error".
+    """
+
+    model: str
+    outcome: str
+    confianza: float | None
+    prompt_tokens: int
+    completion_tokens: int
+    cost_usd: float
+    latency_seconds: float
+    error: str | None = None
+
+
+def _attempt_from_metrics(metrics: Metrics, outcome: str, confianza: float | None = None,
+                          error: str | None = None) -> RouteAttempt:
+    model = getattr(metrics.model, "value", metrics.model)
+    cost = calculate_cost(model, metrics.prompt_tokens, metrics.completion_tokens, metrics.cached_prompt_tokens)
+    return RouteAttempt(model, outcome, confianza, metrics.prompt_tokens, metrics.completion_tokens,
+                        round(cost, 6), metrics.latency_seconds, error)
+
+
+class ModelRouter:
+    """Routes each query to the cheap model first, escalating when needed.
+
+    Args:
+        kb_index: BM25Index used by the query classifier.
+        cheap_model: Model tried first.
+        strong_model: Model used on escalation.
+        confidence_threshold: Minimum confianza accepted from the cheap model.
+        escalate_classes: Query classes sent straight to the strong model.
+
+    Examples:
+        >>> router = ModelRouter(load_or_build_index(BANK_KB))
+        >>> get_completion(system_prompt, user_prompt, router.strong_model, client, router=router)
+    """
+
+    def __init__(self, kb_index,
+                 cheap_model: OpenAIModels = OpenAIModels.GPT_4o_mini,
+                 strong_model: OpenAIModels = OpenAIModels.GPT_5_mini,
+                 confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD,
+                 escalate_classes: frozenset[QueryClass] = ESCALATE_CLASSES):
+        self.kb_index = kb_index
+        self.cheap_model = cheap_model
+        self.strong_model = strong_model
+        self.confidence_threshold = confidence_threshold
+        self.escalate_classes = escalate_classes
+
+    @property
+    def name(self) -> str:
+        """Identifies the routed "model" (used as cache namespace)."""
+        return f"router:{self.cheap_model.value}>{self.strong_model.value}"
+
+    def route(self, user_prompt: str, complete: Callable[[OpenAIModels], tuple[dict, Metrics]]) -> tuple[dict, Metrics]:
+        """Answers a query, escalating from the cheap to the strong model.
+
+        Args:
+            user_prompt: Agent query (classified locally).
+            complete: Performs one completion with the given model and returns
+                (parsed response, metrics); raises on API or parsing errors.
+
+        Returns:
+            Tuple of (parsed response, metrics of the answering model with
+            routing fields, summed tokens/cost and end-to-end latency).
+
+        Raises:
+            Exception: Whatever the strong model's call raised.
+        """
+        start_time = time.time()
+        classification = classify_query(user_prompt, self.kb_index)
+        attempts: list[RouteAttempt] = []
+        failed_validations = 0
+
+        if classification.query_class in self.escalate_classes:
+            decision = f"direct:{classification.query_class.value}"
+            parsed, metrics = complete(self.strong_model)
+            attempts.append(_attempt_from_metrics(metrics, "ok", parsed.get("indicador_de_confianza")))
+        else:
+            reason = None
+            try:
+                parsed, metrics = complete(self.cheap_model)
+                confianza = parsed.get("indicador_de_confianza")
+                if not isinstance(confianza, (int, float)) or confianza < self.confidence_threshold:
+                    reason = "low_confidence"
+                attempts.append(_attempt_from_metrics(metrics, reason or "ok", confianza))
+            except Exception as e:
+                invalid = invalid_completion_of(e)
+                if invalid is not None:
+                    reason = "invalid_json"
+                    failed_validations = invalid.metrics.validation_failures or 0
+                    attempts.append(_attempt_from_metrics(invalid.metrics, reason, error=str(invalid)))
+                else:
+                    reason = "error"
+                    attempts.append(RouteAttempt(self.cheap_model.value, reason, None, 0, 0, 0.0,
+                                                 round(time.time() - start_time, 2), f"{type(e).__name__}: {e}"))
+
+            decision = "cheap" if reason is None else f"escalated:{reason}"
+            if reason is not None:
+                parsed, metrics = complete(self.strong_model)
+                attempts.append(_attempt_from_metrics(metrics, "ok", parsed.get("indicador_de_confianza")))
+
+        metrics.query_class = classification.query_class.value
+        metrics.routing_decision = decision
+        metrics.escalated = decision.startswith("escalated")
+        metrics.route_attempts = [asdict(a) for a in attempts]
+        if len(attempts) > 1:
+            # Lo que costó la consulta: la suma de todos los llamados
+            metrics.prompt_tokens = sum(a.prompt_tokens for a in attempts)
+            metrics.completion_tokens = sum(a.completion_tokens for a in attempts)
+            metrics.total_tokens = metrics.prompt_tokens + metrics.completion_tokens
+            metrics.estimated_cost_usd = round(sum(a.cost_usd for a in attempts), 4)
+        if failed_validations:
+            metrics.validation_failures = (metrics.validation_failures or 0) + failed_validations
+        metrics.latency_seconds = round(time.time() - start_time, 2)
+        return parsed, metrics
@@ -13,11 +13,12 @@ su comportamiento.
 El script, a traves de un input, pide al usuario que ingrese su consulta. Puede tipear un texto libre o puede
 digitar un numero para elegir entre las opciones pre-cargadas.
 
-El script ejecuta y devuelve en la consola la respuesta y unas metricas basicas. Ademas graba un json con las metricas
-completas, la consulta, y la respuesta mas completa. También se infoma sobre la ubicación del archivo de output.
+El script ejecuta y devuelve en la consola la respuesta y unas metricas basicas. Ademas agrega una linea a un log
+JSONL con las metricas completas, la consulta, y la respuesta mas completa. También se infoma sobre la ubicación del
+archivo de output.
 
-El archivo de output esta nombrado con un timestamp de mode de tener versionadas la ejecuciones para poder comparar
-los resultados bajo distintas condiciones.
+Cada ejecución queda en su propia línea del log (con el timestamp en las métricas), de modo de tener versionadas
+las ejecuciones para poder comparar los resultados bajo distintas condiciones.
 
 Los pasos del script son los siguientes:
 
@@ -27,25 +28,45 @@ Los pasos del script son los siguientes:
 3. Inicializar el cliente de OpenAI
 4. Establecer el system_prompt a utilizar
 5. Selecciona la consulta a utilizar
-6. Enviar consulta al modelo
-7. Imprime y graba el resultado
+6. Recuperar las secciones relevantes de la KB (retrieval) y armar el system prompt
+7. Enviar consulta al modelo
+8. Imprime y graba el resultado
+
+Con --session el script queda abierto respondiendo consultas en un loop (incluidos los atajos 1-4): el cliente, el
+indice de la KB y los caches se inicializan una sola vez, en segundo plano mientras se escribe la primera consulta, y
+después de cada respuesta se muestran sus metricas y las de la sesion (p50/p95 de latencia y costo acumulado).
+
+Con --trace cada fase de la consulta (retrieval, clasificación, caches, llamado a la API, parseo, log) se mide con un
+span y se graba en LOGS/traces.jsonl; con --profile-slow-ms además se perfilan con cProfile las consultas lentas.
 
 """
 
+import argparse
+import threading
 import time
-import json
 import os
 import sys
 from datetime import datetime
 from pathlib import Path
-from openai import OpenAI
-from dotenv import load_dotenv
 from logger import get_logger
 from enum import Enum
-from prompts import BANK_ASSISTANT_SYSTEM_PROMPT, ONE_SHOT_EXAMPLE
+from prompt_builder import build_messages, compose_system_prompt
 from bank_kb import BANK_KB
-from dataclasses import asdict
-from metrics import Metrics, calculate_cost
+from dataclasses import asdict, replace
+from metrics import Metrics, SessionStats, calculate_cost, print_metrics_summary
+from metrics_sink import get_sink
+from retrieval import load_or_build_index
+from answer_store import AnswerStore
+from cache import ResponseCache, cache_key, prompt_version
+from coalescing import SingleFlight
+from fact_index import FactIndex
+from live_metrics import get_live_metrics, serve_metrics
+from budgets import OutputBudget, budget_for, check_request_size, estimate_request_tokens
+from query_classifier import classify_query
+from rate_limiter import DEFAULT_COMPLETION_ESTIMATE_TOKENS, Priority, RateLimitScheduler
+from structured_output import RESPONSE_FORMAT, parse_response
+from resilience import DEFAULT_DEADLINE_SECONDS, LatencyTracker, ResilienceError, ResiliencePolicy, call_with_resilience, summarize_attempts
+from tracing import DEFAULT_TRACE_PATH, configure_tracing, current_trace_id, span
 
 # Obtener el root del proyecto
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
@@ -53,6 +74,7 @@ sys.path.insert(0, str(PROJECT_ROOT))
 
 METRICS_LOG_FOLDER = PROJECT_ROOT / "LOGS"
 APPLICATION_NAME = "SoporteCliente"
+METRICS_LOG_FILE = f"{APPLICATION_NAME}.jsonl"
 
 logger = get_logger()
 
@@ -61,112 +83,697 @@ class OpenAIModels(str,Enum): # Str -> Para que los valores sean cadenas de text
     GPT_4o_mini = "gpt-4o-mini"
     GPT_5_mini = "gpt-5-mini"
 
-def get_completion(system_prompt: str, # Define el comportamiento del modelo
-                   user_prompt: str,  # Es ;la solicitud del usuario
-                   model: str, client,
-                   temperature: float | None = 0.0, context: str | None = APPLICATION_NAME):
-
-    # Construcción de los mensajes
-    messages = [
-        {"role": "user", "content": user_prompt},
-        {"role": "system", "content": system_prompt}
-    ]
-
-    try:
-        start_time = time.time()
-        # LLamado a la API de OpenAI
+# Consultas de ejemplo pre-cargadas, seleccionables por número
+SAMPLE_QUERIES = {
+    "1": "Cuál es la comisión de Cuenta Corriente ?",  # Pregunta con respuesta directa en la KB
+    "2": "Que medicina debo tomar para un dolor de cabeza liviano ?",  # Fuera del expertise
+    "3": "Que productos de inversion tiene para ofrecer ?",  # No hay respuesta directa en la KB
+    "4": "Cual es la rentabilidad anual en cuentas de money market ?",  # Consulta por producto que no ofrece
+}
+
+
+def build_system_prompt(user_prompt: str, kb_index, one_shot: bool = True, full_kb: bool = False):
+    """Arma el system prompt con las secciones de la KB relevantes para la consulta (o la KB completa si full_kb)."""
+    with span("retrieval_and_prompt") as s:
+        # Recuperar solo las secciones relevantes de la KB (o la KB completa si la confianza es baja)
+        retrieval = kb_index.retrieve(user_prompt, full_kb=full_kb)
+        s.set("sections", len(retrieval.section_ids))
+        s.set("kb_fallback", retrieval.fallback)
+        return compose_system_prompt(retrieval.kb_text, one_shot), retrieval
+
+
+def get_cached_tokens(usage) -> int:
+    """Tokens del prompt servidos desde el prompt cache del proveedor (0 si no se informan)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None)
+    return cached if isinstance(cached, int) else 0
+
+
+def get_reasoning_tokens(usage) -> int | None:
+    """Tokens de razonamiento (ocultos) incluidos en completion_tokens, si la API los informa."""
+    details = getattr(usage, "completion_tokens_details", None)
+    reasoning = getattr(details, "reasoning_tokens", None)
+    return reasoning if isinstance(reasoning, int) else None
+
+
+def build_metrics(model, usage, latency: float,
+                  temperature: float | None = 0.0, context: str | None = APPLICATION_NAME,
+                  batch: bool = False) -> Metrics:
+    """Construye las métricas de una llamada a partir del usage devuelto por la API."""
+    cached_tokens = get_cached_tokens(usage)
+    cost = calculate_cost(
+        model.value,
+        usage.prompt_tokens,
+        usage.completion_tokens,
+        cached_tokens,
+        batch
+    )
+
+    return Metrics(
+        model=model,
+        temperature=round(temperature,5),
+        prompt_tokens=usage.prompt_tokens,
+        completion_tokens=usage.completion_tokens,
+        total_tokens=usage.total_tokens,
+        cached_prompt_tokens=cached_tokens,
+        reasoning_tokens=get_reasoning_tokens(usage),
+        estimated_cost_usd=round(cost,4),
+        latency_seconds=round(latency,2),
+        tokens_per_second=round(usage.completion_tokens / latency, 1) if latency > 0 else None,
+        timestamp=datetime.now().isoformat(),
+        context=context if context else None,
+        output_path=str(METRICS_LOG_FOLDER)
+    )
+
+
+def build_cache_hit_metrics(model, latency: float,
+                            temperature: float | None = 0.0, context: str | None = APPLICATION_NAME) -> Metrics:
+    """Métricas de una respuesta servida desde el cache: sin tokens ni costo."""
+    return Metrics(
+        model=model,
+        temperature=round(temperature,5),
+        prompt_tokens=0,
+        completion_tokens=0,
+        total_tokens=0,
+        estimated_cost_usd=0.0,
+        latency_seconds=round(latency,4),
+        timestamp=datetime.now().isoformat(),
+        context=context if context else None,
+        output_path=str(METRICS_LOG_FOLDER),
+        cache_hit=True,
+    )
+
+
+def build_coalesced_metrics(metrics: Metrics, latency: float) -> Metrics:
+    """Métricas de una respuesta compartida con una consulta idéntica en curso: sin tokens ni costo propios."""
+    return replace(metrics, prompt_tokens=0, completion_tokens=0, total_tokens=0, cached_prompt_tokens=0,
+                   reasoning_tokens=None, estimated_cost_usd=0.0, latency_seconds=round(latency, 4),
+                   tokens_per_second=None, timestamp=datetime.now().isoformat(),
+                   coalesced=True, coalesced_requests=None, queue_wait_seconds=None)
+
+
+def build_fact_index_metrics(latency: float, fact_index: FactIndex,
+                             temperature: float | None = 0.0, context: str | None = APPLICATION_NAME) -> Metrics:
+    """Métricas de una respuesta del índice de hechos de la KB: sin modelo, tokens ni costo."""
+    return Metrics(
+        model="fact_index",
+        temperature=round(temperature,5),
+        prompt_tokens=0,
+        completion_tokens=0,
+        total_tokens=0,
+        estimated_cost_usd=0.0,
+        latency_seconds=round(latency,6),
+        timestamp=datetime.now().isoformat(),
+        context=context if context else None,
+        output_path=str(METRICS_LOG_FOLDER),
+        fact_index_hit=True,
+        fact_lookup_us=round(latency * 1e6, 1),
+        fact_index_hit_rate=round(fact_index.stats.hit_rate, 4),
+    )
+
+
+def parse_completion_with_repairs(content: str) -> tuple[dict, list[str]]:
+    """Como parse_completion, devolviendo además las reparaciones locales aplicadas al JSON."""
+    parsed, repairs = parse_response(content)
+
+    return {
+        "respuesta": parsed.respuesta,
+        "indicador_de_confianza": parsed.confianza,
+        "acciones_recomendadas": parsed.acciones_recomendadas,
+           }, repairs
+
+
+def parse_completion(content: str) -> dict:
+    """Convierte el JSON devuelto por el modelo al formato de respuesta del asistente."""
+    return parse_completion_with_repairs(content)[0]
+
+
+class InvalidCompletionError(ValueError):
+    """La respuesta del modelo no es el JSON esperado; conserva las métricas del llamado (tokens y costo)."""
+
+    def __init__(self, message: str, metrics: Metrics):
+        super().__init__(message)
+        self.metrics = metrics
+
+
+def invalid_completion_of(error: BaseException) -> InvalidCompletionError | None:
+    """Devuelve el InvalidCompletionError detrás de un error (la capa de resiliencia lo envuelve)."""
+    for candidate in (error, error.__cause__):
+        if isinstance(candidate, InvalidCompletionError):
+            return candidate
+    return None
+
+
+def add_call_usage(metrics: Metrics, previous: Metrics) -> None:
+    """Suma a las métricas los tokens y el costo de un llamado anterior descartado."""
+    metrics.prompt_tokens += previous.prompt_tokens
+    metrics.completion_tokens += previous.completion_tokens
+    metrics.total_tokens += previous.total_tokens
+    metrics.estimated_cost_usd = round(metrics.estimated_cost_usd + previous.estimated_cost_usd, 4)
+    if previous.validation_failures:
+        metrics.validation_failures = (metrics.validation_failures or 0) + previous.validation_failures
+
+
+def add_hedge_overhead(metrics: Metrics, attempts: list) -> None:
+    """Suma a las métricas el costo estimado de los perdedores de un hedge.
+
+    El request perdedor no se puede frenar: termina en su hilo y la API lo cobra, pero su usage llega después de
+    que la consulta ya respondió. Se estima con el mismo prompt y la misma cantidad de tokens de salida que el ganador.
+    """
+    losers = [a for a in attempts if a.outcome == "cancelled"]
+    if not losers:
+        return
+    cost = sum(calculate_cost(a.model, metrics.prompt_tokens, metrics.completion_tokens) for a in losers)
+    metrics.hedge_overhead_tokens = metrics.total_tokens * len(losers)
+    metrics.hedge_overhead_cost_usd = round(cost, 6)
+    metrics.prompt_tokens += metrics.prompt_tokens * len(losers)
+    metrics.completion_tokens += metrics.completion_tokens * len(losers)
+    metrics.total_tokens += metrics.hedge_overhead_tokens
+    metrics.estimated_cost_usd = round(metrics.estimated_cost_usd + cost, 4)
+
+
+def request_completion(client, model, messages: list[dict],
+                       temperature: float | None = 0.0, context: str | None = APPLICATION_NAME,
+                       timeout: float | None = None,
+                       budget: OutputBudget | None = None,
+                       structured_output: bool = False) -> tuple[dict, Metrics]:
+    """Un único llamado a la API: devuelve la respuesta parseada y sus métricas (lanza excepción si falla)."""
+    start_time = time.time()
+    # LLamado a la API de OpenAI (con timeout solo si lo pide la capa de resiliencia)
+    extra = {"timeout": timeout} if timeout is not None else {}
+    if budget is not None:
+        # Presupuesto de salida: tope de tokens de completion y esfuerzo de razonamiento
+        extra.update(budget.request_params(getattr(model, "value", model)))
+    if structured_output:
+        # La API restringe la salida al JSON schema de la respuesta
+        extra["response_format"] = RESPONSE_FORMAT
+    with span("api_call", model=getattr(model, "value", model)):
         response = client.chat.completions.create(
             model=model,
-            messages=messages
+            messages=messages,
+            **extra
         )
-        latency = (time.time() - start_time)
-        content = response.choices[0].message.content
+    latency = (time.time() - start_time)
+    content = response.choices[0].message.content
+
+    metrics = build_metrics(model, response.usage, latency, temperature, context)
+    if budget is not None:
+        metrics.max_completion_tokens = budget.max_completion_tokens
+        metrics.reasoning_effort = budget.reasoning_effort
+    if response.choices[0].finish_reason == "length":
+        raise InvalidCompletionError("Completion truncated at max_completion_tokens", metrics)
+    metrics.structured_output = structured_output
+    try:
+        # Reparación local (fences, texto alrededor, comas sobrantes) antes de descartar el llamado
+        with span("parse_completion"):
+            parsed, metrics.json_repairs = parse_completion_with_repairs(content)
+    except (ValueError, KeyError, TypeError) as e:
+        metrics.validation_failures = 1
+        raise InvalidCompletionError(f"{type(e).__name__}: {e}", metrics) from e
+    metrics.validation_failures = 0
+    return parsed, metrics
 
-        usage = response.usage
 
-        cost = calculate_cost(
-            model.value,
-            usage.prompt_tokens,
-            usage.completion_tokens
-        )
+# Latencias observadas por modelo en este proceso (para hedging y fallback)
+LATENCY_TRACKER = LatencyTracker()
 
-        metrics = Metrics(
-            model=model,
-            temperature=round(temperature,5),
-            prompt_tokens=usage.prompt_tokens,
-            completion_tokens=usage.completion_tokens,
-            total_tokens=usage.total_tokens,
-            estimated_cost_usd=round(cost,4),
-            latency_seconds=round(latency,2),
-            timestamp=datetime.now().isoformat(),
-            context=context if context else None,
-            output_path=str(METRICS_LOG_FOLDER)
-        )
 
-        parsed = json.loads(content)
-
-        return {
-            "respuesta": parsed["respuesta"],
-            "indicador_de_confianza": parsed["confianza"],
-            "acciones_recomendadas": parsed["acciones_recomendadas"],
-               }, metrics
+def get_completion(system_prompt: str, # Define el comportamiento del modelo
+                   user_prompt: str,  # Es ;la solicitud del usuario
+                   model: str, client,
+                   temperature: float | None = 0.0, context: str | None = APPLICATION_NAME,
+                   cache: ResponseCache | None = None,
+                   semantic_cache=None,
+                   resilience: ResiliencePolicy | None = None,
+                   router=None,
+                   fact_index: FactIndex | None = None,
+                   budget: OutputBudget | None = None,
+                   structured_output: bool = False,
+                   coalescer: SingleFlight | None = None,
+                   scheduler: RateLimitScheduler | None = None,
+                   priority: Priority = Priority.LIVE,
+                   tenant: str | None = None,
+                   micro_batcher=None,
+                   answer_store: AnswerStore | None = None,
+                   top_section: str | None = None):
+
+    # Construcción de los mensajes: prefijo estático (cacheable) primero, consulta al final
+    messages = build_messages(system_prompt, user_prompt)
+    # Con router, el modelo lo decide el router: el cache se separa por router en lugar de por modelo
+    model_name = router.name if router is not None else getattr(model, "value", model)
+
+    # Camino rápido: las consultas directas se responden con un dato de la KB, sin llamar al modelo
+    fact_lookup_seconds = None
+    if fact_index is not None:
+        with span("fact_index_lookup") as s:
+            answer, fact_lookup_seconds = fact_index.timed_answer(user_prompt)
+            s.set("hit", answer is not None)
+        if answer is not None:
+            return answer, build_fact_index_metrics(fact_lookup_seconds, fact_index, temperature, context)
+
+    def with_fact_stats(metrics: Metrics) -> Metrics:
+        if fact_lookup_seconds is not None:
+            metrics.fact_index_hit = False
+            metrics.fact_lookup_us = round(fact_lookup_seconds * 1e6, 1)
+            metrics.fact_index_hit_rate = round(fact_index.stats.hit_rate, 4)
+        return metrics
+
+    # Respuestas precalculadas para las consultas más frecuentes (ver cache_warming.py)
+    if answer_store is not None:
+        start_time = time.time()
+        with span("answer_store_lookup") as s:
+            precomputed = answer_store.get(user_prompt)
+            s.set("hit", precomputed is not None)
+        if precomputed is not None:
+            metrics = build_cache_hit_metrics(model, time.time() - start_time, temperature, context)
+            metrics.precomputed_answer = True
+            return precomputed, with_fact_stats(metrics)
+
+    # Si la consulta ya fue respondida con el mismo modelo y prompt, se devuelve desde el cache
+    if cache is not None:
+        start_time = time.time()
+        with span("cache_lookup") as s:
+            cached = cache.get(model_name, system_prompt, user_prompt)
+            s.set("hit", cached is not None)
+        if cached is not None:
+            return cached, with_fact_stats(build_cache_hit_metrics(model, time.time() - start_time, temperature, context))
+
+    # Si no hay match exacto, se busca una consulta parecida (paráfrasis) en el cache semántico
+    # (solo entre consultas cuya sección principal de la KB es la misma: top_section)
+    semantic_match = None
+    if semantic_cache is not None:
+        start_time = time.time()
+        with span("semantic_cache_lookup") as s:
+            semantic_match = semantic_cache.search(model_name, user_prompt, top_section)
+            s.set("hit", semantic_match is not None and semantic_match.hit)
+        if semantic_match is not None and semantic_match.hit:
+            metrics = build_cache_hit_metrics(model, time.time() - start_time, temperature, context)
+            metrics.semantic_similarity = round(semantic_match.similarity, 4)
+            return semantic_match.response, with_fact_stats(metrics)
+
+    # Estimación previa del prompt: los pedidos demasiado grandes se rechazan antes de enviarse
+    estimated_prompt_tokens = estimate_request_tokens(messages)
+
+    # Espera en la cola del rate limiter de cada request (router, reintentos y hedges incluidos)
+    queue_waits: list[float] = []
+
+    def call_once(call_model, call_budget: OutputBudget | None):
+        check_request_size(getattr(call_model, "value", call_model), estimated_prompt_tokens,
+                           call_budget.max_completion_tokens if call_budget else 0)
+        return send(call_model, call_budget)
+
+    def request(call_model, call_budget: OutputBudget | None, timeout: float | None = None):
+        if scheduler is None:
+            return request_completion(client, call_model, messages, temperature, context, timeout, call_budget,
+                                      structured_output)
+        # Límites RPM/TPM de la cuenta: cada intento (reintentos y hedges incluidos) es un request y se reserva
+        # por separado, con la estimación previa, corrigiéndose con el usage real
+        estimated_tokens = estimated_prompt_tokens + (call_budget.max_completion_tokens if call_budget
+                                                      else DEFAULT_COMPLETION_ESTIMATE_TOKENS)
+        with span("rate_limit_queue", priority=priority.name.lower()):
+            # Con resiliencia la espera en la cola consume el timeout del intento
+            reservation = scheduler.acquire(estimated_tokens, priority, tenant or context or "default",
+                                            max_wait=timeout)
+        queue_waits.append(reservation.wait_seconds)
+        if timeout is not None:
+            timeout = max(0.1, timeout - reservation.wait_seconds)
+        try:
+            parsed, metrics = request_completion(client, call_model, messages, temperature, context, timeout,
+                                                 call_budget, structured_output)
+        except Exception as e:
+            invalid = invalid_completion_of(e)
+            # Sin usage (timeout, 429): queda cobrada la estimación
+            reservation.settle(invalid.metrics.total_tokens if invalid is not None else None)
+            raise
+        reservation.settle(metrics.total_tokens)
+        return parsed, metrics
+
+    def send(call_model, call_budget: OutputBudget | None):
+        if resilience is None:
+            parsed, metrics = request(call_model, call_budget)
+        else:
+            # Deadlines por intento, reintentos con backoff, hedging y fallback de modelo
+            start_time = time.time()
+            (parsed, metrics), attempts = call_with_resilience(
+                lambda attempt_model, timeout: request(attempt_model, call_budget, timeout),
+                call_model, resilience, LATENCY_TRACKER)
+            metrics.latency_seconds = round(time.time() - start_time, 2)
+            metrics.attempts = [asdict(a) for a in attempts]
+            for key, value in summarize_attempts(attempts).items():
+                setattr(metrics, key, value)
+            add_hedge_overhead(metrics, attempts)
+        metrics.estimated_prompt_tokens = estimated_prompt_tokens
+        return parsed, metrics
+
+    def complete(call_model):
+        if budget is None:
+            return call_once(call_model, None)
+        try:
+            parsed, metrics = call_once(call_model, budget)
+            metrics.budget_retry = False
+            return parsed, metrics
+        except Exception as e:
+            first = invalid_completion_of(e)
+            if first is None:
+                raise
+        # Salida truncada o ilegible: un único reintento con más presupuesto
+        logger.warning("Respuesta truncada o inválida con %s, reintentando con %s", budget, budget.escalated())
+        try:
+            parsed, metrics = call_once(call_model, budget.escalated())
+        except Exception as e:
+            second = invalid_completion_of(e)
+            if second is not None:
+                add_call_usage(second.metrics, first.metrics)
+            raise
+        add_call_usage(metrics, first.metrics)
+        metrics.budget_retry = True
+        return parsed, metrics
+
+    def complete_query():
+        batch_share = None
+        if micro_batcher is not None:
+            # Micro-batching: la consulta viaja junto con las que llegan en la misma ventana
+            with span("micro_batch") as s:
+                batched, batch_share = micro_batcher.submit(user_prompt, priority)
+                s.set("batched", batched is not None)
+            if batched is not None:
+                return batched, batch_share
+        if router is None:
+            parsed, metrics = complete(model)
+        else:
+            # Primero el modelo rápido y barato; escala al más capaz si la respuesta no alcanza
+            parsed, metrics = router.route(user_prompt, complete)
+        if batch_share is not None:
+            # El batch no la respondió: se suma su parte del llamado batcheado al llamado individual
+            add_call_usage(metrics, batch_share)
+            metrics.micro_batch_size = batch_share.micro_batch_size
+            metrics.micro_batch_fallback = True
+        if scheduler is not None:
+            batch_wait = batch_share.queue_wait_seconds if batch_share is not None else None
+            metrics.queue_wait_seconds = round(sum(queue_waits) + (batch_wait or 0.0), 4)
+            metrics.priority = priority.name.lower()
+        return parsed, metrics
 
+    try:
+        if coalescer is None:
+            parsed, metrics = complete_query()
+        else:
+            # Consultas idénticas en curso (mismo modelo, prompt y consulta normalizada) comparten un único llamado
+            start_time = time.time()
+            (parsed, metrics), flight = coalescer.do(cache_key(model_name, system_prompt, user_prompt),
+                                                     complete_query)
+            if not flight.leader:
+                # El llamado (y el cacheo de la respuesta) lo hizo otra consulta
+                return parsed, with_fact_stats(build_coalesced_metrics(metrics, time.time() - start_time))
+            metrics.coalesced = False
+            metrics.coalesced_requests = flight.followers
+
+        with span("cache_store"):
+            if cache is not None:
+                metrics.cache_hit = False
+                cache.put(model_name, system_prompt, user_prompt, parsed)
+            if semantic_cache is not None:
+                metrics.cache_hit = False
+                metrics.semantic_similarity = round(semantic_match.similarity, 4) if semantic_match else None
+                semantic_cache.add(model_name, user_prompt, parsed, top_section)
+
+        return parsed, with_fact_stats(metrics)
+
+    except ResilienceError as e:
+        attempts = ", ".join(f"{a.model}/{a.kind}: {a.outcome}" for a in e.attempts)
+        return f"An error occurred: {e} (attempts: {attempts})"
     except Exception as e:
         return f"An error occurred: {e}"
 
 
-def main() -> None:
-
-    input_query = input("Ingrese la consulta: ")
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Asistente para agentes de soporte al cliente.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Mostrar la respuesta a medida que el modelo la genera")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE_SECONDS,
+                        help="Tiempo máximo (segundos) para responder, reintentos incluidos")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Enviar una consulta duplicada si la primera supera el p95 de latencia")
+    parser.add_argument("--model", default="auto", choices=["auto"] + [m.value for m in OpenAIModels],
+                        help="auto: gpt-4o-mini primero, escalando a gpt-5-mini si la confianza es baja")
+    parser.add_argument("--structured-output", action="store_true",
+                        help="Enviar el JSON schema de la respuesta como response_format de la API")
+    parser.add_argument("--kb-dir", type=Path, default=None,
+                        help="Carpeta con documentos .md/.txt de la KB (se recarga al modificarse)")
+    parser.add_argument("--full-kb", action="store_true",
+                        help="Enviar siempre la KB completa: prompt idéntico en cada consulta, cacheable por OpenAI")
+    parser.add_argument("--session", action="store_true",
+                        help="Modo sesión: responder varias consultas sin reinicializar cliente ni caches")
+    parser.add_argument("--trace", action="store_true",
+                        help=f"Medir cada fase de la consulta y grabar los spans en {DEFAULT_TRACE_PATH.name}")
+    parser.add_argument("--profile-slow-ms", type=float, default=None,
+                        help="Perfilar con cProfile y guardar (.prof) las consultas más lentas que este umbral")
+    parser.add_argument("--profile-sample-rate", type=float, default=1.0,
+                        help="Fracción de consultas que se ejecutan bajo cProfile cuando se usa --profile-slow-ms")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Exponer latencia y costo (ventanas de 1m y 1h) en formato Prometheus en este puerto local")
+    return parser.parse_args(argv)
+
+
+def create_client():
+    """Carga las variables de entorno y crea el cliente de OpenAI (openai se importa recién acá: tarda ~1 s)."""
+    from dotenv import load_dotenv
+    from openai import OpenAI
 
-    # Cargo variables de entorno
     load_dotenv()
+    # Sin reintentos ocultos del SDK: los hace call_with_resilience, con sus deadlines, registro de intentos y
+    # reservas del rate limiter
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+def load_semantic_cache(version: str | None = None):
+    """Carga el cache semántico (import diferido: numpy y scikit-learn tardan ~1.5 s)."""
+    from semantic_cache import SemanticCache
+
+    return SemanticCache.load(version=version)
+
+
+class AssistantSession:
+    """Estado que se inicializa una sola vez y se reutiliza entre consultas.
+
+    Args:
+        args: Argumentos de línea de comandos (ver parse_args).
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        # Seleccionando el modelo a utilizar
+        self.model1 = OpenAIModels.GPT_4o_mini  # Worst results
+        self.model2 = OpenAIModels.GPT_5_mini  # Much better results
+        # auto: el router elige entre los dos según la consulta y la confianza de la respuesta
+        self.model = self.model2 if args.model == "auto" else OpenAIModels(args.model)
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def warm_up(self) -> None:
+        """Inicializa cliente, índice de la KB, router y caches (una sola vez, thread-safe)."""
+        with self._lock:
+            if self._ready:
+                return
+            self.client = create_client()
+            self.kb_store = None
+            if self.args.kb_dir:
+                # KB leída de una carpeta de documentos y recargada al modificarse
+                from kb_store import KBStore
+                self.kb_store = KBStore(self.args.kb_dir)
+                self.kb_index, self.fact_index = self.kb_store.snapshot.index, self.kb_store.snapshot.fact_index
+                version = self.kb_store.snapshot.prompt_version
+            else:
+                self.kb_index = load_or_build_index(BANK_KB)
+                self.fact_index = FactIndex.from_kb(BANK_KB)
+                version = None
+            # Respuestas precalculadas por cache_warming.py (si existen y son de esta versión del prompt)
+            self.answer_store = AnswerStore.load(version=version or prompt_version())
+            self.router = None
+            if self.args.model == "auto" and not self.args.stream:
+                from router import ModelRouter
+                self.router = ModelRouter(self.kb_index, cheap_model=self.model1, strong_model=self.model2)
+            self.cache = ResponseCache(version=version)
+            self.semantic_cache = None if self.args.stream else load_semantic_cache(version=version)
+            self.resilience = ResiliencePolicy(deadline_seconds=self.args.deadline, hedge=self.args.hedge,
+                                               fallback_model=self.model1)
+            if self.kb_store is not None:
+                self.kb_store.subscribe(self._on_kb_change)
+                self.kb_store.watch()
+            self._ready = True
+
+    def _on_kb_change(self, snapshot) -> None:
+        # Nueva versión de la KB: índices nuevos y caches invalidados
+        self.kb_index, self.fact_index = snapshot.index, snapshot.fact_index
+        if self.router is not None:
+            self.router.kb_index = snapshot.index
+        self.cache.set_version(snapshot.prompt_version)
+        if self.answer_store is not None:
+            self.answer_store.set_version(snapshot.prompt_version)
+        if self.semantic_cache is not None:
+            self.semantic_cache.set_version(snapshot.prompt_version)
+
+    def _current_kb(self):
+        """Índice y fact index de la versión actual de la KB (leídos juntos)."""
+        if self.kb_store is None:
+            return self.kb_index, self.fact_index
+        snapshot = self.kb_store.snapshot
+        return snapshot.index, snapshot.fact_index
+
+    def warm_up_in_background(self) -> threading.Thread:
+        """Inicializa en un thread mientras se escribe la consulta (los errores se repiten en ask)."""
+        def run():
+            try:
+                self.warm_up()
+            except Exception as e:
+                logger.debug("Inicialización en segundo plano fallida: %s: %s", type(e).__name__, e)
+
+        thread = threading.Thread(target=run, name="session-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self) -> None:
+        """Persiste el cache semántico si tiene entradas sin guardar."""
+        semantic_cache = getattr(self, "semantic_cache", None)
+        if semantic_cache is not None and semantic_cache.dirty:
+            semantic_cache.save()
+
+    def ask(self, user_prompt: str) -> tuple[dict, Metrics] | None:
+        """Responde una consulta, la imprime y la graba en el log JSONL.
+
+        Returns:
+            (respuesta, métricas), o None si no se pudo obtener una respuesta del modelo.
+        """
+        with span("query", stream=self.args.stream) as root:
+            result = self._answer(user_prompt)
+            root.set("answered", result is not None)
+            return result
+
+    def _answer(self, user_prompt: str) -> tuple[dict, Metrics] | None:
+        with span("warm_up"):
+            self.warm_up()
+        kb_index, fact_index = self._current_kb()
+        # Establecer el system_prompt a utilizar (con one-shot y las secciones relevantes de la KB)
+        system_prompt, retrieval = build_system_prompt(user_prompt, kb_index, full_kb=self.args.full_kb)
+
+        print('=='*32)
+        logger.info("Enviando consulta al modelo: %s\nConsulta: %s",
+                    self.router.name if self.router else self.model.value, user_prompt)
+        if self.args.stream:
+            # Modo streaming: se imprime la respuesta a medida que llega (sin cache)
+            from streaming import stream_completion
+            try:
+                stream = stream_completion(system_prompt, user_prompt, self.model, self.client)
+                print('Respuesta del modelo: ', end='', flush=True)
+                for delta in stream:
+                    print(delta, end='', flush=True)
+                print('\n')
+                result = stream.result, stream.metrics
+            except Exception as e:
+                # Error de la API o JSON inválido a mitad del stream: se trata igual que sin streaming
+                print()
+                result = f"An error occurred: {e}"
+        else:
+            # Presupuesto de salida según el tipo de consulta (lookup directo, listado, inferencial, fuera de dominio)
+            with span("classify") as s:
+                query_class = classify_query(user_prompt, kb_index).query_class
+                s.set("query_class", query_class)
+            budget = budget_for(query_class)
+            with span("get_completion"):
+                result = get_completion(system_prompt, user_prompt, self.model, self.client,
+                                        cache=self.cache, semantic_cache=self.semantic_cache,
+                                        resilience=self.resilience, router=self.router, fact_index=fact_index,
+                                        budget=budget, structured_output=self.args.structured_output,
+                                        answer_store=self.answer_store, top_section=retrieval.top_section_id)
+            # El cache semántico se persiste cada tanto (y al cerrar la sesión), no en cada consulta
+            with span("semantic_cache_save"):
+                self.semantic_cache.save_if_due()
+        if isinstance(result, str):
+            # Sin respuesta del modelo: se informa y se registra el error en lugar de fallar
+            logger.error(result)
+            get_live_metrics().observe_error(self.router.name if self.router else self.model, APPLICATION_NAME)
+            sink = get_sink(METRICS_LOG_FOLDER / METRICS_LOG_FILE)
+            sink.write({'metrics': None, 'consulta': user_prompt, 'error': result,
+                        'timestamp': datetime.now().isoformat()})
+            sink.flush()
+            print('No se pudo obtener una respuesta del modelo. Intente nuevamente en unos segundos.')
+            return None
+        json_response, metrics = result
+        metrics.retrieved_sections = retrieval.section_ids
+        metrics.kb_fallback = retrieval.fallback
+        metrics.kb_tokens_saved = retrieval.tokens_saved
+        metrics.trace_id = current_trace_id()
+        with span("metrics_log"):
+            get_live_metrics().observe(metrics)
+            response_dict = {'metrics': asdict(metrics)}
+            response_dict['consulta'] = user_prompt
+            response_dict['respuesta'] = json_response
+            # Agregar las métricas al log JSONL (una línea por consulta, sin pisar ejecuciones anteriores)
+            file_path = METRICS_LOG_FOLDER / METRICS_LOG_FILE
+            sink = get_sink(file_path)
+            sink.write(response_dict)
+            sink.flush()
+
+        print('=='*32)
+        if not self.args.stream:
+            print(f'Respuesta del modelo: {json_response['respuesta']}\n')
+
+        logger.info("Consulta respondida. Tokens: %s, Cost: %s,\nResultados en: %s",
+                    metrics.total_tokens, metrics.estimated_cost_usd, file_path)
+        return json_response, metrics
+
+
+EXIT_COMMANDS = {"salir", "exit", "quit", "q"}
+
+
+def run_session(session: AssistantSession) -> SessionStats:
+    """Loop de consultas sobre una sesión ya creada, hasta 'salir' o EOF (Ctrl-D)."""
+    stats = SessionStats()
+    print("Modo sesión: ingrese consultas (1-4 para las de ejemplo, 'salir' para terminar)")
+    while True:
+        try:
+            input_query = input("Consulta> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if not input_query:
+            continue
+        if input_query.lower() in EXIT_COMMANDS:
+            break
+        result = session.ask(SAMPLE_QUERIES.get(input_query, input_query))
+        if result is None:
+            stats.errors += 1
+            continue
+        stats.record(result[1])
+        print_metrics_summary(result[1], session=stats)
+    logger.info("Sesión terminada: %d consultas, %d con error, costo total $%.4f",
+                stats.queries, stats.errors, stats.total_cost_usd)
+    return stats
+
+
+def main(argv: list[str] | None = None) -> None:
+
+    args = parse_args(argv)
+    if args.trace or args.profile_slow_ms is not None:
+        # Spans por fase en LOGS/traces.jsonl; las consultas lentas se perfilan en .cache/profiles/
+        configure_tracing(profile_sample_rate=args.profile_sample_rate if args.profile_slow_ms is not None else 0.0,
+                          slow_threshold_ms=args.profile_slow_ms or 0.0)
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+    session = AssistantSession(args)
+    # Cliente, índice y caches se preparan mientras se escribe la consulta
+    session.warm_up_in_background()
+    try:
+        if args.session:
+            run_session(session)
+            return
+
+        input_query = input("Ingrese la consulta: ")
+        # Obtener consulta del usuario (texto libre o número de consulta de ejemplo)
+        session.ask(SAMPLE_QUERIES.get(input_query, input_query))
+    finally:
+        session.close()
 
-    # Seleccionando el modelo a utilizar
-    model1 = OpenAIModels.GPT_4o_mini  # Worst results
-    model2 = OpenAIModels.GPT_5_mini  # Much better results
-    model = model2
-
-    # Inicializo el cliente de OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-    # Establecer el system_prompt a utilizar
-    basic_system_prompt = BANK_ASSISTANT_SYSTEM_PROMPT
-    one_shot_system_prompt = basic_system_prompt + "\n\n" + ONE_SHOT_EXAMPLE + "\n"
-    system_prompt_a_utilizar = one_shot_system_prompt
-    system_prompt = system_prompt_a_utilizar + "\n\n" + BANK_KB
-
-    # Obtener consulta del usuario::
-    match input_query:
-        case "1":
-            user_prompt = "Cuál es la comisión de Cuenta Corriente ?"  # Pregunta con respuesta directa en la KB
-        case "2":
-            user_prompt = "Que medicina debo tomar para un dolor de cabeza liviano ?" # Fuera del expertise
-        case "3":
-            user_prompt = "Que productos de inversion tiene para ofrecer ?"  # No hay respuesta directa en la KB
-        case "4":
-            user_prompt = "Cual es la rentabilidad anual en cuentas de money market ?"  # Consulta por producto que no ofrece
-        case _:
-             user_prompt = input_query
-
-    print('=='*32)
-    logger.info(f"Enviando consulta al modelo: {model.value}\nConsulta: {user_prompt}")
-    json_response, metrics = get_completion(system_prompt, user_prompt, model, client)
-    response_dict = {'metrics': asdict(metrics)}
-    response_dict['consulta'] = user_prompt
-    response_dict['respuesta'] = json_response
-    # Write metrics to file
-    file_path = METRICS_LOG_FOLDER / f"{APPLICATION_NAME}_{datetime.now().strftime("%Y-%m-%dT%H:%M")}.json"
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(json.dumps(response_dict, indent=2))
-
-    print('=='*32)
-    # print(f'Consulta: { user_prompt}\n')
-    print(f'Respuesta del modelo: {json_response['respuesta']}\n')
-
-    logger.info(f"Consulta respondida. Tokens: {metrics.total_tokens}, Cost: {metrics.estimated_cost_usd},"
-                f"\nResultados en: {file_path}")
 
 if __name__ == "__main__":
     main()
-
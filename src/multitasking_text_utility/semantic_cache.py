@@ -0,0 +1,379 @@
+"""Semantic (embedding-similarity) cache for paraphrased queries.
+
+The exact-match ResponseCache misses paraphrases such as "comisión cuenta
+corriente?" vs "¿cuánto cuesta la cuenta corriente por mes?". This tier
+embeds each query locally (character n-gram hashing via scikit-learn, no
+network or model download) and serves a cached answer when the cosine
+similarity with a previous query exceeds a configurable threshold.
+
+Character n-grams only see spelling, so before embedding the query is
+canonicalized: the ways agents ask for a price ("cuánto cuesta", "costo",
+"precio", ...) fold into "comision", those for a rate ("interés",
+"rendimiento") into "tasa", and the billing period ("por mes", "mensual")
+is dropped. With that, the pair above scores 1.0, while different questions
+about the same product stay below the threshold (see
+DEFAULT_SIMILARITY_THRESHOLD).
+
+Vectors live in a contiguous NumPy matrix (grown by doubling), so the top-1
+lookup is a single matrix-vector product over every cached entry (tens of
+thousands of entries in a few milliseconds). The cache has a fixed maximum
+size; when it is full the least recently used entry is overwritten.
+
+A full cache is tens of MB on disk, so it is not rewritten per query:
+save_if_due() persists it at most every SAVE_INTERVAL_SECONDS and only when
+entries changed, and the session saves it once more on exit.
+
+Entries are namespaced by model and by the top BM25 section retrieved for
+the query (RetrievalResult.top_section_id), and the whole cache is tied to a
+prompt version (see cache.prompt_version), so answers are never shared
+across models or reused after the prompt/KB changes. The section key is what
+keeps apart questions about sibling products, which character n-grams
+cannot: "monto maximo de transferencias nacionales" vs "...internacionales"
+scores 0.90 and "reposicion de tarjeta de debito" vs "...credito" 0.86, but
+their top sections differ.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from cache import prompt_version
+from text_normalization import normalize_text, tokenize
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_SEMANTIC_CACHE_PATH = PROJECT_ROOT / ".cache" / "semantic_cache"
+
+# Umbral calibrado sobre consultas canonicalizadas. Paráfrasis: "comisión cuenta corriente?" / "¿cuánto
+# cuesta la cuenta corriente por mes?" 1.0, "horario de corte transferencias" / "a qué hora es el corte de las
+# transferencias" 0.88, "tasa del plazo fijo" / "qué interés paga el plazo fijo" 0.86, "costo de reposición de
+# tarjeta de débito" / "cuánto sale reponer la tarjeta de débito" 0.80. Preguntas distintas sobre la misma
+# sección: "comisión" / "tasa de la cuenta corriente" 0.77, "plazo mínimo" / "tasa del plazo fijo" 0.75,
+# "tasa" / "monto máximo del préstamo personal" 0.73.
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+DEFAULT_MAX_ENTRIES = 20_000
+DEFAULT_N_FEATURES = 1024
+INITIAL_CAPACITY = 256
+
+# Formas de preguntar lo mismo que los n-gramas no reconocen como iguales
+_PARAPHRASES = [
+    (re.compile(r"\b(cuanto (cuesta|cuestan|sale|salen|cobra|cobran)|costos?|precio|arancel|cargos?)\b"), "comision"),
+    (re.compile(r"\b(interes|intereses|rendimiento|rinde)\b"), "tasa"),
+    (re.compile(r"\b(por mes|mensual|mensuales)\b"), " "),
+]
+SAVE_INTERVAL_SECONDS = 60.0
+
+
+def canonical_query(query: str) -> str:
+    """Rewrites price/rate/period phrasings of a query into one canonical form.
+
+    Examples:
+        >>> canonical_query("¿Cuánto cuesta la cuenta corriente por mes?")
+        'comision la cuenta corriente'
+    """
+    text = normalize_text(query)
+    for pattern, replacement in _PARAPHRASES:
+        text = pattern.sub(replacement, text)
+    return " ".join(text.split())
+
+
+@dataclass
+class SemanticCacheStats:
+    """Hit/miss counters for the semantic cache.
+
+    Attributes:
+        hits: Lookups served from the cache.
+        misses: Lookups below the similarity threshold (or empty cache).
+        evictions: Entries overwritten because the cache was full.
+        last_similarity: Best similarity found by the most recent lookup.
+        mean_hit_similarity: Average similarity of the lookups that hit.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    last_similarity: float | None = None
+    mean_hit_similarity: float | None = None
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class SemanticMatch:
+    """A cached answer returned by a semantic lookup.
+
+    Attributes:
+        response: Cached parsed response.
+        similarity: Cosine similarity between the query and the cached query.
+        cached_query: The original query the answer was generated for.
+        hit: Whether the similarity reached the threshold.
+    """
+
+    response: dict
+    similarity: float
+    cached_query: str
+    hit: bool = True
+
+
+class SemanticCache:
+    """In-memory semantic cache backed by a NumPy matrix.
+
+    Thread-safe: lookups and inserts are serialized with a lock.
+
+    Examples:
+        >>> cache = SemanticCache()
+        >>> cache.add("gpt-5-mini", "comisión cuenta corriente?", answer, top_section="10")
+        >>> cache.lookup("gpt-5-mini", "¿cuánto cuesta la cuenta corriente por mes?", top_section="10").similarity
+        1.0
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 n_features: int = DEFAULT_N_FEATURES,
+                 version: str | None = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.version = version or prompt_version()
+        self.stats = SemanticCacheStats()
+        self._vectorizer = HashingVectorizer(
+            analyzer="char_wb", ngram_range=(3, 5), n_features=n_features,
+            alternate_sign=False, norm="l2",
+        )
+        self._lock = threading.Lock()
+        capacity = min(max_entries, INITIAL_CAPACITY)
+        self._vectors = np.zeros((capacity, n_features), dtype=np.float32)
+        self._namespace_ids = np.full(capacity, -1, dtype=np.int32)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._queries: list[str] = []
+        self._responses: list[dict] = []
+        self._namespaces: dict[str, int] = {}
+        self._size = 0
+        self._changes = 0
+        self._last_saved = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def dirty(self) -> bool:
+        """Whether entries were added or cleared since the last save/load."""
+        return self._changes > 0
+
+    def embed(self, query: str) -> np.ndarray:
+        """Returns the L2-normalized embedding of a query.
+
+        Args:
+            query: Raw query text.
+
+        Returns:
+            1-D float32 vector of length n_features.
+        """
+        text = " ".join(tokenize(canonical_query(query))) or query.lower()
+        return self._vectorizer.transform([text]).toarray()[0].astype(np.float32)
+
+    def _namespace_id(self, model: str, top_section: str | None = None) -> int:
+        # Una entrada solo compite con las del mismo modelo y la misma sección principal de la KB
+        key = model if top_section is None else f"{model}#{top_section}"
+        if key not in self._namespaces:
+            self._namespaces[key] = len(self._namespaces)
+        return self._namespaces[key]
+
+    def _grow(self, capacity: int) -> None:
+        extra = capacity - len(self._last_used)
+        self._vectors = np.vstack([self._vectors, np.zeros((extra, self._vectors.shape[1]), dtype=np.float32)])
+        self._namespace_ids = np.concatenate([self._namespace_ids, np.full(extra, -1, dtype=np.int32)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(extra, dtype=np.float64)])
+
+    def _best_match(self, namespace_id: int, vector: np.ndarray) -> tuple[int, float]:
+        if self._size == 0:
+            return -1, 0.0
+        similarities = self._vectors[:self._size] @ vector
+        similarities[self._namespace_ids[:self._size] != namespace_id] = -1.0
+        best = int(np.argmax(similarities))
+        return best, float(similarities[best])
+
+    def search(self, model: str, query: str, top_section: str | None = None) -> SemanticMatch | None:
+        """Finds the most similar cached query, whether or not it is a hit.
+
+        Args:
+            model: Model name.
+            query: Raw query text.
+            top_section: Top BM25 section retrieved for the query; only
+                entries cached under the same section are candidates.
+
+        Returns:
+            The best candidate (match.hit tells whether it reached the
+            threshold), or None when there is no candidate at all.
+        """
+        vector = self.embed(query)
+        with self._lock:
+            best, similarity = self._best_match(self._namespace_id(model, top_section), vector)
+            self.stats.last_similarity = round(similarity, 4)
+            if best < 0 or similarity < self.threshold:
+                self.stats.misses += 1
+                if best < 0 or similarity <= 0:
+                    return None
+                return SemanticMatch(self._responses[best], similarity, self._queries[best], hit=False)
+
+            self._last_used[best] = time.time()
+            previous_hits = self.stats.hits
+            self.stats.hits += 1
+            self.stats.mean_hit_similarity = (
+                (self.stats.mean_hit_similarity or 0.0) * previous_hits + similarity
+            ) / self.stats.hits
+            return SemanticMatch(self._responses[best], similarity, self._queries[best])
+
+    def lookup(self, model: str, query: str, top_section: str | None = None) -> SemanticMatch | None:
+        """Finds a cached answer for a query.
+
+        Args:
+            model: Model name.
+            query: Raw query text.
+            top_section: Top BM25 section retrieved for the query.
+
+        Returns:
+            SemanticMatch when the best similarity among the entries of the
+            same model and top section reaches the threshold, otherwise None.
+        """
+        match = self.search(model, query, top_section)
+        return match if match is not None and match.hit else None
+
+    def add(self, model: str, query: str, response: dict, top_section: str | None = None) -> None:
+        """Caches the response for a query.
+
+        A near-identical query already cached for the same model is replaced;
+        otherwise the entry goes to a free slot or evicts the least recently
+        used one.
+
+        Args:
+            model: Model name.
+            query: Raw query text.
+            response: Parsed response to cache.
+            top_section: Top BM25 section retrieved for the query.
+        """
+        vector = self.embed(query)
+        with self._lock:
+            namespace_id = self._namespace_id(model, top_section)
+            best, similarity = self._best_match(namespace_id, vector)
+            if best >= 0 and similarity >= 0.999:
+                slot = best
+            elif self._size < self.max_entries:
+                if self._size == len(self._last_used):
+                    self._grow(min(self.max_entries, 2 * self._size))
+                slot = self._size
+                self._size += 1
+                self._queries.append(query)
+                self._responses.append(response)
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.stats.evictions += 1
+
+            self._vectors[slot] = vector
+            self._namespace_ids[slot] = namespace_id
+            self._last_used[slot] = time.time()
+            self._queries[slot] = query
+            self._responses[slot] = response
+            self._changes += 1
+
+    def set_version(self, version: str) -> None:
+        """Switches to a new prompt/KB version, dropping every entry cached for the previous one."""
+        with self._lock:
+            if version == self.version:
+                return
+            logger.info("Prompt/KB changed (%s -> %s), clearing semantic cache", self.version, version)
+            self.version = version
+            self._namespace_ids[:] = -1
+            self._queries.clear()
+            self._responses.clear()
+            self._size = 0
+            self._changes += 1
+
+    def save(self, path: Path = DEFAULT_SEMANTIC_CACHE_PATH) -> None:
+        """Persists the cache as <path>.npz (vectors) plus <path>.json (entries).
+
+        The entries are copied under the lock and written outside it, so
+        concurrent lookups and inserts only wait for the copy.
+
+        Args:
+            path: Base path without extension.
+        """
+        with self._lock:
+            size = self._size
+            vectors = self._vectors[:size].copy()
+            namespace_ids = self._namespace_ids[:size].copy()
+            last_used = self._last_used[:size].copy()
+            payload = {
+                "version": self.version,
+                "namespaces": dict(self._namespaces),
+                "queries": list(self._queries),
+                "responses": list(self._responses),
+                "stats": asdict(self.stats),
+            }
+            self._changes = 0
+            self._last_saved = time.monotonic()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path.with_suffix(".npz"), vectors=vectors, namespace_ids=namespace_ids, last_used=last_used)
+        with open(path.with_suffix(".json"), "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+
+    def save_if_due(self, path: Path = DEFAULT_SEMANTIC_CACHE_PATH,
+                    interval_seconds: float = SAVE_INTERVAL_SECONDS) -> bool:
+        """Saves the cache if it changed and the last save is older than interval_seconds.
+
+        Args:
+            path: Base path without extension.
+            interval_seconds: Minimum time between two saves.
+
+        Returns:
+            Whether the cache was saved.
+        """
+        if not self.dirty or time.monotonic() - self._last_saved < interval_seconds:
+            return False
+        self.save(path)
+        return True
+
+    @classmethod
+    def load(cls, path: Path = DEFAULT_SEMANTIC_CACHE_PATH, **kwargs) -> "SemanticCache":
+        """Loads a persisted cache, or returns an empty one if missing or stale.
+
+        Args:
+            path: Base path used with save().
+            **kwargs: Constructor arguments (threshold, max_entries, ...).
+
+        Returns:
+            SemanticCache instance.
+        """
+        cache = cls(**kwargs)
+        try:
+            with open(path.with_suffix(".json"), encoding="utf-8") as f:
+                payload = json.load(f)
+            arrays = np.load(path.with_suffix(".npz"))
+        except (OSError, ValueError):
+            return cache
+
+        if payload["version"] != cache.version or arrays["vectors"].shape[1] != cache._vectors.shape[1]:
+            logger.info("Prompt/KB changed, discarding semantic cache")
+            return cache
+
+        size = min(len(payload["queries"]), cache.max_entries)
+        if size > len(cache._last_used):
+            cache._grow(size)
+        cache._vectors[:size] = arrays["vectors"][:size]
+        cache._namespace_ids[:size] = arrays["namespace_ids"][:size]
+        cache._last_used[:size] = arrays["last_used"][:size]
+        cache._queries = payload["queries"][:size]
+        cache._responses = payload["responses"][:size]
+        cache._namespaces = payload["namespaces"]
+        cache._size = size
+        return cache
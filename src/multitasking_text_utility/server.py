@@ -0,0 +1,391 @@
+"""Long-running HTTP service for the support assistant.
+
+Running `python run_query.py` per query re-imports openai, re-reads the
+environment, builds a new OpenAI client and opens new TLS connections before
+the model is even called. This server pays those costs once at startup:
+
+- one OpenAI client, shared by all requests, whose HTTP connection pool keeps
+  connections to the API alive between queries
+- the KB index, the static prompt prefix and the full-KB system prompt are
+  built once; per-query prompts are memoized by retrieved section set
+  (--full-kb sends the full-KB prompt with every query instead, see
+  prompt_builder for the prompt caching trade-off)
+  (least recently used first out past MAX_MEMOIZED_PROMPTS)
+- with --kb-dir the KB is read from a folder of documents (see kb_store) and
+  reloaded on change while serving; prompts and the response cache follow
+  the new KB version
+- single-flight coalescing: identical queries that arrive while the first
+  one is still waiting on the model share its call (see coalescing)
+- optional client-side RPM/TPM limits (--rpm/--tpm): queries are admitted by
+  priority ("prioridad": live > interactive > bulk) and round-robin per
+  agent ("agente") inside each class (see rate_limiter)
+- precomputed answers for the most frequent questions (see cache_warming),
+  loaded at startup, so they are instant from the first request after a deploy
+- optional micro-batching (--micro-batch-ms): questions arriving within the
+  window share one completion and its KB prefix (see micro_batch)
+- every answered or failed query is appended to the same JSONL metrics log
+  the CLI writes (see metrics_sink), flushed in the background
+- rolling 1-minute/1-hour latency, token and cost histograms per model
+  (see live_metrics), served at GET /metrics in Prometheus text format
+- a production logging mode (--log-format json): JSON lines written from a
+  background thread, lazily formatted and optionally sampled (see logger)
+- a concurrency limit: requests beyond it get 503 with Retry-After instead
+  of queueing behind 20 s model calls
+- graceful shutdown on SIGINT/SIGTERM: stop accepting, let in-flight
+  requests finish, then exit
+
+Endpoints:
+    POST /query   {"consulta": "...", "prioridad": "live", "agente": "..."}
+                                       -> same JSON main() writes (metrics, consulta, respuesta)
+    GET  /health                       -> {"status": "ok"}
+    GET  /metrics                      -> p50/p90/p99 and spend rate (Prometheus text format)
+
+Usage:
+    python src/multitasking_text_utility/server.py --port 8000 --max-concurrency 16
+"""
+
+import argparse
+import json
+import os
+import signal
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from answer_store import DEFAULT_ANSWERS_PATH, AnswerStore
+from bank_kb import BANK_KB
+from cache import ResponseCache, prompt_version
+from coalescing import SingleFlight
+from fact_index import FactIndex
+from kb_store import KBSnapshot, KBStore
+from live_metrics import PROMETHEUS_CONTENT_TYPE, get_live_metrics
+from logger import configure_production_logging, get_logger, parse_sample_rates
+from metrics_sink import get_sink
+from prompt_builder import compose_system_prompt
+from micro_batch import DEFAULT_MAX_BATCH, MicroBatcher
+from rate_limiter import Priority, RateLimitScheduler
+from resilience import DEFAULT_ATTEMPT_TIMEOUT_SECONDS, ResiliencePolicy
+from retrieval import load_or_build_index
+from run_query import (APPLICATION_NAME, METRICS_LOG_FILE, METRICS_LOG_FOLDER, SAMPLE_QUERIES, OpenAIModels,
+                       get_completion)
+
+logger = get_logger()
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_MAX_CONCURRENCY = 16
+MAX_BODY_BYTES = 64 * 1024
+MAX_MEMOIZED_PROMPTS = 256
+
+
+class AssistantService:
+    """Warm state shared by every request: client, KB index and prompts.
+
+    Args:
+        client: Configured OpenAI client (reused for every call).
+        model: Model used for every query.
+        cache: Optional response cache.
+        one_shot: Whether prompts include ONE_SHOT_EXAMPLE.
+        resilience: Optional deadlines/retries/hedging/fallback policy.
+        fast_path: Answer direct lookups from the KB fact index without a model call.
+        kb_store: Hot-reloadable KB; when None the built-in BANK_KB is used.
+        coalesce: Share one model call among identical in-flight queries.
+        scheduler: Client-side RPM/TPM limiter shared by every request.
+        micro_batch_window: Seconds to collect questions into one completion
+            (None disables micro-batching).
+        micro_batch_size: Maximum questions per micro-batched completion.
+        answer_store: Precomputed answers checked before the caches.
+        full_kb: Send the full KB with every query instead of the retrieved
+            sections, so every request shares one cacheable prompt prefix.
+        metrics_log: JSONL file each answered or failed query is appended
+            to (None disables it).
+    """
+
+    def __init__(self, client, model: OpenAIModels = OpenAIModels.GPT_5_mini,
+                 cache: ResponseCache | None = None, one_shot: bool = True,
+                 resilience: ResiliencePolicy | None = None, fast_path: bool = True,
+                 kb_store: KBStore | None = None, coalesce: bool = True,
+                 scheduler: RateLimitScheduler | None = None,
+                 micro_batch_window: float | None = None, micro_batch_size: int = DEFAULT_MAX_BATCH,
+                 answer_store: AnswerStore | None = None, full_kb: bool = False,
+                 metrics_log: Path | None = None):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.one_shot = one_shot
+        self.resilience = resilience
+        self.fast_path = fast_path
+        self.kb_store = kb_store
+        self.coalescer = SingleFlight() if coalesce else None
+        self.scheduler = scheduler
+        self.micro_batcher = None
+        self.answer_store = answer_store
+        self.full_kb = full_kb
+        self.metrics_sink = get_sink(metrics_log) if metrics_log is not None else None
+        self._prompts: OrderedDict[tuple, str] = OrderedDict()
+        self._prompts_lock = threading.Lock()
+        if kb_store is None:
+            self.kb_index = load_or_build_index(BANK_KB)
+            self.fact_index = FactIndex.from_kb(BANK_KB) if fast_path else None
+            # El prompt con la KB completa es el más usado (fallback): se arma al inicio
+            self.full_system_prompt = self._system_prompt_for(BANK_KB, tuple(s.id for s in self.kb_index.sections))
+        else:
+            self._on_kb_change(kb_store.snapshot)
+            kb_store.subscribe(self._on_kb_change)
+        if micro_batch_window is not None:
+            # Los batches usan el prompt con la KB completa: el mismo prefijo para todas las preguntas
+            # Mismo limitador RPM/TPM y mismo plazo por intento que los llamados individuales
+            self.micro_batcher = MicroBatcher(client, model, self.full_system_prompt, micro_batch_window,
+                                              micro_batch_size, context=f"{APPLICATION_NAME}_server",
+                                              scheduler=scheduler,
+                                              timeout_seconds=resilience.attempt_timeout_seconds if resilience
+                                              else DEFAULT_ATTEMPT_TIMEOUT_SECONDS)
+
+    def _on_kb_change(self, snapshot: KBSnapshot) -> None:
+        # Nueva versión de la KB: los prompts memorizados y el cache de respuestas quedan obsoletos
+        with self._prompts_lock:
+            self._prompts.clear()
+        if self.cache is not None:
+            self.cache.set_version(snapshot.prompt_version)
+        if self.answer_store is not None:
+            self.answer_store.set_version(snapshot.prompt_version)
+        self.full_system_prompt = self._system_prompt_for(
+            snapshot.kb, tuple(s.id for s in snapshot.index.sections), snapshot.version)
+        if self.micro_batcher is not None:
+            self.micro_batcher.system_prompt = self.full_system_prompt
+
+    def _system_prompt_for(self, kb_text: str, section_ids: tuple[str, ...], kb_version: int = 0) -> str:
+        key = (kb_version, section_ids)
+        with self._prompts_lock:
+            prompt = self._prompts.get(key)
+            if prompt is not None:
+                self._prompts.move_to_end(key)
+                return prompt
+            prompt = compose_system_prompt(kb_text, self.one_shot)
+            self._prompts[key] = prompt
+            if len(self._prompts) > MAX_MEMOIZED_PROMPTS:
+                # El de la KB completa no se pierde: también queda en full_system_prompt
+                self._prompts.popitem(last=False)
+            return prompt
+
+    def answer(self, consulta: str, priority: Priority = Priority.LIVE, tenant: str | None = None) -> dict:
+        """Answers a query with the same JSON shape main() writes.
+
+        Args:
+            consulta: Query text or a sample query number ("1".."4").
+            priority: Rate limiter class (only used with a scheduler).
+            tenant: Fair-queueing key inside the class (e.g. the agent).
+
+        Returns:
+            Dict with "metrics", "consulta" and "respuesta".
+
+        Raises:
+            RuntimeError: If the completion failed.
+        """
+        user_prompt = SAMPLE_QUERIES.get(consulta, consulta)
+        if self.kb_store is None:
+            kb_index, fact_index, kb_version = self.kb_index, self.fact_index, 0
+        else:
+            # Una sola lectura del snapshot: la consulta ve entera la KB vieja o la nueva
+            snapshot = self.kb_store.snapshot
+            kb_index, kb_version = snapshot.index, snapshot.version
+            fact_index = snapshot.fact_index if self.fast_path else None
+        retrieval = kb_index.retrieve(user_prompt, full_kb=self.full_kb)
+        system_prompt = self._system_prompt_for(retrieval.kb_text, tuple(retrieval.section_ids), kb_version)
+
+        result = get_completion(system_prompt, user_prompt, self.model, self.client,
+                                context=f"{APPLICATION_NAME}_server", cache=self.cache,
+                                resilience=self.resilience, fact_index=fact_index,
+                                coalescer=self.coalescer, scheduler=self.scheduler, priority=priority,
+                                tenant=tenant, micro_batcher=self.micro_batcher,
+                                answer_store=self.answer_store)
+        if isinstance(result, str):
+            get_live_metrics().observe_error(self.model, f"{APPLICATION_NAME}_server")
+            if self.metrics_sink is not None:
+                self.metrics_sink.write({"metrics": None, "consulta": user_prompt, "error": result,
+                                         "timestamp": datetime.now().isoformat()})
+            raise RuntimeError(result)
+
+        json_response, metrics = result
+        get_live_metrics().observe(metrics)
+        metrics.retrieved_sections = retrieval.section_ids
+        metrics.kb_fallback = retrieval.fallback
+        metrics.kb_tokens_saved = retrieval.tokens_saved
+        payload = {"metrics": asdict(metrics), "consulta": user_prompt, "respuesta": json_response}
+        if self.metrics_sink is not None:
+            # Mismo log JSONL que la CLI; el hilo del sink lo escribe a disco sin demorar la respuesta
+            self.metrics_sink.write(payload)
+        return payload
+
+
+class AssistantHTTPServer(ThreadingHTTPServer):
+    """Threaded HTTP server with a concurrency limit and graceful shutdown.
+
+    Worker threads are non-daemon so server_close() waits for in-flight
+    requests to finish.
+    """
+
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, address: tuple[str, int], service: AssistantService,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.service = service
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        super().__init__(address, QueryHandler)
+
+    def graceful_shutdown(self) -> None:
+        """Stops accepting requests and waits for in-flight ones to complete."""
+        logger.info("Apagando el servidor: esperando las consultas en curso...")
+        self.shutdown()
+        self.server_close()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: AssistantHTTPServer
+
+    def log_message(self, format, *args):
+        logger.debug("%s - " + format, self.address_string(), *args)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            data = get_live_metrics().render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {"error": f"Ruta desconocida: {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/query":
+            self._send_json(404, {"error": f"Ruta desconocida: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            # El cuerpo no se lee: la conexión no puede reutilizarse
+            self.close_connection = True
+            if length < 0:
+                self._send_json(400, {"error": "Content-Length inválido"})
+            else:
+                self._send_json(413, {"error": "Consulta demasiado grande"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                # JSON válido pero no un objeto ([], "texto", 1)
+                raise ValueError("se espera un objeto JSON")
+            consulta = body["consulta"].strip()
+            if not consulta:
+                raise ValueError("consulta vacía")
+            priority = Priority[str(body.get("prioridad", "live")).upper()]
+        except (ValueError, KeyError, AttributeError):
+            self._send_json(400, {"error": 'Se espera un JSON con el campo "consulta" '
+                                           '(y "prioridad": live, interactive o bulk)'})
+            return
+
+        if not self.server.slots.acquire(blocking=False):
+            self._send_json(503, {"error": "Servidor ocupado, reintentar"}, {"Retry-After": "1"})
+            return
+        try:
+            payload = self.server.service.answer(consulta, priority, body.get("agente") or self.client_address[0])
+        except Exception as e:
+            logger.error("Error respondiendo consulta: %s", e)
+            self._send_json(502, {"error": str(e)})
+            return
+        finally:
+            self.server.slots.release()
+        self._send_json(200, payload)
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    parser = argparse.ArgumentParser(description="Servidor HTTP del asistente de soporte.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--model", default=OpenAIModels.GPT_5_mini.value, choices=[m.value for m in OpenAIModels])
+    parser.add_argument("--no-cache", action="store_true", help="No usar el cache de respuestas")
+    parser.add_argument("--hedge", action="store_true", help="Consultas duplicadas cuando se supera el p95")
+    parser.add_argument("--rpm", type=int, default=None, help="Límite de requests por minuto de la cuenta")
+    parser.add_argument("--tpm", type=int, default=None, help="Límite de tokens por minuto de la cuenta")
+    parser.add_argument("--micro-batch-ms", type=float, default=None,
+                        help="Agrupar en un solo llamado las consultas que llegan dentro de esta ventana (50-200 ms)")
+    parser.add_argument("--micro-batch-size", type=int, default=DEFAULT_MAX_BATCH,
+                        help="Máximo de consultas por llamado agrupado")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="No compartir el llamado al modelo entre consultas idénticas en curso")
+    parser.add_argument("--kb-dir", type=Path, default=None,
+                        help="Carpeta con documentos .md/.txt de la KB (se recarga al modificarse)")
+    parser.add_argument("--full-kb", action="store_true",
+                        help="Enviar siempre la KB completa: prompt idéntico en cada consulta, cacheable por OpenAI")
+    parser.add_argument("--answers", type=Path, default=DEFAULT_ANSWERS_PATH,
+                        help="Respuestas precalculadas por cache_warming.py (se ignoran si son de otra versión)")
+    parser.add_argument("--metrics-log", type=Path, default=METRICS_LOG_FOLDER / METRICS_LOG_FILE,
+                        help="Log JSONL donde se agrega cada consulta respondida o fallida")
+    parser.add_argument("--log-format", choices=["color", "json"], default=os.getenv("LOG_FORMAT", "color"),
+                        help="json: logs en JSON lines escritos desde un hilo aparte (modo producción)")
+    parser.add_argument("--log-sample", type=parse_sample_rates, default=os.getenv("LOG_SAMPLE"),
+                        help="Muestreo de loggers ruidosos en modo json (ej. rate_limiter=0.01,coalescing=0.1)")
+    args = parser.parse_args()
+    if (args.rpm is None) != (args.tpm is None):
+        parser.error("--rpm y --tpm se indican juntos")
+    if args.log_format == "json":
+        configure_production_logging(sample_rates=args.log_sample)
+
+    load_dotenv()
+    # Un único cliente: su pool de conexiones HTTP mantiene las conexiones TLS abiertas entre consultas
+    # max_retries=0: los reintentos los hace la capa de resiliencia (ver run_query.create_client)
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None,
+                    max_retries=0)
+    resilience = ResiliencePolicy(hedge=args.hedge, fallback_model=OpenAIModels.GPT_4o_mini)
+    kb_store = None
+    if args.kb_dir:
+        kb_store = KBStore(args.kb_dir)
+        kb_store.watch()
+    answer_store = AnswerStore.load(args.answers, kb_store.snapshot.prompt_version if kb_store else prompt_version())
+    service = AssistantService(client, OpenAIModels(args.model), cache=None if args.no_cache else ResponseCache(),
+                               resilience=resilience, kb_store=kb_store, coalesce=not args.no_coalesce,
+                               scheduler=RateLimitScheduler(args.rpm, args.tpm) if args.rpm else None,
+                               micro_batch_window=args.micro_batch_ms / 1000 if args.micro_batch_ms else None,
+                               micro_batch_size=args.micro_batch_size, answer_store=answer_store,
+                               full_kb=args.full_kb, metrics_log=args.metrics_log)
+    httpd = AssistantHTTPServer((args.host, args.port), service, args.max_concurrency)
+
+    def handle_signal(signum, frame):
+        # shutdown() bloquea hasta que termina serve_forever, por eso se llama desde otro hilo
+        threading.Thread(target=httpd.graceful_shutdown).start()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    logger.info("Servidor escuchando en http://%s:%d (modelo %s)", args.host, args.port, args.model)
+    httpd.serve_forever()
+    logger.info("Servidor detenido")
+
+
+if __name__ == "__main__":
+    main()
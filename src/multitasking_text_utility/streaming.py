@@ -0,0 +1,211 @@
+"""Streaming completions with incremental extraction of the answer.
+
+Agents otherwise stare at a blank screen until the complete JSON arrives.
+With stream=True the model output arrives in small deltas; the
+RespuestaStreamParser below scans the partial JSON and decodes the value of
+the "respuesta" field as soon as its characters are generated, before
+"confianza" and "acciones_recomendadas" arrive. The full JSON is still
+parsed at the end, so the final result has the same shape as
+run_query.get_completion.
+
+Streaming also makes perceived latency measurable: Metrics gains
+time_to_first_token_seconds next to latency_seconds. When the stream ends
+without a usage chunk, tokens are estimated from the text so Metrics is
+always set.
+"""
+
+import time
+from types import SimpleNamespace
+
+from budgets import estimate_request_tokens
+from metrics import Metrics, estimate_tokens
+from prompt_builder import build_messages
+from run_query import APPLICATION_NAME, build_metrics, parse_completion
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class RespuestaStreamParser:
+    """Incrementally extracts the "respuesta" string from a streamed JSON object.
+
+    Feed it raw content deltas in order; each call returns the newly decoded
+    characters of the "respuesta" value (possibly an empty string).
+
+    Examples:
+        >>> parser = RespuestaStreamParser()
+        >>> parser.feed('{"respuesta": "La comi')
+        'La comi'
+        >>> parser.feed('sión es $8.000", "confianza": 0.9')
+        'sión es $8.000'
+        >>> parser.done
+        True
+    """
+
+    _KEY = '"respuesta"'
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_value = False
+        self.done = False
+        self.text = ""
+
+    def feed(self, chunk: str) -> str:
+        """Consumes a content delta.
+
+        Args:
+            chunk: Next piece of the model output.
+
+        Returns:
+            Newly decoded characters of the "respuesta" value.
+        """
+        self._buffer += chunk
+        if self.done:
+            return ""
+
+        if not self._in_value and not self._find_value_start():
+            return ""
+
+        out = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            ch = buffer[self._pos]
+            if ch == '"':
+                self.done = True
+                self._pos += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                self._pos += 1
+                continue
+
+            # Secuencia de escape: esperar a tenerla completa antes de decodificar
+            if self._pos + 1 >= len(buffer):
+                break
+            code = buffer[self._pos + 1]
+            if code == "u":
+                if self._pos + 6 > len(buffer):
+                    break
+                value = int(buffer[self._pos + 2:self._pos + 6], 16)
+                if 0xD800 <= value < 0xDC00:
+                    # Surrogate alto (emojis y otros caracteres fuera del BMP): se combina con el bajo que
+                    # sigue, como json.loads, en lugar de emitir dos surrogates sueltos
+                    if self._pos + 12 > len(buffer):
+                        break
+                    low = buffer[self._pos + 6:self._pos + 12]
+                    if low.startswith("\\u") and 0xDC00 <= int(low[2:], 16) < 0xE000:
+                        out.append(chr(0x10000 + ((value - 0xD800) << 10) + int(low[2:], 16) - 0xDC00))
+                        self._pos += 12
+                        continue
+                out.append(chr(value))
+                self._pos += 6
+            else:
+                out.append(_ESCAPES.get(code, code))
+                self._pos += 2
+
+        decoded = "".join(out)
+        self.text += decoded
+        return decoded
+
+    def _find_value_start(self) -> bool:
+        key_at = self._buffer.find(self._KEY)
+        if key_at < 0:
+            return False
+        rest = self._buffer[key_at + len(self._KEY):]
+        stripped = rest.lstrip()
+        if not stripped.startswith(":"):
+            return False
+        after_colon = stripped[1:].lstrip()
+        if not after_colon.startswith('"'):
+            return False
+        self._pos = len(self._buffer) - len(after_colon) + 1
+        self._in_value = True
+        return True
+
+
+class CompletionStream:
+    """Iterable over the "respuesta" text of a streamed completion.
+
+    Iterating yields answer deltas as they are generated. Once the iteration
+    finishes, `result` holds the parsed response (same shape as
+    get_completion) and `metrics` the Metrics, including time to first token.
+
+    Examples:
+        >>> stream = stream_completion(system_prompt, "Horario de corte?", model, client)
+        >>> for delta in stream:
+        ...     print(delta, end="", flush=True)
+        >>> stream.metrics.time_to_first_token_seconds
+        0.84
+    """
+
+    def __init__(self, system_prompt: str, user_prompt: str, model, client,
+                 temperature: float | None = 0.0, context: str | None = APPLICATION_NAME):
+        self.model = model
+        self.temperature = temperature
+        self.context = context
+        self.result: dict | None = None
+        self.metrics: Metrics | None = None
+        self.content = ""
+        self._parser = RespuestaStreamParser()
+        self._start_time = time.time()
+        self._messages = build_messages(system_prompt, user_prompt)
+        self._response = client.chat.completions.create(
+            model=model,
+            messages=self._messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+    def __iter__(self):
+        first_token_at = None
+        usage = None
+        parts = []
+        for chunk in self._response:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.time()
+            parts.append(delta)
+            text = self._parser.feed(delta)
+            if text:
+                yield text
+
+        latency = time.time() - self._start_time
+        self.content = "".join(parts)
+        estimated = usage is None
+        if estimated:
+            # Sin chunk de uso (p. ej. proxies que ignoran include_usage): se estiman los tokens
+            prompt_tokens = estimate_request_tokens(self._messages)
+            completion_tokens = estimate_tokens(self.content)
+            usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                    total_tokens=prompt_tokens + completion_tokens)
+        self.metrics = build_metrics(self.model, usage, latency, self.temperature, self.context)
+        if estimated:
+            self.metrics.usage_estimated = True
+        if first_token_at is not None:
+            self.metrics.time_to_first_token_seconds = round(first_token_at - self._start_time, 3)
+        self.result = parse_completion(self.content)
+
+
+def stream_completion(system_prompt: str, user_prompt: str, model, client,
+                      temperature: float | None = 0.0,
+                      context: str | None = APPLICATION_NAME) -> CompletionStream:
+    """Starts a streamed completion.
+
+    Args:
+        system_prompt: Composed system prompt.
+        user_prompt: Agent query.
+        model: Model to use.
+        client: OpenAI client.
+        temperature: Temperature recorded in Metrics.
+        context: Context label recorded in Metrics.
+
+    Returns:
+        CompletionStream to iterate for answer deltas.
+    """
+    return CompletionStream(system_prompt, user_prompt, model, client, temperature, context)
@@ -0,0 +1,123 @@
+"""Schema-enforced structured output and local JSON repair.
+
+The assistant's answer is a JSON object {"respuesta", "confianza",
+"acciones_recomendadas"}. A stray code fence, a sentence before the object or
+a trailing comma used to make json.loads fail and wasted the whole (paid,
+~20 s) call. This module:
+
+- describes the answer as a pydantic model (AssistantResponse) and exposes it
+  as the API's JSON-schema response format (RESPONSE_FORMAT), so the model is
+  constrained to the schema when structured output is enabled
+- salvages recoverable outputs locally before giving up: strips code fences,
+  extracts the outermost object from surrounding text, removes trailing
+  commas, and coerces confianza to float ("0,85", "85%")
+
+parse_response reports which repairs were applied so they can be counted in
+Metrics; outputs that still do not validate raise ValueError.
+"""
+
+import json
+import re
+
+from pydantic import BaseModel, field_validator
+
+# ```json ... ``` alrededor de la respuesta
+_CODE_FENCE = re.compile(r"^```[a-zA-Z]*\s*(.*?)\s*```$", re.DOTALL)
+# Comas sobrantes antes de } o ]
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+class AssistantResponse(BaseModel):
+    """The JSON object the model must return (extra keys are ignored when parsing)."""
+
+    respuesta: str
+    confianza: float
+    acciones_recomendadas: list[str]
+
+    @field_validator("confianza", mode="before")
+    @classmethod
+    def _coerce_confianza(cls, value):
+        # Los modelos a veces devuelven "0,85" o "85%"
+        if isinstance(value, str):
+            text = value.strip().replace(",", ".")
+            if text.endswith("%"):
+                return float(text[:-1]) / 100
+            return float(text)
+        return value
+
+
+def _strict_schema() -> dict:
+    # El modo strict de la API exige additionalProperties: false
+    schema = AssistantResponse.model_json_schema()
+    schema["additionalProperties"] = False
+    return schema
+
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "assistant_response", "strict": True, "schema": _strict_schema()},
+}
+
+
+def repair_json(content: str) -> tuple[str, list[str]]:
+    """Fixes the usual formatting slips of a JSON answer.
+
+    Args:
+        content: Raw model output.
+
+    Returns:
+        Tuple of (repaired text, names of the repairs applied).
+    """
+    repairs = []
+    text = content.strip()
+
+    fenced = _CODE_FENCE.match(text)
+    if fenced:
+        text = fenced.group(1)
+        repairs.append("code_fence")
+
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start and (start > 0 or end < len(text) - 1):
+        text = text[start:end + 1]
+        repairs.append("surrounding_text")
+
+    try:
+        json.loads(text)
+    except json.JSONDecodeError:
+        without_commas = _TRAILING_COMMA.sub(r"\1", text)
+        if without_commas != text:
+            text = without_commas
+            repairs.append("trailing_comma")
+    return text, repairs
+
+
+def parse_response(content: str) -> tuple[AssistantResponse, list[str]]:
+    """Parses and validates the model output, repairing it if needed.
+
+    Args:
+        content: Raw model output.
+
+    Returns:
+        Tuple of (validated response, names of the repairs applied; empty
+        when the output was valid as is).
+
+    Raises:
+        ValueError: If the output is not valid JSON or does not match the
+            schema even after repair (json.JSONDecodeError and pydantic's
+            ValidationError are both ValueError).
+    """
+    try:
+        # Camino rápido: salida válida tal cual
+        data = json.loads(content)
+        repairs = []
+    except (json.JSONDecodeError, TypeError):
+        if not isinstance(content, str):
+            raise ValueError(f"Expected a JSON string, got {type(content).__name__}")
+        text, repairs = repair_json(content)
+        data = json.loads(text)
+
+    response = AssistantResponse.model_validate(data)
+    if isinstance(data, dict) and not isinstance(data.get("confianza"), (int, float)):
+        repairs.append("confianza_coerced")
+    return response, repairs
+
@@ -0,0 +1,79 @@
+"""Spanish text normalization helpers shared by retrieval and lookups.
+
+Queries arrive from agents in free form ("Cuál es la comisión...?",
+"comision cuenta corriente"), so anything that compares text needs to fold
+case, accents and punctuation first. Keeping that logic in one place makes
+sure the retrieval index and every consumer tokenize text the same way.
+"""
+
+import re
+import unicodedata
+
+_NON_WORD = re.compile(r"[^a-z0-9$%]+")
+_KEYCAP_EMOJI = re.compile(r"[⃣️]")
+
+# Palabras vacías frecuentes en las consultas de los agentes
+SPANISH_STOPWORDS = frozenset({
+    "a", "al", "algo", "algun", "alguna", "ante", "como", "con", "cual", "cuales",
+    "cuando", "cuanto", "cuanta", "de", "del", "desde", "donde", "el", "en", "es",
+    "esta", "este", "hay", "la", "las", "le", "lo", "los", "me", "mi", "mis", "para",
+    "por", "puedo", "que", "se", "si", "sin", "son", "su", "sus", "tiene", "tienen",
+    "tengo", "un", "una", "uno", "unos", "y", "o", "u", "ya", "quiero", "saber",
+})
+
+
+def normalize_text(text: str) -> str:
+    """Folds case, accents and punctuation into a canonical form.
+
+    Args:
+        text: Raw text (query or knowledge base fragment).
+
+    Returns:
+        Lowercase ASCII text with punctuation collapsed to single spaces.
+
+    Examples:
+        >>> normalize_text("¿Cuál es la comisión de Cuenta Corriente ?")
+        'cual es la comision de cuenta corriente'
+    """
+    text = _KEYCAP_EMOJI.sub("", text)
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    ascii_text = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_WORD.sub(" ", ascii_text).strip()
+
+
+def stem(token: str) -> str:
+    """Strips Spanish plural endings so "tarjetas" matches "tarjeta".
+
+    This is intentionally tiny: it only folds the plurals that show up in the
+    knowledge base, which is enough for lexical retrieval.
+
+    Args:
+        token: A normalized token.
+
+    Returns:
+        The singular form of the token when a plural ending is recognized.
+    """
+    if len(token) > 5 and token.endswith("es") and token[-3] in "nrldz":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str, drop_stopwords: bool = True, stemming: bool = True) -> list[str]:
+    """Splits text into normalized tokens.
+
+    Args:
+        text: Raw text to tokenize.
+        drop_stopwords: Whether to remove Spanish stopwords.
+        stemming: Whether to fold plural endings with stem().
+
+    Returns:
+        List of normalized tokens in their original order.
+    """
+    tokens = normalize_text(text).split()
+    if drop_stopwords:
+        tokens = [t for t in tokens if t not in SPANISH_STOPWORDS]
+    if stemming:
+        tokens = [stem(t) for t in tokens]
+    return tokens
@@ -0,0 +1,252 @@
+"""Lightweight per-phase tracing and sampling profiler hook.
+
+Metrics.latency_seconds only covers the model call; the rest of a query
+(retrieval and prompt composition, JSON parsing, metrics, log writing, logger
+formatting) was invisible. This module adds nested spans:
+
+    with span("retrieval_and_prompt", query_class="listing"):
+        ...
+
+- timings use time.perf_counter; spans nest through a ContextVar, so they
+  work across threads (server) and asyncio tasks (batch)
+- tracing is off by default: span() then returns a shared no-op object, so
+  instrumented code pays one global lookup and a function call
+- configure_tracing() exports every finished span as one JSONL line
+  (trace_id, span_id, parent_id, name, start, duration_ms, attributes)
+  through the buffered metrics sink
+- optionally a sampled fraction of root spans run under cProfile; when the
+  request ends up slower than a threshold its stats are dumped to a .prof file
+  (see the root span's "profile" attribute) for `python -m pstats`
+
+Usage:
+    python src/multitasking_text_utility/run_query.py --trace --profile-slow-ms 500
+"""
+
+import cProfile
+import functools
+import itertools
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable
+
+from metrics_sink import get_sink
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_TRACE_PATH = PROJECT_ROOT / "LOGS" / "traces.jsonl"
+DEFAULT_PROFILE_DIR = PROJECT_ROOT / ".cache" / "profiles"
+
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class _NoopSpan:
+    """Returned by span() while tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+    def set(self, key: str, value) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed phase of a request. Use through span().
+
+    Attributes:
+        name: Phase name (e.g. "api_call").
+        attrs: Free-form attributes exported with the span.
+        trace_id: Shared by every span of the same root.
+        span_id: Unique id within the process.
+        parent_id: span_id of the enclosing span (None for roots).
+        duration_ms: Elapsed time, set when the span ends.
+    """
+
+    __slots__ = ("tracer", "name", "attrs", "trace_id", "span_id", "parent_id",
+                 "timestamp", "start", "duration_ms", "_token", "_profiler")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.duration_ms: float | None = None
+        self._profiler: cProfile.Profile | None = None
+
+    def set(self, key: str, value) -> None:
+        """Adds an attribute to the span."""
+        self.attrs[key] = value
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else f"{self.span_id:x}-{random.getrandbits(32):08x}"
+        self._token = _current_span.set(self)
+        if parent is None:
+            self._profiler = self.tracer.start_profiler()
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        if self._profiler is not None:
+            self.tracer.stop_profiler(self, self._profiler)
+        self.tracer.export(self)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.timestamp,
+            "duration_ms": round(self.duration_ms, 3),
+            "thread": threading.current_thread().name,
+            "attrs": self.attrs,
+        }
+
+
+class Tracer:
+    """Exports finished spans and runs the sampling profiler.
+
+    Args:
+        path: JSONL file spans are appended to.
+        profile_sample_rate: Fraction of root spans run under cProfile (0-1).
+        slow_threshold_ms: Profiles are kept only for roots slower than this.
+        profile_dir: Folder for the .prof files.
+    """
+
+    def __init__(self, path: Path = DEFAULT_TRACE_PATH, profile_sample_rate: float = 0.0,
+                 slow_threshold_ms: float = 0.0, profile_dir: Path = DEFAULT_PROFILE_DIR):
+        self.path = path
+        self.sink = get_sink(path)
+        self.profile_sample_rate = profile_sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        self.profile_dir = profile_dir
+        self.exported = 0
+
+    def start_profiler(self) -> cProfile.Profile | None:
+        if self.profile_sample_rate <= 0 or random.random() >= self.profile_sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Ya hay otro profiler activo (otra consulta concurrente): esta no se perfila
+            return None
+        return profiler
+
+    def stop_profiler(self, root: Span, profiler: cProfile.Profile) -> None:
+        profiler.disable()
+        if root.duration_ms < self.slow_threshold_ms:
+            return
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        path = self.profile_dir / f"{root.name}_{root.trace_id}.prof"
+        profiler.dump_stats(path)
+        root.attrs["profile"] = str(path)
+        logger.info("Slow %s (%.0f ms) profiled to %s", root.name, root.duration_ms, path)
+
+    def export(self, finished: Span) -> None:
+        self.sink.write(finished.to_dict())
+        self.exported += 1
+
+
+_tracer: Tracer | None = None
+
+
+def span(name: str, **attrs):
+    """Starts a span (a context manager); a no-op while tracing is disabled.
+
+    Args:
+        name: Phase name.
+        **attrs: Attributes exported with the span.
+
+    Examples:
+        >>> with span("parse_completion") as s:
+        ...     parsed = parse_completion(content)
+        ...     s.set("repairs", len(repairs))
+    """
+    if _tracer is None:
+        return _NOOP_SPAN
+    return Span(_tracer, name, attrs)
+
+
+def child_span(name: str, **attrs):
+    """Like span(), but only inside an active span (never starts a new trace).
+
+    For code that also runs outside requests, such as log formatting.
+    """
+    if _tracer is None or _current_span.get() is None:
+        return _NOOP_SPAN
+    return Span(_tracer, name, attrs)
+
+
+def current_trace_id() -> str | None:
+    """trace_id of the active span (None when tracing is off or outside a span)."""
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+
+def traced(name: str | None = None) -> Callable:
+    """Decorator that wraps every call of a function in a span."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with Span(_tracer, span_name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def configure_tracing(path: Path = DEFAULT_TRACE_PATH, profile_sample_rate: float = 0.0,
+                      slow_threshold_ms: float = 0.0, profile_dir: Path = DEFAULT_PROFILE_DIR) -> Tracer:
+    """Enables tracing for the whole process.
+
+    Args:
+        path: JSONL file spans are appended to.
+        profile_sample_rate: Fraction of root spans run under cProfile.
+        slow_threshold_ms: Keep profiles only for roots slower than this.
+        profile_dir: Folder for the .prof files.
+
+    Returns:
+        The active Tracer.
+    """
+    global _tracer
+    _tracer = Tracer(path, profile_sample_rate, slow_threshold_ms, profile_dir)
+    return _tracer
+
+
+def disable_tracing() -> None:
+    """Turns tracing off again (pending spans are still flushed by the sink)."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.sink.flush()
+    _tracer = None
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
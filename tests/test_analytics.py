@@ -0,0 +1,92 @@
+import gzip
+import json
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+
+from dataclasses import asdict
+
+from src.multitasking_text_utility import analytics
+from src.multitasking_text_utility.analytics import load_metrics_frame, summarize
+from src.multitasking_text_utility.metrics import Metrics
+
+
+def metrics(model, latency, cost=0.001, completion_tokens=100, timestamp="2026-02-15T11:03:00", context="SoporteCliente"):
+    return {"model": model, "latency_seconds": latency, "estimated_cost_usd": cost, "prompt_tokens": 1000,
+            "completion_tokens": completion_tokens, "total_tokens": 1000 + completion_tokens,
+            "timestamp": timestamp, "context": context}
+
+
+def test_loads_legacy_json_plain_and_gzipped_jsonl(tmp_path):
+    (tmp_path / "SoporteCliente_2026-02-15T11:03.json").write_text(json.dumps(
+        {"metrics": metrics("gpt-5-mini", 10.0), "consulta": "a", "respuesta": {"respuesta": "b"}}), encoding="utf-8")
+    with open(tmp_path / "SoporteCliente.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"metrics": metrics("gpt-5-mini", 20.0), "consulta": 'dice "metrics": x'}) + "\n")
+        f.write(json.dumps({"id": "1", "metrics": None, "error": "RateLimited"}) + "\n")
+        f.write("not json\n")
+    with gzip.open(tmp_path / "SoporteCliente.2026-02-14.jsonl.gz", "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"metrics": metrics("gpt-4o-mini", 2.0)}) + "\n")
+    (tmp_path / "metrics.jsonl").write_text(json.dumps(metrics("gpt-4o-mini", 4.0)) + "\n", encoding="utf-8")
+
+    frame = load_metrics_frame([tmp_path])
+
+    assert len(frame) == 4
+    assert sorted(frame["latency_seconds"]) == [2.0, 4.0, 10.0, 20.0]
+    assert frame["tokens_per_second"].notna().all()
+
+
+def test_summary_reports_percentiles_and_cost_by_model(tmp_path):
+    path = tmp_path / "SoporteCliente.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(1, 101):
+            f.write(json.dumps({"metrics": metrics("gpt-5-mini", float(i), cost=0.01)}) + "\n")
+        f.write(json.dumps({"metrics": metrics("gpt-4o-mini", 1.0, cost=0.5)}) + "\n")
+
+    summary = summarize(load_metrics_frame([path], chunk_size=7), by=["model"])
+
+    gpt5 = summary.loc["gpt-5-mini"]
+    assert gpt5["requests"] == 100
+    assert gpt5["latency_p50"] == pytest.approx(50.5)
+    assert gpt5["latency_p99"] == pytest.approx(99.01)
+    assert gpt5["cost_total_usd"] == pytest.approx(1.0)
+    assert summary.loc["gpt-4o-mini", "cost_total_usd"] == pytest.approx(0.5)
+
+
+def test_summary_groups_by_time_bucket(tmp_path):
+    path = tmp_path / "SoporteCliente.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"metrics": metrics("gpt-5-mini", 1.0, timestamp="2026-02-15T11:03:00")}) + "\n")
+        f.write(json.dumps({"metrics": metrics("gpt-5-mini", 3.0, timestamp="2026-02-15T19:01:00.123456")}) + "\n")
+        f.write(json.dumps({"metrics": metrics("gpt-5-mini", 5.0, timestamp="2026-02-16T14:53:00")}) + "\n")
+
+    summary = summarize(load_metrics_frame([path]), by=["model", "context"], bucket="D")
+
+    assert list(summary["requests"]) == [2, 1]
+    assert list(summary["latency_p50"]) == [2.0, 5.0]
+
+
+def test_records_written_by_the_assistant_are_read_without_decoding_json(tmp_path):
+    record = Metrics(model="gpt-5-mini", temperature=1.0, prompt_tokens=1000, completion_tokens=200,
+                     total_tokens=1200, estimated_cost_usd=0.0012, latency_seconds=4.0,
+                     timestamp="2026-02-15T11:03:00.123456", context="SoporteCliente", output_path="/x/LOGS",
+                     time_to_first_token_seconds=0.5, attempts=[{"model": "gpt-4o-mini", "latency_seconds": 9.0}])
+    line = json.dumps({"metrics": asdict(record), "consulta": "a", "respuesta": {"respuesta": "b"}},
+                      ensure_ascii=False)
+    # Un context con escapes no sigue el camino rápido: se decodifica como JSON
+    escaped = json.dumps({"metrics": asdict(record) | {"context": 'Soporte "VIP"', "latency_seconds": 6.0}})
+    (tmp_path / "SoporteCliente.jsonl").write_text(line + "\n" + escaped + "\n", encoding="utf-8")
+
+    frame = load_metrics_frame([tmp_path])
+
+    assert analytics._METRICS_LINE.match(line) and not analytics._METRICS_LINE.match(escaped)
+    assert list(frame["latency_seconds"]) == [4.0, 6.0]
+    assert list(frame["context"]) == ["SoporteCliente", 'Soporte "VIP"']
+    assert list(frame["time_to_first_token_seconds"]) == [0.5, 0.5]
+    assert list(frame["tokens_per_second"]) == [50.0, 200 / 6.0]
+    assert frame["timestamp"].notna().all()
@@ -0,0 +1,118 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from unittest.mock import MagicMock, patch
+
+from src.multitasking_text_utility import batch
+from src.multitasking_text_utility.batch import BatchQuery, load_queries, run_batch
+from src.multitasking_text_utility.rate_limiter import RateLimitScheduler
+from src.multitasking_text_utility.run_query import OpenAIModels
+
+VALID_CONTENT = '{"respuesta": "Respuesta válida", "confianza": 0.9, "acciones_recomendadas": []}'
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def make_response():
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = VALID_CONTENT
+    response.usage.prompt_tokens = 10
+    response.usage.completion_tokens = 20
+    response.usage.total_tokens = 30
+    return response
+
+
+class FakeAsyncClient:
+    """Minimal AsyncOpenAI stand-in that tracks how many calls overlap."""
+
+    def __init__(self, failures_before_success: int = 0):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.failures_before_success = failures_before_success
+        self.chat = MagicMock()
+        self.chat.completions.create = self.create
+
+    async def create(self, model, messages):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.calls <= self.failures_before_success:
+                raise RateLimited("Too many requests")
+            return make_response()
+        finally:
+            self.in_flight -= 1
+
+
+async def collect(queries, client, **kwargs):
+    return [r async for r in run_batch(queries, OpenAIModels.GPT_4o_mini, client, **kwargs)]
+
+
+def test_load_queries_from_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / "queries.jsonl"
+    jsonl.write_text('{"id": "a", "consulta": "Horario de corte"}\n\n{"query": "CBU"}\n', encoding="utf-8")
+    csv_file = tmp_path / "queries.csv"
+    csv_file.write_text("consulta\nHorario de corte\n", encoding="utf-8")
+
+    assert load_queries(jsonl) == [BatchQuery("a", "Horario de corte"), BatchQuery("2", "CBU")]
+    assert load_queries(csv_file) == [BatchQuery("1", "Horario de corte")]
+
+
+def test_run_batch_bounds_concurrency():
+    client = FakeAsyncClient()
+    queries = [BatchQuery(str(i), "Cuál es la comisión de Cuenta Corriente ?") for i in range(10)]
+
+    results = asyncio.run(collect(queries, client, concurrency=3))
+
+    assert len(results) == 10
+    assert all(r.error is None for r in results)
+    assert sorted(r.id for r in results) == sorted(q.id for q in queries)
+    assert client.max_in_flight == 3
+    assert results[0].metrics.retrieved_sections
+
+
+@patch.object(batch, "backoff_delay", return_value=0)
+def test_run_batch_retries_rate_limited_requests(_):
+    client = FakeAsyncClient(failures_before_success=2)
+
+    results = asyncio.run(collect([BatchQuery("1", "Horario de corte")], client, max_retries=3))
+
+    assert results[0].error is None
+    assert results[0].attempts == 3
+    assert results[0].respuesta["respuesta"] == "Respuesta válida"
+
+
+@patch.object(batch, "backoff_delay", return_value=0)
+def test_run_batch_reports_error_when_retries_run_out(_):
+    client = FakeAsyncClient(failures_before_success=5)
+
+    results = asyncio.run(collect([BatchQuery("1", "Horario de corte")], client, max_retries=1))
+
+    assert results[0].respuesta is None
+    assert results[0].attempts == 2
+    assert "RateLimited" in results[0].error
+
+
+@patch.object(batch, "backoff_delay", return_value=0)
+def test_every_batch_attempt_is_charged_to_the_rate_limiter(_):
+    client = FakeAsyncClient(failures_before_success=2)
+    scheduler = RateLimitScheduler(rpm=600, tpm=100_000)
+
+    results = asyncio.run(collect([BatchQuery("1", "Horario de corte")], client, max_retries=3,
+                                  scheduler=scheduler))
+
+    assert results[0].attempts == 3 and results[0].metrics.priority == "bulk"
+    # Un request admitido por intento; solo el exitoso corrige su estimación con el usage real
+    assert scheduler.stats.granted == {"bulk": 3}
+    assert scheduler.stats.tokens_corrected < 0
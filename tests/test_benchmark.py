@@ -0,0 +1,51 @@
+import json
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from openai import OpenAI
+
+from src.multitasking_text_utility.benchmark import compare_reports, run_benchmark
+from src.multitasking_text_utility.fake_openai import FakeOpenAIServer
+
+
+def test_fake_server_samples_latency_and_token_distributions():
+    with FakeOpenAIServer(latency_seconds=0.01, latency_sigma=0.5, completion_tokens=1500,
+                          completion_tokens_sigma=0.3, seed=1) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+        tokens = [client.chat.completions.create(model="gpt-5-mini", messages=[{"role": "user", "content": "x"}])
+                  .usage.completion_tokens for _ in range(5)]
+
+    assert len(set(tokens)) > 1
+    assert len(server.latencies) == 5 and len(set(server.latencies)) == 5
+
+
+def test_benchmark_reports_every_scenario_as_json():
+    report = run_benchmark(concurrency_levels=(1, 2), requests=4, latency_seconds=0.02, latency_sigma=0.0,
+                           stage_iterations=5, log_threads=2, log_records=20)
+
+    json.dumps(report)
+    assert {"retrieval_and_prompt", "parse_completion", "sink_write"} <= set(report["stages"])
+    assert set(report["logging"]) == {"console", "json_queue", "debug_suppressed"}
+    assert [(r["scenario"], r["concurrency"]) for r in report["runs"]] == [
+        ("get_completion", 1), ("get_completion", 2), ("batch", 1), ("batch", 2), ("server", 1), ("server", 2)]
+    for run in report["runs"]:
+        assert run["errors"] == 0
+        assert run["model_latency_mean"] == 0.02
+        assert run["latency_p50"] >= 0.02
+        assert run["peak_memory_kb"] > 0
+
+
+def test_compare_flags_stage_and_overhead_regressions():
+    baseline = {"stages": {"parse_completion": 10.0, "sink_write": 5.0},
+                "runs": [{"scenario": "server", "concurrency": 4, "overhead_ms": 3.0, "peak_memory_kb": 100.0}]}
+    current = {"stages": {"parse_completion": 20.0, "sink_write": 5.5},
+               "runs": [{"scenario": "server", "concurrency": 4, "overhead_ms": 3.1, "peak_memory_kb": 300.0}]}
+
+    regressions = compare_reports(baseline, current, tolerance=0.25)
+
+    assert regressions == ["stage parse_completion: 10.0 -> 20.0 us", "server x4 peak_memory_kb: 100.0 -> 300.0 KB"]
@@ -0,0 +1,85 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.budgets import (
+    OutputBudget, PromptTooLargeError, budget_for, check_request_size, estimate_request_tokens,
+)
+from src.multitasking_text_utility.query_classifier import QueryClass
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+
+def make_response(content, finish_reason="stop", completion_tokens=100, reasoning_tokens=None):
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    response.choices[0].finish_reason = finish_reason
+    details = SimpleNamespace(reasoning_tokens=reasoning_tokens)
+    response.usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=completion_tokens,
+                                     total_tokens=1000 + completion_tokens, completion_tokens_details=details)
+    return response
+
+
+VALID = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+
+
+def test_budget_escalation_and_request_params():
+    budget = budget_for(QueryClass.DIRECT_LOOKUP)
+
+    assert budget.escalated() == OutputBudget(1600, "low")
+    assert OutputBudget(6000, "high").escalated() == OutputBudget(8000, "high")
+    assert budget.request_params("gpt-5-mini") == {"max_completion_tokens": 800, "reasoning_effort": "minimal"}
+    # gpt-4o-mini no es un modelo de razonamiento
+    assert budget.request_params("gpt-4o-mini") == {"max_completion_tokens": 800}
+
+
+def test_check_request_size():
+    messages = [{"role": "system", "content": "x" * 4000}, {"role": "user", "content": "hola"}]
+    assert estimate_request_tokens(messages) == 1000 + 1 + 2 * 4
+
+    check_request_size("gpt-5-mini", 1500, 3000)
+    with pytest.raises(PromptTooLargeError):
+        check_request_size("gpt-5-mini", 50_000)
+    with pytest.raises(PromptTooLargeError):
+        check_request_size("gpt-4", 6000, 3000, max_prompt_tokens=100_000)
+
+
+def test_oversized_prompt_is_rejected_before_calling_the_api():
+    client = MagicMock()
+
+    result = get_completion("system", "x" * 100_000, OpenAIModels.GPT_5_mini, client,
+                            budget=budget_for(QueryClass.DIRECT_LOOKUP))
+
+    assert isinstance(result, str) and "prompt budget" in result
+    client.chat.completions.create.assert_not_called()
+
+
+def test_truncated_answer_is_retried_once_with_a_higher_budget():
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [
+        make_response('{"respuesta": "o', finish_reason="length", completion_tokens=800, reasoning_tokens=780),
+        make_response(VALID, completion_tokens=900, reasoning_tokens=850),
+    ]
+
+    respuesta, metrics = get_completion("system", "Horario de corte", OpenAIModels.GPT_5_mini, client,
+                                        budget=budget_for(QueryClass.DIRECT_LOOKUP))
+
+    calls = client.chat.completions.create.call_args_list
+    assert [(c.kwargs["max_completion_tokens"], c.kwargs["reasoning_effort"]) for c in calls] == [
+        (800, "minimal"), (1600, "low")]
+    assert respuesta["respuesta"] == "ok"
+    assert metrics.budget_retry is True
+    assert metrics.max_completion_tokens == 1600
+    assert metrics.reasoning_tokens == 850
+    # Se pagan ambos llamados
+    assert metrics.completion_tokens == 1700
+    assert metrics.prompt_tokens == 2000
+    assert metrics.estimated_prompt_tokens > 0
@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from openai import OpenAI
+
+from src.multitasking_text_utility.batch import BatchQuery
+from src.multitasking_text_utility.bulk_eval import (
+    DEFAULT_GRID, OpenAIBatchTransport, build_batch_requests, join_results, run_bulk_eval, summarize_variants,
+)
+from src.multitasking_text_utility.fake_openai import FakeOpenAIServer
+from src.multitasking_text_utility.metrics import calculate_cost
+
+QUERIES = [BatchQuery("1", "Cuál es la comisión de Cuenta Corriente ?"),
+           BatchQuery("2", "Que productos de inversion tiene para ofrecer ?")]
+
+
+def test_batch_pricing_is_discounted():
+    assert calculate_cost("gpt-4o-mini", 1000, 500, batch=True) == pytest.approx(
+        calculate_cost("gpt-4o-mini", 1000, 500) / 2)
+
+
+def test_requests_cover_the_grid():
+    requests, pending = build_batch_requests(QUERIES, DEFAULT_GRID)
+
+    assert len(requests) == len(pending) == 8
+    assert requests[0]["custom_id"] == "gpt-4o-mini/zero_shot::1"
+    assert requests[0]["body"]["model"] == "gpt-4o-mini"
+    zero_shot, one_shot = (r["body"]["messages"][0]["content"] for r in requests[:2])
+    assert len(one_shot) > len(zero_shot)
+
+
+def test_bulk_eval_end_to_end_against_fake_batch_endpoint():
+    with FakeOpenAIServer(completion_tokens=200) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+        results = run_bulk_eval(QUERIES, OpenAIBatchTransport(client), poll_interval=0)
+
+    assert len(server.requests) == 8
+    assert [r.error for r in results] == [None] * 8
+    first = results[0]
+    assert first.respuesta["indicador_de_confianza"] == 0.95
+    assert first.metrics.batch_job_id == "batch_fake_1"
+    assert first.metrics.eval_variant == "gpt-4o-mini/zero_shot"
+    assert first.metrics.estimated_cost_usd == round(
+        calculate_cost("gpt-4o-mini", first.metrics.prompt_tokens, 200, batch=True), 4)
+    summary = summarize_variants(results)
+    assert summary["gpt-5-mini/one_shot"]["queries"] == 2
+
+
+def test_failed_and_missing_lines_become_errors():
+    _, pending = build_batch_requests(QUERIES[:1], DEFAULT_GRID[:2])
+    lines = [{"custom_id": "gpt-4o-mini/zero_shot::1",
+              "response": {"status_code": 429, "body": {"error": {"message": "rate limited"}}}}]
+
+    results = join_results(lines, pending, "batch_x", 10.0)
+
+    assert results[0].error.startswith("status 429")
+    assert results[1].error == "Missing from batch output"
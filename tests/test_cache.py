@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from unittest.mock import MagicMock, patch
+
+from src.multitasking_text_utility import cache as cache_module
+from src.multitasking_text_utility.cache import ResponseCache
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+SYSTEM_PROMPT = "Test system prompt"
+ANSWER = {"respuesta": "$8.000", "indicador_de_confianza": 0.9, "acciones_recomendadas": []}
+
+
+def test_hit_ignores_case_accents_and_punctuation(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+
+    cache.put("gpt-5-mini", SYSTEM_PROMPT, "¿Cuál es la comisión de Cuenta Corriente ?", ANSWER)
+
+    assert cache.get("gpt-5-mini", SYSTEM_PROMPT, "cual es la comision de cuenta corriente") == ANSWER
+    assert cache.get("gpt-4o-mini", SYSTEM_PROMPT, "cual es la comision de cuenta corriente") is None
+    assert cache.get("gpt-5-mini", "Otro prompt", "cual es la comision de cuenta corriente") is None
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", ttl_seconds=60)
+
+    with patch.object(cache_module.time, "time", return_value=1_000.0):
+        cache.put("gpt-5-mini", SYSTEM_PROMPT, "horario de corte", ANSWER)
+    with patch.object(cache_module.time, "time", return_value=1_100.0):
+        assert cache.get("gpt-5-mini", SYSTEM_PROMPT, "horario de corte") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", ttl_seconds=float("inf"), max_entries=2)
+
+    with patch.object(cache_module.time, "time", side_effect=[1.0, 2.0, 3.0, 4.0]):
+        cache.put("gpt-5-mini", SYSTEM_PROMPT, "a", ANSWER)
+        cache.put("gpt-5-mini", SYSTEM_PROMPT, "b", ANSWER)
+        cache.get("gpt-5-mini", SYSTEM_PROMPT, "a")
+        cache.put("gpt-5-mini", SYSTEM_PROMPT, "c", ANSWER)
+
+    assert len(cache) == 2
+    assert cache.get("gpt-5-mini", SYSTEM_PROMPT, "b") is None
+    assert cache.get("gpt-5-mini", SYSTEM_PROMPT, "a") == ANSWER
+
+
+def test_cache_is_cleared_when_prompt_version_changes(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    ResponseCache(path, version="v1").put("gpt-5-mini", SYSTEM_PROMPT, "a", ANSWER)
+
+    assert ResponseCache(path, version="v1").get("gpt-5-mini", SYSTEM_PROMPT, "a") == ANSWER
+    assert len(ResponseCache(path, version="v2")) == 0
+
+
+def test_get_completion_serves_repeats_from_cache(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    mock_client = MagicMock()
+    response = MagicMock()
+    response.choices[0].message.content = '{"respuesta": "$8.000", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage.prompt_tokens = 10
+    response.usage.completion_tokens = 20
+    response.usage.total_tokens = 30
+    mock_client.chat.completions.create.return_value = response
+    model = OpenAIModels.GPT_5_mini
+
+    first, first_metrics = get_completion(SYSTEM_PROMPT, "Comisión cuenta corriente?", model, mock_client, cache=cache)
+    second, second_metrics = get_completion(SYSTEM_PROMPT, "comision cuenta corriente", model, mock_client, cache=cache)
+
+    assert mock_client.chat.completions.create.call_count == 1
+    assert first == second == ANSWER
+    assert first_metrics.cache_hit is False
+    assert second_metrics.cache_hit is True
+    assert second_metrics.estimated_cost_usd == 0.0
+    assert second_metrics.total_tokens == 0
@@ -0,0 +1,100 @@
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.answer_store import AnswerStore, query_signature
+from src.multitasking_text_utility.cache_warming import (
+    cluster_queries,
+    iter_query_records,
+    precompute_answers,
+    rank_clusters,
+    seconds_until_window,
+)
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+ANSWER = {"respuesta": "18:00", "indicador_de_confianza": 0.9, "acciones_recomendadas": []}
+
+
+def record(consulta, cost):
+    return {"metrics": {"estimated_cost_usd": cost, "latency_seconds": 15.0}, "consulta": consulta,
+            "respuesta": ANSWER}
+
+
+def test_logs_are_mined_clustered_and_ranked(tmp_path):
+    (tmp_path / "SoporteCliente_2026-02-15T11:03.json").write_text(
+        json.dumps(record("¿Cuál es el horario de corte de transferencias?", 0.003), indent=2), encoding="utf-8")
+    lines = [record("cual es el horario de corte de las transferencias", 0.003),
+             record("Horario de corte transferencias", 0.002),
+             record("Comisión de Cuenta Corriente", 0.001),
+             record("Comisión de Cuenta Corriente", 0.001),
+             record("Comision cuenta corriente?", 0.001),
+             record("comisiones cuenta corriente", 0.001),
+             {"metrics": None, "consulta": "falló", "error": "timeout"}]
+    (tmp_path / "SoporteCliente.jsonl").write_text("\n".join(json.dumps(r) for r in lines) + "\n",
+                                                   encoding="utf-8")
+
+    clusters = cluster_queries(iter_query_records([tmp_path]))
+
+    assert len(clusters) == 2
+    by_frequency = rank_clusters(clusters, top_n=1, by="frequency")[0]
+    by_cost = rank_clusters(clusters, top_n=1, by="cost")[0]
+    assert by_frequency.representative == "Comisión de Cuenta Corriente"
+    assert by_frequency.count == 4
+    assert by_cost.count == 3 and round(by_cost.total_cost_usd, 4) == 0.008
+    assert "horario" in by_cost.signature
+
+
+def test_precomputed_store_round_trips_and_answers_variants(tmp_path):
+    clusters = cluster_queries([("Horario de corte de transferencias", 0.003),
+                                ("horario corte transferencia", 0.003)])
+    answer = MagicMock(return_value=ANSWER)
+
+    precomputed = precompute_answers(clusters, answer, concurrency=2)
+    AnswerStore("v1", precomputed, "gpt-5-mini").save(tmp_path / "answers.json")
+
+    assert AnswerStore.load(tmp_path / "answers.json", version="v2") is None
+    store = AnswerStore.load(tmp_path / "answers.json", version="v1")
+    assert answer.call_count == 1
+    assert store.get("¿Horario de corte de las transferencias?") == ANSWER
+    assert store.get("Comisión de cuenta corriente") is None
+    store.set_version("v2")
+    assert store.get("horario corte transferencia") is None
+
+    client = MagicMock()
+    store.set_version("v1")
+    respuesta, metrics = get_completion("system", "horario de corte transferencias", OpenAIModels.GPT_5_mini,
+                                        client, answer_store=store)
+    assert respuesta == ANSWER
+    assert metrics.precomputed_answer is True and metrics.estimated_cost_usd == 0.0
+    client.chat.completions.create.assert_not_called()
+
+
+def test_questions_differing_in_one_entity_word_never_share_an_answer():
+    debito = "¿Cuál es el límite diario de extracción en cajero automático con tarjeta de débito en pesos?"
+    credito = "¿Cuál es el límite diario de extracción en cajero automático con tarjeta de crédito en pesos?"
+    clusters = cluster_queries([(debito, 0.003), (debito, 0.003), (credito, 0.003)])
+    answers = {debito: {**ANSWER, "respuesta": "débito"}, credito: {**ANSWER, "respuesta": "crédito"}}
+
+    precomputed = precompute_answers(clusters, answers.get)
+    store = AnswerStore("v1", precomputed)
+
+    assert len(clusters) == 1  # casi idénticas: se agrupan para el ranking...
+    assert store.get(debito)["respuesta"] == "débito"  # ...pero cada una tiene su propia respuesta
+    assert store.get(credito)["respuesta"] == "crédito"
+    assert store.get("límite diario de extracción con tarjeta prepaga") is None
+
+
+def test_off_peak_window():
+    assert query_signature("cuenta corriente: comisiones") == query_signature("¿Comisión de Cuenta Corriente?")
+    assert seconds_until_window((22, 6), datetime(2026, 3, 1, 23, 30)) == 0
+    assert seconds_until_window((22, 6), datetime(2026, 3, 1, 3, 0)) == 0
+    assert seconds_until_window((22, 6), datetime(2026, 3, 1, 21, 0)) == 3600
+    assert seconds_until_window((1, 5), datetime(2026, 3, 1, 6, 0)) == 19 * 3600
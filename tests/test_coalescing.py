@@ -0,0 +1,121 @@
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.batch import BatchQuery, run_batch
+from src.multitasking_text_utility.coalescing import SingleFlight
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+VALID_CONTENT = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+
+
+def run_concurrently(n, fn):
+    results = [None] * n
+    errors = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_identical_in_flight_calls_share_one_result_or_error():
+    flights = SingleFlight()
+    calls = []
+
+    def slow(value):
+        def fn():
+            calls.append(value)
+            time.sleep(0.1)
+            if isinstance(value, Exception):
+                raise value
+            return {"value": value}
+        return fn
+
+    results, _ = run_concurrently(5, lambda: flights.do("k", slow(1)))
+    assert len(calls) == 1
+    assert [r[0] for r in results] == [{"value": 1}] * 5
+    assert sorted(r[1].followers for r in results) == [0, 0, 0, 0, 4]
+    assert flights.stats.coalesced == 4
+    assert flights.in_flight() == 0
+
+    _, errors = run_concurrently(3, lambda: flights.do("k", slow(RuntimeError("API caída"))))
+    assert len(calls) == 2
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_get_completion_coalesces_concurrent_identical_queries():
+    def create(**kwargs):
+        time.sleep(0.1)
+        response = MagicMock()
+        response.choices = [MagicMock(finish_reason="stop")]
+        response.choices[0].message.content = VALID_CONTENT
+        response.usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100, total_tokens=1100)
+        return response
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    flights = SingleFlight()
+    queries = iter(["¿Horario de corte?", "horario de corte", "Horario de corte", "HORARIO DE CORTE"])
+    lock = threading.Lock()
+
+    def ask():
+        with lock:
+            query = next(queries)
+        return get_completion("system", query, OpenAIModels.GPT_4o_mini, client, coalescer=flights)
+
+    results, errors = run_concurrently(4, ask)
+
+    assert errors == [None] * 4
+    assert client.chat.completions.create.call_count == 1
+    metrics = sorted((r[1] for r in results), key=lambda m: m.coalesced)
+    assert metrics[0].coalesced is False and metrics[0].coalesced_requests == 3
+    assert all(m.coalesced and m.estimated_cost_usd == 0.0 and m.total_tokens == 0 for m in metrics[1:])
+    assert all(r[0]["respuesta"] == "ok" for r in results)
+
+
+def test_batch_coalesces_duplicated_queries():
+    calls = []
+
+    async def create(model, messages):
+        calls.append(messages)
+        await asyncio.sleep(0.05)
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = VALID_CONTENT
+        response.usage = SimpleNamespace(prompt_tokens=10, completion_tokens=20, total_tokens=30)
+        return response
+
+    client = MagicMock()
+    client.chat.completions.create = create
+    queries = [BatchQuery(str(i), "Cuál es la comisión de Cuenta Corriente ?") for i in range(6)]
+
+    async def collect():
+        return [r async for r in run_batch(queries, OpenAIModels.GPT_4o_mini, client, concurrency=2,
+                                           coalescer=SingleFlight())]
+
+    results = asyncio.run(collect())
+
+    assert len(calls) == 1
+    assert sum(r.attempts for r in results) == 1
+    assert sorted(r.metrics.coalesced_requests or 0 for r in results) == [0, 0, 0, 0, 0, 5]
+    assert all(r.respuesta["respuesta"] == "ok" for r in results)
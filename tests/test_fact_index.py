@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.fact_index import FactIndex
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+
+@pytest.fixture
+def fact_index():
+    return FactIndex.from_kb()
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Cuál es la comisión de Cuenta Corriente ?", "Comisión de cuenta corriente (Cuenta Corriente): $8.000."),
+    ("horario de corte", "Horario de corte (Transferencias Nacionales): 18:00."),
+    ("Cuál es el tope de transferencias?", "Monto máximo diario (Transferencias Nacionales): $2.000.000."),
+    ("cuanto tarda un reclamo", "Tiempo de respuesta (Reclamos): hasta 72 horas hábiles."),
+])
+def test_direct_lookups_are_answered(fact_index, query, expected):
+    answer = fact_index.answer(query)
+
+    assert answer["respuesta"] == expected
+    assert answer["indicador_de_confianza"] == 1.0
+    assert answer["acciones_recomendadas"]
+
+
+@pytest.mark.parametrize("query", [
+    "monto maximo",  # Transferencias Nacionales o Préstamos Personales
+    "Que productos de inversion tiene para ofrecer ?",
+    "Cual es la comision de la cuenta corriente y como la bonifico?",
+])
+def test_ambiguous_or_open_queries_go_to_the_model(fact_index, query):
+    assert fact_index.answer(query) is None
+
+
+def test_get_completion_skips_the_model_on_a_hit_and_reports_hit_rate(fact_index):
+    client = MagicMock()
+
+    answer, metrics = get_completion("system", "horario de corte", OpenAIModels.GPT_5_mini, client,
+                                     fact_index=fact_index)
+
+    client.chat.completions.create.assert_not_called()
+    assert answer["respuesta"].endswith("18:00.")
+    assert metrics.fact_index_hit is True
+    assert metrics.estimated_cost_usd == 0.0
+    assert metrics.fact_lookup_us < 10_000
+    assert metrics.fact_index_hit_rate == 1.0
@@ -0,0 +1,95 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import os
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.bank_kb import BANK_KB
+from src.multitasking_text_utility.cache import ResponseCache
+from src.multitasking_text_utility.kb_store import KBStore, read_document, split_document
+from src.multitasking_text_utility.server import AssistantService
+
+SEGUROS_MD = "# Seguro de viaje\n- Cobertura: USD 50.000.\n\n# Plazo fijo UVA\n- Plazo mínimo: 90 días.\n"
+
+
+@pytest.fixture
+def kb_dir(tmp_path):
+    (tmp_path / "bank_kb.md").write_text(BANK_KB, encoding="utf-8")
+    (tmp_path / "seguros.md").write_text(SEGUROS_MD, encoding="utf-8")
+    return tmp_path
+
+
+def write(path, text):
+    # Fuerza un mtime distinto aunque el sistema de archivos tenga resolución gruesa
+    stat = path.stat()
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_documents_are_split_into_sections(kb_dir):
+    snapshot = KBStore(kb_dir).snapshot
+
+    ids = [s.id for s in snapshot.index.sections]
+    assert ids[:2] == ["1", "2"] and ids[-2:] == ["seguros-1", "seguros-2"]
+    assert "seguros-1" in snapshot.index.retrieve("cobertura del seguro de viaje").section_ids
+    assert snapshot.fact_index.answer("horario de corte")["respuesta"].endswith("18:00.")
+    assert split_document("Texto sin encabezados.", "faq")[0].title == "faq"
+
+
+def test_large_files_are_memory_mapped(kb_dir):
+    path = kb_dir / "bank_kb.md"
+    size = path.stat().st_size
+
+    assert read_document(path, size, mmap_threshold=1) == read_document(path, size, mmap_threshold=size + 1)
+
+
+def test_only_changed_sections_are_reindexed_and_version_bumps(kb_dir):
+    store = KBStore(kb_dir)
+    before = store.snapshot
+    published = []
+    store.subscribe(published.append)
+
+    assert store.refresh() is False
+    write(kb_dir / "seguros.md", SEGUROS_MD.replace("50.000", "80.000"))
+    assert store.refresh() is True
+
+    assert (store.last_reparsed_files, store.last_reindexed_sections) == (1, 1)
+    assert published == [store.snapshot]
+    assert store.snapshot.version == before.version + 1
+    assert store.snapshot.prompt_version != before.prompt_version
+    assert "80.000" in store.snapshot.kb and "50.000" in before.kb
+
+
+def test_server_follows_kb_changes(kb_dir, tmp_path_factory):
+    def create(model, messages, **kwargs):
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+        response.usage = SimpleNamespace(prompt_tokens=100, completion_tokens=10, total_tokens=110)
+        return response
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    store = KBStore(kb_dir)
+    cache = ResponseCache(tmp_path_factory.mktemp("cache") / "responses.sqlite3")
+    service = AssistantService(client, cache=cache, fast_path=False, kb_store=store)
+
+    service.answer("Cobertura del seguro de viaje")
+    assert len(cache) == 1
+    write(kb_dir / "seguros.md", SEGUROS_MD.replace("50.000", "80.000"))
+    store.refresh()
+    service.answer("Cobertura del seguro de viaje")
+
+    assert cache.version == store.snapshot.prompt_version
+    system_prompt = client.chat.completions.create.call_args.kwargs["messages"][0]["content"]
+    assert "USD 80.000" in system_prompt
+    assert client.chat.completions.create.call_count == 2
+    cache.close()
@@ -0,0 +1,86 @@
+import sys
+import urllib.request
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from src.multitasking_text_utility.live_metrics import (
+    Histogram,
+    LiveMetrics,
+    log_linear_bounds,
+    serve_metrics,
+)
+from src.multitasking_text_utility.metrics import Metrics
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_metrics(latency, cost=0.002, model="gpt-5-mini", context="SoporteCliente_server", ttft=None):
+    return Metrics(model=model, temperature=0.0, prompt_tokens=1200, completion_tokens=80, total_tokens=1280,
+                   estimated_cost_usd=cost, latency_seconds=latency, timestamp="2026-03-01T10:00:00",
+                   context=context, time_to_first_token_seconds=ttft)
+
+
+def test_histogram_quantiles_are_within_bucket_precision():
+    hist = Histogram(log_linear_bounds(0.001, 300.0))
+    values = [0.5 + i * 0.01 for i in range(2000)]  # 0.5 s a 20.5 s
+    for value in values:
+        hist.record(value)
+
+    assert hist.count == 2000
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * len(values)) - 1]
+        assert exact <= hist.quantile(q) <= exact * 1.13
+    assert hist.quantile(1.0) == hist.max == values[-1]
+
+
+def test_rolling_windows_forget_old_samples():
+    clock = FakeClock()
+    live = LiveMetrics(clock=clock)
+    for _ in range(99):
+        live.observe(make_metrics(2.0))
+    live.observe(make_metrics(30.0, ttft=0.8))
+
+    assert 2.0 <= live.quantile("latency", 0.99, "gpt-5-mini", "SoporteCliente_server") < 2.2
+    assert live.quantile("latency", 1.0, "gpt-5-mini", "SoporteCliente_server") == 30.0
+    assert live.snapshot("ttft", "1m", "gpt-5-mini", "SoporteCliente_server").count == 1
+    assert round(live.spend_rate("gpt-5-mini", "SoporteCliente_server"), 4) == round(100 * 0.002 * 60, 4)
+
+    clock.now += 120
+    live.observe(make_metrics(5.0))
+    assert live.snapshot("latency", "1m", "gpt-5-mini", "SoporteCliente_server").count == 1
+    assert live.snapshot("latency", "1h", "gpt-5-mini", "SoporteCliente_server").count == 101
+    clock.now += 3600
+    assert live.snapshot("latency", "1h", "gpt-5-mini", "SoporteCliente_server").count == 0
+
+
+def test_prometheus_endpoint_exposes_quantiles_spend_rate_and_counters():
+    live = LiveMetrics(clock=FakeClock())
+    live.observe(make_metrics(12.0, model="gpt-4o-mini"))
+    live.observe_error("gpt-4o-mini", "SoporteCliente_server")
+    httpd = serve_metrics(0, live=live)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{httpd.server_address[1]}/metrics") as response:
+            content_type = response.headers["Content-Type"]
+            text = response.read().decode("utf-8")
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert content_type.startswith("text/plain; version=0.0.4")
+    labels = 'model="gpt-4o-mini",context="SoporteCliente_server"'
+    assert "# TYPE assistant_latency_seconds summary" in text
+    assert f'assistant_latency_seconds{{{labels},window="1m",quantile="0.99"}} 12' in text
+    assert f'assistant_latency_seconds_count{{{labels},window="1h"}} 1' in text
+    assert f'assistant_spend_usd_per_hour{{{labels},window="1m"}} 0.12' in text
+    assert f"assistant_requests_total{{{labels}}} 1" in text
+    assert f"assistant_errors_total{{{labels}}} 1" in text
@@ -0,0 +1,102 @@
+import io
+import json
+import logging
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import tracing
+from src.multitasking_text_utility.logger import (
+    SamplingFilter,
+    build_production_handler,
+    parse_sample_rates,
+)
+
+
+class CountingArg:
+    """Message argument that counts how many times it was rendered."""
+
+    def __init__(self):
+        self.renders = 0
+
+    def __str__(self):
+        self.renders += 1
+        return "arg"
+
+
+def make_logger(name, handler, level=logging.INFO):
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def test_records_are_written_as_json_lines_from_the_listener_thread(tmp_path):
+    stream = io.StringIO()
+    handler, listener = build_production_handler(stream)
+    logger = make_logger("test_logging.json", handler)
+    listener.start()
+    tracing.configure_tracing(path=tmp_path / "traces.jsonl")
+    try:
+        with tracing.span("query"):
+            trace_id = tracing.current_trace_id()
+            logger.info("Consulta respondida. Tokens: %d, Cost: %.4f", 1280, 0.0021)
+        try:
+            raise ValueError("sin respuesta")
+        except ValueError:
+            logger.exception("Error respondiendo consulta: %s", "timeout")
+    finally:
+        tracing.disable_tracing()
+        listener.stop()
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first["message"] == "Consulta respondida. Tokens: 1280, Cost: 0.0021"
+    assert first["level"] == "INFO" and first["logger"] == "test_logging.json"
+    assert first["trace_id"] == trace_id
+    assert "\033[" not in stream.getvalue()
+    assert second["level"] == "ERROR" and "ValueError: sin respuesta" in second["exc"]
+
+
+def test_messages_are_formatted_lazily_off_the_calling_thread():
+    stream = io.StringIO()
+    handler, listener = build_production_handler(stream)
+    logger = make_logger("test_logging.lazy", handler)
+    arg = CountingArg()
+
+    logger.debug("Cost calculation: %s", arg)  # suprimido: nunca se formatea
+    logger.info("Metrics queued for %s", arg)
+    assert arg.renders == 0  # encolado sin formatear
+
+    listener.start()
+    listener.stop()
+    assert arg.renders == 1
+    assert json.loads(stream.getvalue())["message"] == "Metrics queued for arg"
+
+
+def test_sampling_keeps_a_fraction_per_template_and_all_warnings():
+    stream = io.StringIO()
+    handler, listener = build_production_handler(stream, sample_rates=parse_sample_rates("test_logging.noisy=0.1"))
+    noisy = make_logger("test_logging.noisy", handler, logging.DEBUG)
+    other = make_logger("test_logging.other", handler)
+    listener.start()
+    for i in range(100):
+        noisy.debug("Rate limit: %s request queued %.2fs", "live", i / 100)
+    noisy.debug("Single-flight: %d requests shared one call", 3)
+    for _ in range(3):
+        noisy.warning("Attempt failed (%s), retrying", "Timeout")
+    other.info("Servidor escuchando")
+    listener.stop()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    queued = [r for r in records if r["message"].startswith("Rate limit")]
+    assert len(queued) == 10 and queued[0]["sample_rate"] == 0.1
+    assert any(r["message"].startswith("Single-flight") for r in records)
+    assert sum(r["level"] == "WARNING" for r in records) == 3
+    assert any(r["logger"] == "test_logging.other" for r in records)
+    sampling = next(f for f in handler.filters if isinstance(f, SamplingFilter))
+    assert sampling.dropped == 90
@@ -0,0 +1,114 @@
+import gzip
+import json
+import sys
+import threading
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from src.multitasking_text_utility import metrics as metrics_module
+from src.multitasking_text_utility.metrics import Metrics, log_metrics
+from src.multitasking_text_utility.metrics_sink import JsonlMetricsSink, migrate_legacy_logs
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def make_metrics(context="SoporteCliente"):
+    return Metrics(model="gpt-5-mini", temperature=0.0, prompt_tokens=10, completion_tokens=20, total_tokens=30,
+                   estimated_cost_usd=0.0001, latency_seconds=1.5, timestamp="2026-02-16T17:07:23", context=context)
+
+
+def test_concurrent_writers_produce_whole_lines(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    sink = JsonlMetricsSink(path, flush_interval=0.01, max_buffer=7)
+
+    def writer(n):
+        for i in range(200):
+            sink.write({"writer": n, "i": i, "consulta": "x" * 100})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sink.close()
+
+    records = read_lines(path)
+    assert len(records) == 1600
+    assert {(r["writer"], r["i"]) for r in records} == {(n, i) for n in range(8) for i in range(200)}
+
+
+def test_size_rotation_gzips_previous_file(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    sink = JsonlMetricsSink(path, rotate_bytes=50)
+
+    sink.write({"consulta": "a" * 60})
+    sink.flush()
+    sink.write({"consulta": "b"})
+    sink.close()
+
+    rotated = list(tmp_path.glob("metrics.*.jsonl.gz"))
+    assert len(rotated) == 1
+    with gzip.open(rotated[0], "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline())["consulta"] == "a" * 60
+    assert read_lines(path) == [{"consulta": "b"}]
+
+
+def test_log_metrics_appends_instead_of_overwriting(tmp_path):
+    log_metrics(make_metrics(), tmp_path)
+    log_metrics(make_metrics(), tmp_path)
+    # La sink compartida es la que usa el módulo metrics
+    metrics_module.get_sink(tmp_path / "metrics.jsonl").close()
+
+    records = read_lines(tmp_path / "metrics.jsonl")
+    assert len(records) == 2
+    assert records[0]["metrics"]["context"] == "SoporteCliente"
+
+
+def test_migrates_legacy_json_logs(tmp_path):
+    legacy = tmp_path / "logs"
+    legacy.mkdir()
+    (legacy / "SoporteCliente_2026-02-16T17:07.json").write_text(json.dumps({
+        "metrics": {"model": "gpt-5-mini", "latency_seconds": 13.99},
+        "consulta": "Que productos de inversion tiene para ofrecer ?",
+        "respuesta": {"respuesta": "Plazos Fijos"},
+    }), encoding="utf-8")
+    (legacy / "Soporte.metrics.json").write_text(json.dumps({"model": "gpt-4o-mini"}), encoding="utf-8")
+    (legacy / "broken.json").write_text("{", encoding="utf-8")
+    sink = JsonlMetricsSink(tmp_path / "all.jsonl")
+
+    count = migrate_legacy_logs(legacy, sink, delete=True)
+    sink.close()
+
+    records = read_lines(tmp_path / "all.jsonl")
+    assert count == 2
+    assert records[0] == {"metrics": {"model": "gpt-4o-mini"}, "source_file": "Soporte.metrics.json"}
+    assert records[1]["consulta"] == "Que productos de inversion tiene para ofrecer ?"
+    assert [p.name for p in legacy.iterdir()] == ["broken.json"]
+
+
+def test_concurrent_flushes_keep_records_in_write_order(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    sink = JsonlMetricsSink(path, flush_interval=60, max_buffer=10_000)
+    done = threading.Event()
+
+    def flusher():
+        while not done.is_set():
+            sink.flush()
+
+    threads = [threading.Thread(target=flusher) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(2000):
+        sink.write({"i": i})
+    done.set()
+    for t in threads:
+        t.join()
+    sink.close()
+
+    assert [r["i"] for r in read_lines(path)] == list(range(2000))
@@ -0,0 +1,153 @@
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.micro_batch import MicroBatcher, parse_batch_answers, split_tokens
+from src.multitasking_text_utility.rate_limiter import Priority, RateLimitScheduler
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+
+def make_response(content, prompt_tokens, completion_tokens):
+    response = MagicMock()
+    response.choices = [MagicMock(finish_reason="stop")]
+    response.choices[0].message.content = content
+    response.usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                     total_tokens=prompt_tokens + completion_tokens)
+    return response
+
+
+def test_split_tokens_is_proportional_and_exact():
+    assert split_tokens(10, [1, 1, 1]) == [4, 3, 3]
+    assert split_tokens(100, [3, 1]) == [75, 25]
+    assert split_tokens(5, [0, 0]) == [3, 2]
+    assert sum(split_tokens(1234, [0.3, 7.1, 2.2])) == 1234
+
+
+def test_parse_batch_answers_keeps_only_valid_entries():
+    content = '```json\n{"respuestas": [' \
+              '{"id": "q1", "respuesta": "18:00", "confianza": 0.9, "acciones_recomendadas": []},' \
+              '{"id": "q2", "respuesta": "sin confianza"},' \
+              '{"respuesta": "sin id", "confianza": 0.5, "acciones_recomendadas": []}]}\n```'
+
+    answers = parse_batch_answers(content)
+
+    assert answers == {"q1": {"respuesta": "18:00", "indicador_de_confianza": 0.9, "acciones_recomendadas": []}}
+    assert parse_batch_answers("No puedo responder") == {}
+
+
+def test_concurrent_questions_share_one_completion_and_missing_ones_fall_back():
+    def create(model, messages, **kwargs):
+        if kwargs.get("response_format") == {"type": "json_object"}:
+            questions = json.loads(messages[1]["content"].rsplit("\n", 1)[1])
+            # El modelo omite la última pregunta del batch
+            respuestas = [{"id": q["id"], "respuesta": f"r-{q['consulta']}", "confianza": 0.9,
+                           "acciones_recomendadas": []} for q in questions[:-1]]
+            return make_response(json.dumps({"respuestas": respuestas}), 1200, 90)
+        return make_response('{"respuesta": "individual", "confianza": 0.8, "acciones_recomendadas": []}', 1000, 40)
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    batcher = MicroBatcher(client, OpenAIModels.GPT_4o_mini, system_prompt="system", window_seconds=0.2, max_batch=3)
+    results = {}
+
+    def ask(query):
+        results[query] = get_completion("system", query, OpenAIModels.GPT_4o_mini, client, micro_batcher=batcher)
+
+    threads = [threading.Thread(target=ask, args=(q,)) for q in ["a", "b", "c"]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert client.chat.completions.create.call_count == 2  # un batch de 3 y un llamado individual
+    answered = [r for r in results.values() if r[0]["respuesta"] != "individual"]
+    fallback = [r for r in results.values() if r[0]["respuesta"] == "individual"]
+    assert len(answered) == 2 and len(fallback) == 1
+    assert all(m.micro_batch_size == 3 and not m.micro_batch_fallback for _, m in answered)
+    assert fallback[0][1].micro_batch_fallback is True
+    # Los tokens del batch se reparten entre las 3 preguntas sin perder ninguno
+    fallback_share = fallback[0][1].prompt_tokens - 1000
+    assert sum(m.prompt_tokens for _, m in answered) + fallback_share == 1200
+    assert fallback[0][1].completion_tokens == 40  # la pregunta omitida no generó salida en el batch
+    assert batcher.stats.batches == 1 and batcher.stats.missing == 1
+
+
+def test_a_lone_question_is_not_batched():
+    client = MagicMock()
+    client.chat.completions.create.return_value = make_response(
+        '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}', 1000, 40)
+    batcher = MicroBatcher(client, OpenAIModels.GPT_4o_mini, system_prompt="system", window_seconds=0.01)
+
+    respuesta, metrics = get_completion("system", "Horario de corte", OpenAIModels.GPT_4o_mini, client,
+                                        micro_batcher=batcher)
+    batcher.close()
+
+    assert respuesta["respuesta"] == "ok"
+    assert metrics.micro_batch_size is None
+    assert "response_format" not in client.chat.completions.create.call_args.kwargs
+    assert batcher.stats.singles == 1
+
+
+def test_batches_are_charged_to_the_rate_limiter():
+    client = MagicMock()
+    client.chat.completions.create.return_value = make_response(json.dumps({"respuestas": [
+        {"id": f"q{i}", "respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []} for i in (1, 2)]}), 1200, 90)
+    scheduler = RateLimitScheduler(rpm=600, tpm=1_000_000)
+    batcher = MicroBatcher(client, OpenAIModels.GPT_4o_mini, system_prompt="system", window_seconds=0.2,
+                           max_batch=2, scheduler=scheduler)
+    results = []
+    threads = [threading.Thread(target=lambda q=q: results.append(batcher.submit(q, Priority.INTERACTIVE)))
+               for q in ["a", "b"]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert client.chat.completions.create.call_count == 1
+    assert scheduler.stats.granted == {"interactive": 1}  # una sola reserva para todo el batch
+    assert scheduler.stats.tokens_corrected != 0  # corregida con el usage del batch
+    assert all(answer is not None and share.queue_wait_seconds is not None and share.priority == "interactive"
+               for answer, share in results)
+    assert "timeout" in client.chat.completions.create.call_args.kwargs
+
+
+def test_a_batch_past_its_deadline_falls_back_to_single_calls():
+    def create(model, messages, **kwargs):
+        if kwargs.get("response_format") == {"type": "json_object"}:
+            time.sleep(0.5)  # el batch no responde a tiempo
+            return make_response('{"respuestas": []}', 1200, 10)
+        return make_response('{"respuesta": "individual", "confianza": 0.8, "acciones_recomendadas": []}', 1000, 40)
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    batcher = MicroBatcher(client, OpenAIModels.GPT_4o_mini, system_prompt="system", window_seconds=0.05,
+                           max_batch=2, timeout_seconds=0.1)
+    results = []
+
+    def ask(query):
+        results.append(get_completion("system", query, OpenAIModels.GPT_4o_mini, client, micro_batcher=batcher))
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=ask, args=(q,)) for q in ["a", "b"]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    batcher.close()
+
+    assert elapsed < 0.45
+    assert [r[0]["respuesta"] for r in results] == ["individual", "individual"]
+    assert batcher.stats.timeouts == 2
@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.bank_kb import BANK_KB
+from src.multitasking_text_utility.metrics import calculate_cost
+from src.multitasking_text_utility.prompt_builder import build_messages, compose_static_prefix, compose_system_prompt
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+
+def test_static_prefix_comes_first_and_query_last():
+    system_prompt = compose_system_prompt(BANK_KB)
+
+    messages = build_messages(system_prompt, "Horario de corte?")
+
+    assert [m["role"] for m in messages] == ["system", "user"]
+    assert messages[0]["content"].startswith(compose_static_prefix())
+    assert messages[1]["content"] == "Horario de corte?"
+
+
+def test_composition_is_byte_stable():
+    windows_kb = BANK_KB.replace("\n", "\r\n") + "   \n"
+
+    assert compose_system_prompt(BANK_KB) == compose_system_prompt(BANK_KB)
+    assert compose_system_prompt(windows_kb) == compose_system_prompt(BANK_KB)
+    assert compose_static_prefix(one_shot=False) != compose_static_prefix(one_shot=True)
+
+
+def test_cached_prompt_tokens_are_billed_at_discounted_rate():
+    full_price = calculate_cost("gpt-5-mini", 1000, 0)
+    with_cache = calculate_cost("gpt-5-mini", 1000, 0, cached_tokens=1000)
+
+    assert with_cache == full_price / 10
+    # Models without a cached rate are billed at the regular prompt rate
+    assert calculate_cost("gpt-4", 1000, 0, cached_tokens=1000) == calculate_cost("gpt-4", 1000, 0)
+
+
+def test_get_completion_records_cached_tokens():
+    mock_client = MagicMock()
+    response = MagicMock()
+    response.choices[0].message.content = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage.prompt_tokens = 1000
+    response.usage.completion_tokens = 0
+    response.usage.total_tokens = 1000
+    response.usage.prompt_tokens_details.cached_tokens = 1000
+    mock_client.chat.completions.create.return_value = response
+
+    _, metrics = get_completion("prompt", "consulta", OpenAIModels.GPT_5_mini, mock_client)
+
+    assert metrics.cached_prompt_tokens == 1000
+    sent = mock_client.chat.completions.create.call_args.kwargs["messages"]
+    assert sent[0]["role"] == "system"
@@ -0,0 +1,110 @@
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.rate_limiter import (
+    Priority,
+    QueueTimeoutError,
+    RateLimitScheduler,
+    TokenBucket,
+)
+from src.multitasking_text_utility.resilience import ResiliencePolicy
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+
+def test_token_bucket_refills_and_allows_oversized_requests_when_full():
+    bucket = TokenBucket(capacity=100, per_second=10, now=0.0)
+
+    assert bucket.wait_time(150, now=0.0) == 0.0  # más grande que el balde: entra con el balde lleno
+    bucket.take(150, now=0.0)
+    assert bucket.level == -50
+    assert bucket.wait_time(10, now=0.0) == pytest.approx(6.0)
+    assert bucket.wait_time(10, now=6.0) == 0.0
+
+
+def test_higher_priority_and_round_robin_tenants_are_served_first():
+    # 6000 TPM = 100 tokens/s: cada pedido de 5 tokens espera ~50 ms
+    scheduler = RateLimitScheduler(rpm=10_000, tpm=6000)
+    scheduler.acquire(6000)  # vacía el balde de tokens
+    order = []
+
+    def request(name, priority, tenant):
+        scheduler.acquire(5, priority, tenant)
+        order.append(name)
+
+    threads = []
+    for name, priority, tenant in [("bulk-1", Priority.BULK, "replay"),
+                                   ("a-1", Priority.LIVE, "agente-a"), ("a-2", Priority.LIVE, "agente-a"),
+                                   ("a-3", Priority.LIVE, "agente-a"), ("b-1", Priority.LIVE, "agente-b")]:
+        thread = threading.Thread(target=request, args=(name, priority, tenant))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    assert order == ["a-1", "b-1", "a-2", "a-3", "bulk-1"]
+    assert scheduler.stats.granted == {"live": 5, "bulk": 1}
+    assert scheduler.queued() == 0
+
+
+def test_settle_corrects_the_estimate_and_max_wait_times_out():
+    now = [0.0]
+    scheduler = RateLimitScheduler(rpm=60, tpm=1000, clock=lambda: now[0])
+
+    reservation = scheduler.acquire(900)
+    reservation.settle(300)  # se devuelven 600 tokens
+    assert scheduler.acquire(700).wait_seconds == 0.0
+
+    with pytest.raises(QueueTimeoutError):
+        scheduler.acquire(500, Priority.BULK, max_wait=0)
+    assert scheduler.stats.timeouts == 1
+    assert scheduler.stats.tokens_corrected == -600
+
+
+def test_get_completion_reports_queue_wait_and_settles_with_actual_usage():
+    response = MagicMock()
+    response.choices = [MagicMock(finish_reason="stop")]
+    response.choices[0].message.content = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage = SimpleNamespace(prompt_tokens=100, completion_tokens=50, total_tokens=150)
+    client = MagicMock()
+    client.chat.completions.create.return_value = response
+    scheduler = RateLimitScheduler(rpm=600, tpm=100_000)
+
+    respuesta, metrics = get_completion("system", "Horario de corte", OpenAIModels.GPT_4o_mini, client,
+                                        scheduler=scheduler, priority=Priority.INTERACTIVE)
+
+    assert respuesta["respuesta"] == "ok"
+    assert metrics.priority == "interactive"
+    assert metrics.queue_wait_seconds == 0.0
+    # Se reservó la estimación previa (prompt + 1000 de completion) y se corrigió a los 150 reales
+    assert scheduler.stats.tokens_corrected == 150 - (metrics.estimated_prompt_tokens + 1000)
+
+
+def test_every_resilient_attempt_is_charged_to_the_rate_limiter():
+    response = MagicMock()
+    response.choices = [MagicMock(finish_reason="stop")]
+    response.choices[0].message.content = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage = SimpleNamespace(prompt_tokens=100, completion_tokens=50, total_tokens=150)
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [TimeoutError("attempt timed out"), response]
+    scheduler = RateLimitScheduler(rpm=600, tpm=100_000)
+
+    respuesta, metrics = get_completion("system", "Horario de corte", OpenAIModels.GPT_4o_mini, client,
+                                        resilience=ResiliencePolicy(max_retries=1), scheduler=scheduler)
+
+    assert respuesta["respuesta"] == "ok"
+    assert metrics.retries == 1
+    # Un request por intento: el que venció también consumió RPM (y su estimación de tokens)
+    assert scheduler.stats.granted == {"live": 2}
+    assert scheduler.stats.tokens_corrected == 150 - (metrics.estimated_prompt_tokens + 1000)
@@ -0,0 +1,140 @@
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from src.multitasking_text_utility import run_query
+from src.multitasking_text_utility.resilience import (LatencyTracker, ResilienceError, ResiliencePolicy,
+                                                      call_with_resilience)
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+
+class RateLimited(Exception):
+    status_code = 429
+    # Retry-After: 0 evita esperar el backoff en los tests
+    response = SimpleNamespace(headers={"retry-after": "0"})
+
+
+def test_retries_rate_limits_and_records_every_attempt():
+    calls = []
+
+    def call(model, timeout):
+        calls.append(model)
+        if len(calls) < 3:
+            raise RateLimited("429")
+        return "ok"
+
+    result, attempts = call_with_resilience(call, "gpt-5-mini", ResiliencePolicy(max_retries=3))
+
+    assert result == "ok"
+    assert [(a.kind, a.outcome) for a in attempts] == [("primary", "error"), ("retry", "error"), ("retry", "ok")]
+
+
+def test_hedged_request_wins_and_slow_attempt_is_cancelled():
+    calls = []
+
+    def call(model, timeout):
+        calls.append(model)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    policy = ResiliencePolicy(hedge=True, hedge_delay_seconds=0.05, attempt_timeout_seconds=5)
+    result, attempts = call_with_resilience(call, "gpt-5-mini", policy)
+
+    assert result == "fast"
+    assert [(a.kind, a.outcome) for a in attempts] == [("primary", "cancelled"), ("hedge", "ok")]
+
+
+def test_falls_back_to_faster_model_after_a_timeout():
+    def call(model, timeout):
+        if model == "gpt-5-mini":
+            time.sleep(timeout + 0.2)
+            return "too late"
+        return "from fallback"
+
+    policy = ResiliencePolicy(deadline_seconds=5, attempt_timeout_seconds=0.1, fallback_model="gpt-4o-mini")
+    result, attempts = call_with_resilience(call, "gpt-5-mini", policy, LatencyTracker(priors={}))
+
+    assert result == "from fallback"
+    assert [(a.model, a.kind, a.outcome) for a in attempts] == [
+        ("gpt-5-mini", "primary", "timeout"), ("gpt-4o-mini", "fallback", "ok")]
+
+
+def test_non_retryable_error_is_raised_with_attempts():
+    def call(model, timeout):
+        raise ValueError("invalid JSON")
+
+    with pytest.raises(ResilienceError) as error:
+        call_with_resilience(call, "gpt-5-mini", ResiliencePolicy())
+
+    assert len(error.value.attempts) == 1
+
+
+def test_get_completion_stores_attempts_in_metrics():
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage = SimpleNamespace(prompt_tokens=10, completion_tokens=20, total_tokens=30)
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [RateLimited("429"), response]
+
+    policy = ResiliencePolicy(fallback_model=OpenAIModels.GPT_4o_mini)
+    respuesta, metrics = get_completion("system", "consulta", OpenAIModels.GPT_5_mini, client, resilience=policy)
+
+    assert respuesta["respuesta"] == "ok"
+    assert metrics.retries == 1
+    assert metrics.hedged is False
+    assert [a["outcome"] for a in metrics.attempts] == ["error", "ok"]
+
+
+def test_hedge_loser_cost_is_added_to_metrics():
+    response = MagicMock()
+    response.choices = [MagicMock(finish_reason="stop")]
+    response.choices[0].message.content = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100, total_tokens=1100)
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            time.sleep(0.3)  # el primero pierde pero igual termina (y se cobra)
+        return response
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    policy = ResiliencePolicy(hedge=True, hedge_delay_seconds=0.05, attempt_timeout_seconds=5)
+
+    respuesta, metrics = get_completion("system", "consulta", OpenAIModels.GPT_5_mini, client, resilience=policy)
+
+    single_cost = run_query.calculate_cost("gpt-5-mini", 1000, 100)
+    assert metrics.hedged is True
+    assert metrics.hedge_overhead_tokens == 1100
+    assert metrics.hedge_overhead_cost_usd == round(single_cost, 6)
+    assert metrics.total_tokens == 2200
+    assert metrics.estimated_cost_usd == round(2 * single_cost, 4)
+
+
+@patch.object(run_query, "load_semantic_cache")
+@patch.object(run_query, "ResponseCache")
+@patch.object(run_query, "create_client")
+@patch.object(run_query, "get_completion", return_value="An error occurred: RateLimited: 429")
+@patch("builtins.input", return_value="1")
+def test_main_reports_failed_completion_instead_of_crashing(_input, _completion, _openai, _cache, _semantic,
+                                                             monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(run_query, "METRICS_LOG_FOLDER", tmp_path)
+
+    run_query.main([])
+
+    assert "No se pudo obtener una respuesta" in capsys.readouterr().out
+    run_query.get_sink(tmp_path / run_query.METRICS_LOG_FILE).close()
+    assert "RateLimited" in (tmp_path / run_query.METRICS_LOG_FILE).read_text(encoding="utf-8")
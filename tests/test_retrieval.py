@@ -0,0 +1,67 @@
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from src.multitasking_text_utility.bank_kb import BANK_KB
+from src.multitasking_text_utility.retrieval import BM25Index, load_or_build_index, parse_sections
+
+
+def test_parses_all_numbered_sections():
+    preamble, sections = parse_sections(BANK_KB)
+
+    assert preamble == "BASE DE CONOCIMIENTO"
+    assert [s.id for s in sections] == [str(i) for i in range(1, 21)]
+    assert sections[9].title == "Cuenta Corriente"
+    assert sections[19].title == "Seguros"
+
+
+def test_retrieves_relevant_section_and_saves_tokens():
+    index = BM25Index.build(BANK_KB)
+
+    result = index.retrieve("Cuál es la comisión de Cuenta Corriente ?")
+
+    assert not result.fallback
+    assert "10" in result.section_ids
+    assert "Comisión de cuenta corriente: $8.000." in result.kb_text
+    assert "Seguros" not in result.kb_text
+    assert result.tokens_saved > 0
+
+
+def test_falls_back_to_full_kb_when_confidence_is_low():
+    index = BM25Index.build(BANK_KB)
+
+    result = index.retrieve("Que medicina debo tomar para un dolor de cabeza liviano ?")
+
+    assert result.fallback
+    assert result.kb_text == BANK_KB
+    assert result.tokens_saved == 0
+
+
+def test_full_kb_mode_sends_the_same_prompt_for_every_query():
+    index = BM25Index.build(BANK_KB)
+
+    comision = index.retrieve("Cuál es la comisión de Cuenta Corriente ?", full_kb=True)
+    seguros = index.retrieve("Que seguros ofrecen ?", full_kb=True)
+
+    assert comision.kb_text == seguros.kb_text == BANK_KB
+    assert comision.tokens_saved == 0 and not comision.fallback
+    # El ranking sigue eligiendo la sección principal (clave del cache semántico)
+    assert comision.top_section_id == "10"
+    assert seguros.top_section_id == "20"
+
+
+def test_index_is_persisted_and_rebuilt_when_kb_changes(tmp_path):
+    index_path = tmp_path / "index.json"
+
+    load_or_build_index(BANK_KB, index_path)
+    assert index_path.exists()
+    assert BM25Index.load(index_path, BANK_KB) is not None
+
+    changed_kb = BANK_KB.replace("$8.000", "$9.000")
+    assert BM25Index.load(index_path, changed_kb) is None
+    rebuilt = load_or_build_index(changed_kb, index_path)
+    assert "$9.000" in rebuilt.retrieve("comisión cuenta corriente").kb_text
@@ -0,0 +1,107 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility import router as router_module
+from src.multitasking_text_utility.bank_kb import BANK_KB
+from src.multitasking_text_utility.query_classifier import QueryClass, classify_query
+from src.multitasking_text_utility.retrieval import BM25Index
+from src.multitasking_text_utility.router import ModelRouter
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+
+
+@pytest.fixture(scope="module")
+def kb_index():
+    return BM25Index.build(BANK_KB)
+
+
+def make_metrics(model, prompt_tokens=1000, completion_tokens=100, latency=1.0):
+    return router_module.Metrics(model=model, temperature=0.0, prompt_tokens=prompt_tokens,
+                                 completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens,
+                                 estimated_cost_usd=0.0, latency_seconds=latency, timestamp="2026-02-16T17:07:23")
+
+
+def answer(confianza):
+    return {"respuesta": "ok", "indicador_de_confianza": confianza, "acciones_recomendadas": []}
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Cuál es la comisión de Cuenta Corriente ?", QueryClass.DIRECT_LOOKUP),
+    ("Que productos de inversion tiene para ofrecer ?", QueryClass.INFERENTIAL),
+    ("Que tarjetas tienen ?", QueryClass.LISTING),
+    ("Que medicina debo tomar para un dolor de cabeza liviano ?", QueryClass.OUT_OF_DOMAIN),
+])
+def test_classifier(kb_index, query, expected):
+    assert classify_query(query, kb_index).query_class == expected
+
+
+def test_confident_cheap_answer_is_not_escalated(kb_index):
+    calls = []
+
+    def complete(model):
+        calls.append(model)
+        return answer(0.95), make_metrics(model)
+
+    _, metrics = ModelRouter(kb_index).route("Cuál es la comisión de Cuenta Corriente ?", complete)
+
+    assert calls == [OpenAIModels.GPT_4o_mini]
+    assert metrics.routing_decision == "cheap"
+    assert metrics.escalated is False
+
+
+def test_invalid_json_escalates_and_sums_both_costs(kb_index):
+    def complete(model):
+        if model == OpenAIModels.GPT_4o_mini:
+            raise router_module.InvalidCompletionError("JSONDecodeError", make_metrics(model))
+        return answer(0.9), make_metrics(model, completion_tokens=2000)
+
+    _, metrics = ModelRouter(kb_index).route("Horario de corte de transferencias", complete)
+
+    assert metrics.routing_decision == "escalated:invalid_json"
+    assert metrics.model == OpenAIModels.GPT_5_mini
+    assert [a["model"] for a in metrics.route_attempts] == ["gpt-4o-mini", "gpt-5-mini"]
+    # gpt-4o-mini: (1000*0.15 + 100*0.6)/1M ; gpt-5-mini: (1000*0.25 + 2000*2)/1M
+    assert metrics.estimated_cost_usd == pytest.approx(round(0.00021 + 0.00425, 4))
+    assert metrics.completion_tokens == 2100
+
+
+def test_inferential_query_goes_straight_to_strong_model(kb_index):
+    calls = []
+
+    def complete(model):
+        calls.append(model)
+        return answer(0.9), make_metrics(model)
+
+    _, metrics = ModelRouter(kb_index).route("Que productos de inversion tiene para ofrecer ?", complete)
+
+    assert calls == [OpenAIModels.GPT_5_mini]
+    assert metrics.routing_decision == "direct:inferential"
+
+
+def test_get_completion_escalates_low_confidence(kb_index):
+    def create(model, messages):
+        confianza = 0.3 if model == OpenAIModels.GPT_4o_mini else 0.9
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = (
+            f'{{"respuesta": "ok", "confianza": {confianza}, "acciones_recomendadas": []}}')
+        response.usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100, total_tokens=1100)
+        return response
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+
+    respuesta, metrics = get_completion("system", "Horario de corte", OpenAIModels.GPT_5_mini, client,
+                                        router=ModelRouter(kb_index))
+
+    assert respuesta["indicador_de_confianza"] == 0.9
+    assert metrics.routing_decision == "escalated:low_confidence"
+    assert [a["outcome"] for a in metrics.route_attempts] == ["low_confidence", "ok"]
@@ -14,7 +14,7 @@ from src.multitasking_text_utility import run_query
 from src.multitasking_text_utility.run_query import get_completion, OpenAIModels
 
 @patch.object(run_query, "calculate_cost", return_value=0.005)
-@patch.object(run_query, "OpenAI")
+@patch.object(run_query, "create_client")
 def test_returns_valid_response(mock_openai, mock_calculate_cost):
     mock_client = MagicMock()
 
@@ -49,7 +49,7 @@ def test_returns_valid_response(mock_openai, mock_calculate_cost):
     assert metrics.estimated_cost_usd == 0.005
 
 
-@patch.object(run_query, "OpenAI")
+@patch.object(run_query, "create_client")
 def test_handles_api_exception(mock_openai):
     mock_client = MagicMock()
     mock_client.chat.completions.create.side_effect = Exception("API Error")
@@ -63,3 +63,10 @@ def test_handles_api_exception(mock_openai):
 
     assert response == "An error occurred: API Error"
 
+
+
+@patch("openai.OpenAI")
+def test_client_leaves_retries_to_the_resilience_layer(mock_openai):
+    run_query.create_client()
+
+    assert mock_openai.call_args.kwargs["max_retries"] == 0
@@ -0,0 +1,157 @@
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import numpy as np
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.bank_kb import BANK_KB
+from src.multitasking_text_utility.retrieval import BM25Index
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+from src.multitasking_text_utility.semantic_cache import SemanticCache
+
+ANSWER = {"respuesta": "$8.000", "indicador_de_confianza": 0.9, "acciones_recomendadas": []}
+
+
+def test_paraphrase_hits_and_unrelated_query_misses():
+    cache = SemanticCache()
+    cache.add("gpt-5-mini", "comisión cuenta corriente?", ANSWER)
+
+    match = cache.lookup("gpt-5-mini", "¿cuánto cuesta la cuenta corriente por mes?")
+
+    assert match is not None
+    assert match.response == ANSWER
+    assert match.cached_query == "comisión cuenta corriente?"
+    assert cache.lookup("gpt-5-mini", "plazo mínimo del plazo fijo") is None
+    assert cache.lookup("gpt-4o-mini", "comisión cuenta corriente?") is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 2
+
+
+def test_sibling_products_are_not_served_each_others_answers():
+    kb_index = BM25Index.build(BANK_KB)
+    cache = SemanticCache()
+    pairs = [("monto maximo de transferencias nacionales", "monto maximo de transferencias internacionales"),
+             ("reposicion de tarjeta de debito", "reposicion de tarjeta de credito")]
+    for cached, asked in pairs:
+        cache.add("gpt-5-mini", cached, ANSWER, kb_index.retrieve(cached).top_section_id)
+
+        # Sin la sección, los n-gramas los confunden (0.86-0.90)
+        assert cache.embed(cached) @ cache.embed(asked) >= cache.threshold
+        assert kb_index.retrieve(asked).top_section_id != kb_index.retrieve(cached).top_section_id
+        assert cache.lookup("gpt-5-mini", asked, kb_index.retrieve(asked).top_section_id) is None
+        assert cache.lookup("gpt-5-mini", cached, kb_index.retrieve(cached).top_section_id) is not None
+
+
+def test_headline_paraphrase_hits_at_the_default_threshold():
+    kb_index = BM25Index.build(BANK_KB)
+    cache = SemanticCache()
+    cached, asked = "comision cuenta corriente?", "¿cuanto cuesta la cuenta corriente por mes?"
+    cache.add("gpt-5-mini", cached, ANSWER, kb_index.retrieve(cached).top_section_id)
+
+    match = cache.lookup("gpt-5-mini", asked, kb_index.retrieve(asked).top_section_id)
+
+    assert match is not None
+    assert match.similarity >= cache.threshold
+    assert match.cached_query == cached
+
+
+def test_different_questions_about_the_same_product_miss():
+    cache = SemanticCache()
+    pairs = [("comision cuenta corriente", "tasa de la cuenta corriente"),
+             ("plazo minimo del plazo fijo", "tasa del plazo fijo"),
+             ("tasa de prestamos personales", "monto maximo del prestamo personal"),
+             ("comision de transferencias", "cuando sale la transferencia")]
+    for cached, asked in pairs:
+        assert cache.embed(cached) @ cache.embed(asked) < cache.threshold
+
+
+def test_search_reports_the_similarity_of_a_miss():
+    cache = SemanticCache()
+    cache.add("gpt-5-mini", "tasa de prestamos personales", ANSWER, top_section="5")
+
+    match = cache.search("gpt-5-mini", "monto maximo del prestamo personal", top_section="5")
+
+    assert match is not None and match.hit is False
+    assert 0.6 < match.similarity < cache.threshold
+    assert cache.search("gpt-5-mini", "monto maximo del prestamo personal", top_section="10") is None
+
+
+def test_least_recently_used_entry_is_evicted_when_full():
+    cache = SemanticCache(max_entries=2)
+    cache.add("gpt-5-mini", "horario de corte", ANSWER)
+    cache.add("gpt-5-mini", "limite de extraccion en cajeros", ANSWER)
+    cache.lookup("gpt-5-mini", "horario de corte")
+
+    cache.add("gpt-5-mini", "tasa de prestamos personales", ANSWER)
+
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+    assert cache.lookup("gpt-5-mini", "horario de corte") is not None
+    assert cache.lookup("gpt-5-mini", "limite de extraccion en cajeros") is None
+
+
+def test_lookup_over_many_entries_is_vectorized():
+    cache = SemanticCache(max_entries=30_000)
+    rng = np.random.default_rng(0)
+    vectors = rng.random((30_000, cache._vectors.shape[1]), dtype=np.float32)
+    cache._grow(30_000)
+    cache._vectors[:] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    cache._namespace_ids[:] = cache._namespace_id("gpt-5-mini")
+    cache._queries = ["q"] * 30_000
+    cache._responses = [ANSWER] * 30_000
+    cache._size = 30_000
+
+    start = time.perf_counter()
+    cache.lookup("gpt-5-mini", "comisión cuenta corriente")
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.25
+
+
+def test_save_and_load_round_trip(tmp_path):
+    cache = SemanticCache(version="v1")
+    cache.add("gpt-5-mini", "horario de corte", ANSWER)
+    cache.save(tmp_path / "semantic")
+
+    assert SemanticCache.load(tmp_path / "semantic", version="v1").lookup("gpt-5-mini", "horario de corte")
+    assert len(SemanticCache.load(tmp_path / "semantic", version="v2")) == 0
+
+
+def test_save_if_due_only_writes_changed_caches_after_the_interval(tmp_path):
+    cache = SemanticCache(version="v1")
+    assert cache.save_if_due(tmp_path / "semantic", interval_seconds=0) is False
+
+    cache.add("gpt-5-mini", "horario de corte", ANSWER)
+    assert cache.save_if_due(tmp_path / "semantic", interval_seconds=3600) is False
+    assert cache.save_if_due(tmp_path / "semantic", interval_seconds=0) is True
+    assert not cache.dirty
+    assert cache.save_if_due(tmp_path / "semantic", interval_seconds=0) is False
+    assert len(SemanticCache.load(tmp_path / "semantic", version="v1")) == 1
+
+
+def test_get_completion_serves_paraphrase_from_semantic_cache():
+    cache = SemanticCache()
+    mock_client = MagicMock()
+    response = MagicMock()
+    response.choices[0].message.content = '{"respuesta": "$8.000", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage.prompt_tokens = 10
+    response.usage.completion_tokens = 20
+    response.usage.total_tokens = 30
+    mock_client.chat.completions.create.return_value = response
+    model = OpenAIModels.GPT_5_mini
+
+    get_completion("prompt", "comisión cuenta corriente?", model, mock_client, semantic_cache=cache)
+    answer, metrics = get_completion("prompt", "¿cuánto cuesta la cuenta corriente por mes?", model, mock_client,
+                                     semantic_cache=cache)
+
+    assert mock_client.chat.completions.create.call_count == 1
+    assert answer == ANSWER
+    assert metrics.cache_hit is True
+    assert metrics.semantic_similarity >= cache.threshold
+    assert metrics.estimated_cost_usd == 0.0
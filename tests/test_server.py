@@ -0,0 +1,161 @@
+import http.client
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from openai import OpenAI
+
+from src.multitasking_text_utility.fake_openai import FakeOpenAIServer
+from src.multitasking_text_utility.run_query import OpenAIModels
+from src.multitasking_text_utility import server
+from src.multitasking_text_utility.server import AssistantHTTPServer, AssistantService
+
+
+@pytest.fixture
+def fake_openai():
+    with FakeOpenAIServer() as server:
+        yield server
+
+
+def start_server(fake_openai, max_concurrency=4):
+    client = OpenAI(api_key="test", base_url=fake_openai.base_url, max_retries=0)
+    # Sin el índice de hechos: estas consultas se resolverían sin llamar a la API
+    service = AssistantService(client, OpenAIModels.GPT_4o_mini, fast_path=False)
+    httpd = AssistantHTTPServer(("127.0.0.1", 0), service, max_concurrency)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+def post_query(base_url, body):
+    request = urllib.request.Request(f"{base_url}/query", data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status, json.loads(response.read())
+
+
+def test_query_returns_main_json_shape(fake_openai):
+    httpd, base_url = start_server(fake_openai)
+    try:
+        status, payload = post_query(base_url, {"consulta": "1"})
+    finally:
+        httpd.graceful_shutdown()
+
+    assert status == 200
+    assert payload["consulta"] == "Cuál es la comisión de Cuenta Corriente ?"
+    assert payload["respuesta"]["respuesta"] == "Comisión de cuenta corriente: $8.000."
+    assert payload["respuesta"]["indicador_de_confianza"] == 0.95
+    assert payload["metrics"]["model"] == "gpt-4o-mini"
+    assert "10" in payload["metrics"]["retrieved_sections"]
+    # El system prompt va primero y solo con las secciones recuperadas
+    sent = fake_openai.requests[0]["messages"]
+    assert sent[0]["role"] == "system" and "Seguros" not in sent[0]["content"]
+
+
+def test_invalid_body_is_rejected(fake_openai):
+    httpd, base_url = start_server(fake_openai)
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post_query(base_url, {"pregunta": "hola"})
+    finally:
+        httpd.graceful_shutdown()
+
+    assert error.value.code == 400
+    assert fake_openai.requests == []
+
+
+@pytest.mark.parametrize("body", [[], "consulta", 1, None])
+def test_json_bodies_that_are_not_objects_get_400(fake_openai, body):
+    httpd, base_url = start_server(fake_openai)
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post_query(base_url, body)
+        # El servidor sigue atendiendo después del cuerpo inválido
+        status, _ = post_query(base_url, {"consulta": "1"})
+    finally:
+        httpd.graceful_shutdown()
+
+    assert error.value.code == 400
+    assert status == 200
+
+
+@pytest.mark.parametrize("content_length", ["abc", "-1"])
+def test_malformed_content_length_and_blank_queries_get_400(fake_openai, content_length):
+    httpd, base_url = start_server(fake_openai)
+    try:
+        with pytest.raises(urllib.error.HTTPError) as blank:
+            post_query(base_url, {"consulta": "   "})
+        conn = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1], timeout=5)
+        conn.putrequest("POST", "/query")
+        conn.putheader("Content-Length", content_length)
+        conn.endheaders()
+        status = conn.getresponse().status
+        conn.close()
+    finally:
+        httpd.graceful_shutdown()
+
+    assert blank.value.code == 400
+    assert status == 400
+    assert fake_openai.requests == []
+
+
+def test_answered_and_failed_queries_are_written_to_the_metrics_log(fake_openai, tmp_path):
+    log = tmp_path / "server.jsonl"
+    client = OpenAI(api_key="test", base_url=fake_openai.base_url, max_retries=0)
+    service = AssistantService(client, OpenAIModels.GPT_4o_mini, fast_path=False, metrics_log=log)
+    service.answer("1")
+    service.client = OpenAI(api_key="test", base_url="http://127.0.0.1:9/v1", max_retries=0)
+    with pytest.raises(RuntimeError):
+        service.answer("Horario de corte")
+    service.metrics_sink.close()
+
+    records = [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+    assert [r["consulta"] for r in records] == ["Cuál es la comisión de Cuenta Corriente ?", "Horario de corte"]
+    assert records[0]["metrics"]["model"] == "gpt-4o-mini"
+    assert records[1]["metrics"] is None and "error" in records[1]
+
+
+def test_requests_over_the_concurrency_limit_get_503(fake_openai):
+    fake_openai.latency_seconds = 0.5
+    httpd, base_url = start_server(fake_openai, max_concurrency=1)
+    results = []
+
+    def slow_query():
+        results.append(post_query(base_url, {"consulta": "horario de corte"})[0])
+
+    worker = threading.Thread(target=slow_query)
+    try:
+        worker.start()
+        while not fake_openai.requests:
+            time.sleep(0.01)
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post_query(base_url, {"consulta": "horario de corte"})
+        worker.join()
+    finally:
+        httpd.graceful_shutdown()
+
+    assert error.value.code == 503
+    assert error.value.headers["Retry-After"] == "1"
+    assert results == [200]
+
+
+def test_memoized_prompts_are_bounded(fake_openai, monkeypatch):
+    monkeypatch.setattr(server, "MAX_MEMOIZED_PROMPTS", 2)
+    client = OpenAI(api_key="test", base_url=fake_openai.base_url, max_retries=0)
+    service = AssistantService(client, OpenAIModels.GPT_4o_mini, fast_path=False)
+    full = service.full_system_prompt
+
+    for section_ids in [("1",), ("2",), ("3",)]:
+        service._system_prompt_for("kb", section_ids)
+
+    assert list(service._prompts) == [(0, ("2",)), (0, ("3",))]
+    assert service.full_system_prompt == full
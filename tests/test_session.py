@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from src.multitasking_text_utility import run_query
+from src.multitasking_text_utility.metrics import SessionStats
+
+
+def make_metrics(latency):
+    return run_query.Metrics(model="gpt-4o-mini", temperature=0.0, prompt_tokens=100, completion_tokens=10,
+                             total_tokens=110, estimated_cost_usd=0.001, latency_seconds=latency,
+                             timestamp="2026-02-16T17:07:23")
+
+
+def test_session_stats_percentiles():
+    stats = SessionStats(latencies=[1.0, 2.0, 3.0, 4.0, 20.0])
+
+    assert stats.queries == 5
+    assert stats.percentile(50) == 3.0
+    assert stats.percentile(95) == 20.0
+    assert SessionStats().percentile(95) == 0.0
+
+
+@patch.object(run_query, "load_semantic_cache")
+@patch.object(run_query, "ResponseCache")
+@patch.object(run_query, "create_client")
+@patch("builtins.input", side_effect=["1", "", "Horario de corte", "salir"])
+def test_session_initializes_once_and_answers_queries_in_a_loop(_input, create_client, _cache, _semantic,
+                                                                monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(run_query, "METRICS_LOG_FOLDER", tmp_path)
+    answers = iter([make_metrics(2.0), make_metrics(4.0)])
+    prompts = []
+
+    def fake_get_completion(system_prompt, user_prompt, *args, **kwargs):
+        prompts.append(user_prompt)
+        return {"respuesta": "ok", "indicador_de_confianza": 0.9, "acciones_recomendadas": []}, next(answers)
+
+    monkeypatch.setattr(run_query, "get_completion", fake_get_completion)
+
+    run_query.main(["--session"])
+
+    assert create_client.call_count == 1
+    assert prompts == [run_query.SAMPLE_QUERIES["1"], "Horario de corte"]
+    out = capsys.readouterr().out
+    assert "Session queries:    2 (0 errors)" in out
+    assert "p50 2.00s, p95 4.00s" in out
+    # El cache semántico no se reescribe en cada consulta: se guarda si corresponde y al cerrar la sesión
+    assert _semantic.return_value.save_if_due.call_count == 2
+    assert _semantic.return_value.save.call_count == 1
+    run_query.get_sink(tmp_path / run_query.METRICS_LOG_FILE).close()
+
+
+@patch.object(run_query, "create_client")
+@patch("builtins.input", side_effect=["Horario de corte", "Horario de corte", "salir"])
+def test_stream_errors_are_recorded_without_ending_the_session(_input, create_client, monkeypatch, tmp_path,
+                                                               capsys):
+    monkeypatch.setattr(run_query, "METRICS_LOG_FOLDER", tmp_path)
+    create = create_client.return_value.chat.completions.create
+    truncated = SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content='{"respuesta": "cor'))])
+    create.side_effect = [RuntimeError("stream reset"), iter([truncated])]
+
+    run_query.main(["--session", "--stream"])
+
+    assert capsys.readouterr().out.count("No se pudo obtener una respuesta del modelo") == 2
+    run_query.get_sink(tmp_path / run_query.METRICS_LOG_FILE).close()
+    records = (tmp_path / run_query.METRICS_LOG_FILE).read_text(encoding="utf-8").splitlines()
+    assert len(records) == 2 and all('"error"' in line for line in records)
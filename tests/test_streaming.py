@@ -0,0 +1,90 @@
+import json
+import sys
+from pathlib import Path
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.run_query import OpenAIModels
+from src.multitasking_text_utility.streaming import RespuestaStreamParser, stream_completion
+
+CONTENT = '{"respuesta": "Comisi\\u00f3n: \\"$8.000\\"\\nmensual", "confianza": 0.9, "acciones_recomendadas": ["A"]}'
+
+
+def make_chunks(content, size):
+    chunks = []
+    for i in range(0, len(content), size):
+        chunk = MagicMock()
+        chunk.usage = None
+        chunk.choices = [MagicMock()]
+        chunk.choices[0].delta.content = content[i:i + size]
+        chunks.append(chunk)
+    final = MagicMock()
+    final.choices = []
+    final.usage.prompt_tokens = 100
+    final.usage.completion_tokens = 50
+    final.usage.total_tokens = 150
+    chunks.append(final)
+    return chunks
+
+
+def test_parser_decodes_respuesta_across_arbitrary_chunk_boundaries():
+    for size in (1, 2, 3, 7, len(CONTENT)):
+        parser = RespuestaStreamParser()
+        pieces = [parser.feed(CONTENT[i:i + size]) for i in range(0, len(CONTENT), size)]
+
+        assert "".join(pieces) == 'Comisión: "$8.000"\nmensual'
+        assert parser.done
+
+
+def test_parser_combines_surrogate_pairs_split_across_chunks():
+    content = json.dumps({"respuesta": "Listo \U0001F44D gracias", "confianza": 0.9})
+    assert "\\ud83d\\udc4d" in content
+
+    for size in range(1, len(content) + 1):
+        parser = RespuestaStreamParser()
+        text = "".join(parser.feed(content[i:i + size]) for i in range(0, len(content), size))
+
+        assert text == "Listo \U0001F44D gracias"
+        assert text.encode("utf-8")  # sin surrogates sueltos
+
+
+def test_parser_emits_text_before_the_json_is_complete():
+    parser = RespuestaStreamParser()
+
+    assert parser.feed('{"respu') == ""
+    assert parser.feed('esta" : "La comi') == "La comi"
+    assert parser.feed('sión') == "sión"
+    assert not parser.done
+
+
+def test_stream_completion_yields_deltas_and_final_metrics():
+    mock_client = MagicMock()
+    mock_client.chat.completions.create.return_value = iter(make_chunks(CONTENT, 5))
+
+    stream = stream_completion("prompt", "consulta", OpenAIModels.GPT_5_mini, mock_client)
+    text = "".join(stream)
+
+    assert text == 'Comisión: "$8.000"\nmensual'
+    assert stream.result["indicador_de_confianza"] == 0.9
+    assert stream.result["acciones_recomendadas"] == ["A"]
+    assert stream.metrics.total_tokens == 150
+    assert stream.metrics.time_to_first_token_seconds is not None
+    assert stream.metrics.time_to_first_token_seconds <= stream.metrics.latency_seconds + 0.01
+    assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+
+
+def test_stream_without_usage_chunk_still_reports_estimated_metrics():
+    mock_client = MagicMock()
+    mock_client.chat.completions.create.return_value = iter(make_chunks(CONTENT, 5)[:-1])
+
+    stream = stream_completion("prompt", "consulta", OpenAIModels.GPT_5_mini, mock_client)
+    "".join(stream)
+
+    assert stream.metrics.usage_estimated is True
+    assert stream.metrics.prompt_tokens > 0 and stream.metrics.completion_tokens > 0
+    assert stream.metrics.time_to_first_token_seconds is not None
@@ -0,0 +1,67 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility.run_query import OpenAIModels, get_completion
+from src.multitasking_text_utility.structured_output import RESPONSE_FORMAT, parse_response
+
+
+def make_client(*contents):
+    def response(content):
+        r = MagicMock()
+        r.choices = [MagicMock()]
+        r.choices[0].message.content = content
+        r.usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100, total_tokens=1100)
+        return r
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [response(c) for c in contents]
+    return client
+
+
+@pytest.mark.parametrize("content, repairs", [
+    ('{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": ["a"]}', []),
+    ('```json\n{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": ["a"]}\n```', ["code_fence"]),
+    ('Respuesta:\n{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": ["a"]} Saludos.',
+     ["surrounding_text"]),
+    ('{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": ["a",],}', ["trailing_comma"]),
+    ('{"respuesta": "ok", "confianza": "0,9", "acciones_recomendadas": ["a"]}', ["confianza_coerced"]),
+])
+def test_recoverable_outputs_are_repaired(content, repairs):
+    response, applied = parse_response(content)
+
+    assert response.respuesta == "ok"
+    assert response.confianza == 0.9
+    assert response.acciones_recomendadas == ["a"]
+    assert applied == repairs
+
+
+@pytest.mark.parametrize("content", [
+    '{"respuesta": "ok", "acciones_recomendadas": []}',
+    '{"respuesta": "ok", "confianza": "alta", "acciones_recomendadas": []}',
+    'No encontré la información.',
+])
+def test_unrecoverable_outputs_raise_value_error(content):
+    with pytest.raises(ValueError):
+        parse_response(content)
+
+
+def test_structured_output_sends_schema_and_counts_repairs():
+    client = make_client('```json\n{"respuesta": "ok", "confianza": 0.8, "acciones_recomendadas": []}\n```')
+
+    respuesta, metrics = get_completion("system", "Horario de corte", OpenAIModels.GPT_5_mini, client,
+                                        structured_output=True)
+
+    assert client.chat.completions.create.call_args.kwargs["response_format"] == RESPONSE_FORMAT
+    assert RESPONSE_FORMAT["json_schema"]["schema"]["required"] == ["respuesta", "confianza", "acciones_recomendadas"]
+    assert respuesta["indicador_de_confianza"] == 0.8
+    assert metrics.json_repairs == ["code_fence"]
+    assert metrics.validation_failures == 0
@@ -0,0 +1,117 @@
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Ensure project root and src package are on sys.path so imports inside src work
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'src' / 'multitasking_text_utility'))
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.multitasking_text_utility import run_query
+from src.multitasking_text_utility.resilience import ResiliencePolicy
+# Mismo módulo que importan run_query, metrics y logger (el estado del tracer es global)
+import tracing
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    yield path
+    tracing.disable_tracing()
+    tracing.get_sink(path).close()
+
+
+def read_spans(path):
+    tracing.get_sink(path).flush()
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_spans_are_noops_while_tracing_is_disabled():
+    tracing.disable_tracing()
+
+    with tracing.span("query") as s:
+        s.set("ignored", True)
+
+    assert s is tracing._NOOP_SPAN
+    assert tracing.current_trace_id() is None
+
+
+def test_nested_spans_share_the_trace_and_record_errors(trace_path):
+    tracing.configure_tracing(trace_path)
+
+    with tracing.span("query", stream=False) as root:
+        with tracing.span("retrieval_and_prompt"):
+            pass
+        with pytest.raises(KeyError):
+            with tracing.span("parse_completion"):
+                raise KeyError("respuesta")
+        assert tracing.current_trace_id() == root.trace_id
+
+    spans = {s["name"]: s for s in read_spans(trace_path)}
+    assert set(spans) == {"query", "retrieval_and_prompt", "parse_completion"}
+    assert {s["trace_id"] for s in spans.values()} == {root.trace_id}
+    assert spans["query"]["parent_id"] is None
+    assert spans["retrieval_and_prompt"]["parent_id"] == spans["query"]["span_id"]
+    assert spans["parse_completion"]["attrs"]["error"] == "KeyError"
+    assert spans["query"]["attrs"] == {"stream": False}
+    assert spans["query"]["duration_ms"] >= spans["retrieval_and_prompt"]["duration_ms"]
+
+
+def test_slow_sampled_requests_are_profiled(trace_path, tmp_path):
+    tracing.configure_tracing(trace_path, profile_sample_rate=1.0, slow_threshold_ms=5,
+                              profile_dir=tmp_path / "profiles")
+
+    with tracing.span("fast"):
+        pass
+    with tracing.span("slow"):
+        time.sleep(0.02)
+
+    spans = {s["name"]: s for s in read_spans(trace_path)}
+    assert "profile" not in spans["fast"]["attrs"]
+    assert Path(spans["slow"]["attrs"]["profile"]).exists()
+
+
+def test_get_completion_phases_are_traced(trace_path):
+    tracing.configure_tracing(trace_path)
+    response = MagicMock()
+    response.choices = [MagicMock(finish_reason="stop")]
+    response.choices[0].message.content = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100, total_tokens=1100)
+    client = MagicMock()
+    client.chat.completions.create.return_value = response
+    cache = MagicMock()
+    cache.get.return_value = None
+
+    with tracing.span("query"):
+        result = run_query.get_completion("system", "Horario de corte", run_query.OpenAIModels.GPT_4o_mini,
+                                          client, cache=cache)
+
+    assert result[0]["respuesta"] == "ok"
+    spans = read_spans(trace_path)
+    assert [s["name"] for s in spans] == ["cache_lookup", "api_call", "parse_completion", "cache_store", "query"]
+    assert spans[0]["attrs"] == {"hit": False}
+    assert spans[1]["attrs"] == {"model": "gpt-4o-mini"}
+
+
+def test_resilient_attempts_are_traced_under_the_calling_span(trace_path):
+    tracing.configure_tracing(trace_path)
+    response = MagicMock()
+    response.choices = [MagicMock(finish_reason="stop")]
+    response.choices[0].message.content = '{"respuesta": "ok", "confianza": 0.9, "acciones_recomendadas": []}'
+    response.usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100, total_tokens=1100)
+    client = MagicMock()
+    client.chat.completions.create.return_value = response
+
+    with tracing.span("query") as root:
+        result = run_query.get_completion("system", "Horario de corte", run_query.OpenAIModels.GPT_4o_mini,
+                                          client, resilience=ResiliencePolicy())
+
+    assert result[0]["respuesta"] == "ok"
+    spans = {s["name"]: s for s in read_spans(trace_path)}
+    assert spans["api_call"]["trace_id"] == root.trace_id
+    assert spans["api_call"]["parent_id"] == spans["query"]["span_id"]